@@ -0,0 +1,172 @@
+"""Virtualized view of the action sequence.
+
+Only the rows that fit in the window are drawn, from a small pool of
+canvas text items that is reused as the view scrolls, so a 100k step
+sequence loads as fast as a 10 step one.  Row text is taken from the
+program on demand, and the executing action is highlighted by moving a
+single rectangle.
+"""
+
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+
+class ActionListView(ttk.Frame):
+    """Scrollable list of a program's action descriptions"""
+
+    def __init__(
+        self,
+        parent,
+        height=6,
+        bg="#34495e",
+        fg="#ecf0f1",
+        select_bg="#3498db",
+        current_bg="#16a085",
+        font=("Arial", 9),
+        **kwargs,
+    ):
+        super().__init__(parent, **kwargs)
+        self.program = ()
+        self.top = 0
+        self.selected = None
+        self.current = None
+        self.fg = fg
+
+        self.font = tkfont.Font(font=font)
+        self.row_height = self.font.metrics("linespace") + 2
+
+        self.canvas = tk.Canvas(
+            self,
+            height=height * self.row_height,
+            bg=bg,
+            highlightthickness=0,
+            relief="sunken",
+            borderwidth=2,
+        )
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self._current_rect = self.canvas.create_rectangle(
+            0, 0, 0, 0, fill=current_bg, width=0, state=tk.HIDDEN
+        )
+        self._selected_rect = self.canvas.create_rectangle(
+            0, 0, 0, 0, fill=select_bg, width=0, state=tk.HIDDEN
+        )
+        self._items = []
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll_by(3))
+
+    # --- Data ---
+    def set_program(self, program):
+        self.program = program
+        self.top = 0
+        self.selected = None
+        self.current = None
+        self.redraw()
+
+    def set_current(self, index):
+        """Highlight the action at index (0-based), or None for no highlight"""
+        if index == self.current:
+            return
+        self.current = index
+        self._place_highlights()
+
+    # --- Scrolling ---
+    def _visible_rows(self):
+        height = self.canvas.winfo_height()
+        return max(1, height // self.row_height)
+
+    def _max_top(self):
+        return max(0, len(self.program) - self._visible_rows())
+
+    def _scroll_to(self, top):
+        top = min(max(0, int(top)), self._max_top())
+        if top != self.top:
+            self.top = top
+            self.redraw()
+
+    def _scroll_by(self, rows):
+        self._scroll_to(self.top + rows)
+        return "break"
+
+    def yview(self, *args):
+        """Scrollbar protocol: ('moveto', fraction) or ('scroll', n, what)"""
+        if not args:
+            return
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * len(self.program))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self._visible_rows()
+            self._scroll_by(amount)
+
+    def see(self, index):
+        visible = self._visible_rows()
+        if index < self.top:
+            self._scroll_to(index)
+        elif index >= self.top + visible:
+            self._scroll_to(index - visible + 1)
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(int(-1 * (event.delta / 120)) * 3)
+
+    def _on_click(self, event):
+        index = self.top + event.y // self.row_height
+        if index < len(self.program):
+            self.selected = index
+            self._place_highlights()
+
+    # --- Drawing ---
+    def redraw(self):
+        visible = self._visible_rows()
+        canvas = self.canvas
+
+        # Grow the pool of text items to cover the window, never per row
+        while len(self._items) < visible + 1:
+            self._items.append(
+                canvas.create_text(
+                    4, 0, anchor="nw", font=self.font, fill=self.fg, text=""
+                )
+            )
+
+        count = len(self.program)
+        for slot, item in enumerate(self._items):
+            index = self.top + slot
+            if slot <= visible and index < count:
+                canvas.itemconfigure(
+                    item, text=self.program[index].description, state=tk.NORMAL
+                )
+                canvas.coords(item, 4, slot * self.row_height + 1)
+            else:
+                canvas.itemconfigure(item, state=tk.HIDDEN)
+
+        if count:
+            first = self.top / count
+            last = min(1.0, (self.top + visible) / count)
+            self.scrollbar.set(first, last)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self._place_highlights()
+
+    def _place_rect(self, rect, index):
+        visible = self._visible_rows()
+        if index is None or not self.top <= index < self.top + visible + 1:
+            self.canvas.itemconfigure(rect, state=tk.HIDDEN)
+            return
+        y = (index - self.top) * self.row_height
+        width = self.canvas.winfo_width()
+        self.canvas.coords(rect, 0, y, width, y + self.row_height)
+        self.canvas.itemconfigure(rect, state=tk.NORMAL)
+
+    def _place_highlights(self):
+        self._place_rect(self._current_rect, self.current)
+        self._place_rect(self._selected_rect, self.selected)
+        self.canvas.tag_lower(self._selected_rect)
+        self.canvas.tag_lower(self._current_rect)
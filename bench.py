@@ -0,0 +1,610 @@
+"""Benchmarks for the sampling, matching, parsing and execution hot paths.
+
+    python bench.py                      # run everything and print a table
+    python bench.py --quick -o new.json  # smaller sizes, save the results
+    python bench.py --compare old.json   # flag changes against an earlier run
+
+Everything runs against a SyntheticCapture screen and a RecordingInput
+mouse, so no display is needed and results are comparable between
+machines of the same kind.  Results are saved as JSON, one entry per
+metric with its unit and whether higher or lower is better, together with
+the commit they were measured at.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import binseq
+import capture
+import inputs
+import recorder
+import region
+import runtrace
+import template
+import watcher
+from executor import SequenceRunner
+from flow import Flow
+from hotkeys import HotkeyDispatcher
+from monitor_log import MonitorLog
+from sequence import CLICK_TYPES, compile_actions
+from sequence_io import format_row, parse_file
+from watcher import colors_close
+
+HIGHER = "higher"
+LOWER = "lower"
+
+# A change bigger than this fraction in the wrong direction is a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+def _handlers():
+    """Click handlers like main.CLICK_HANDLERS, without importing the GUI"""
+    handlers = {}
+    for click_type in CLICK_TYPES:
+        if click_type == "move":
+            handlers[click_type] = lambda x, y: inputs.get_backend().move(x, y)
+        else:
+            handlers[click_type] = lambda x, y, button=click_type: (
+                inputs.get_backend().click(x, y, button)
+            )
+    return handlers
+
+
+def _rate(func, min_time=0.2, repeats=3):
+    """Best calls per second of func over a few timed batches"""
+    best = 0.0
+    for _ in range(repeats):
+        calls = 0
+        batch = 1
+        started = time.perf_counter()
+        while True:
+            for _ in range(batch):
+                func()
+            calls += batch
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+            batch *= 2
+        best = max(best, calls / elapsed)
+    return best
+
+
+def _best_time(func, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# --- Benchmarks ---
+# Each yields (name, value, unit, better)
+
+
+def bench_pixel_reads(quick):
+    screen = capture.SyntheticCapture(1920, 1080)
+    capture.set_backend(screen)
+    get_pixel = capture.get_backend().get_pixel
+    yield "get_pixel_color", _rate(lambda: get_pixel(960, 540)), "reads/s", HIGHER
+
+    points = [(100 + 7 * i, 200 + 3 * i) for i in range(16)]
+    get_pixels = screen.get_pixels
+    rate = _rate(lambda: get_pixels(points)) * len(points)
+    yield "get_pixels_16", rate, "reads/s", HIGHER
+
+
+def bench_colors_close(quick):
+    pairs = [((i, 255 - i, i // 2), (i + 5, 250 - i, i // 2 + 12)) for i in range(64)]
+
+    def run():
+        for a, b in pairs:
+            colors_close(a, b)
+
+    yield "colors_close", _rate(run) * len(pairs), "calls/s", HIGHER
+
+
+def bench_region_check(quick):
+    """Time to count a 200x200 region against a color and a snapshot"""
+    screen = capture.SyntheticCapture(400, 400, fill=(30, 30, 30))
+    screen.fill_rect(100, 100, 120, 200, (250, 10, 10))
+    spec = region.Region(200, 200, region.MATCH_PERCENT, 25)
+    rect = spec.rect((100, 100))
+    initial = region.snapshot(screen.grab(*rect))
+    screen.fill_rect(150, 150, 20, 20, (0, 0, 255))
+
+    matching = watcher.RegionMatch((100, 100), spec, (255, 0, 0))
+    frame = screen.grab(*rect)
+    rate = _rate(lambda: matching.check_frame(frame))
+    yield "region_match_200x200", 1e6 / rate, "us", LOWER
+
+    changed = watcher.RegionChange((100, 100), spec, initial)
+    rate = _rate(lambda: changed.check_frame(frame))
+    yield "region_change_200x200", 1e6 / rate, "us", LOWER
+
+
+def bench_template_search(quick):
+    """Time to search a 300x200 region for a 40x24 image"""
+    if template.np is None:
+        return
+    np = template.np
+    screen = capture.SyntheticCapture(640, 480, fill=(40, 40, 40))
+    for i in range(6):
+        screen.fill_rect(300 + i * 6, 200 + (i % 3) * 8, 6, 8, (200, 40 * i, 90))
+    patch = screen.grab(300, 200, 40, 24)
+    bgra = np.frombuffer(patch.data, np.uint8, count=patch.stride * patch.height)
+    bgra = bgra.reshape(patch.height, patch.stride)[:, : patch.width * 4]
+    pixels = bgra.reshape(patch.height, patch.width, 4)[:, :, 2::-1].copy()
+    spec = region.Region(300, 200)
+    condition = watcher.TemplateMatch(
+        (170, 110), spec, template.Template(pixels, "bench"), 0.9
+    )
+    frame = screen.grab(*condition.rect)
+    rate = _rate(lambda: condition.check_frame(frame))
+    yield "template_search_300x200", 1e3 / rate, "ms", LOWER
+
+
+def _detection_latencies(quick, confirm=None):
+    """Times (ms) from the watched pixel flipping to the next action's click"""
+    screen = capture.SyntheticCapture(64, 64)
+    capture.set_backend(screen)
+    recorder = inputs.RecordingInput()
+    inputs.set_backend(recorder)
+
+    flip_delay = 0.005
+    flipped_at = []
+
+    def flip():
+        screen.set_pixel(10, 10, (255, 0, 0))
+        flipped_at.append(time.perf_counter())
+
+    handlers = _handlers()
+    trigger = handlers["left"]
+
+    def click_and_schedule_flip(x, y):
+        trigger(x, y)
+        threading.Timer(flip_delay, flip).start()
+
+    handlers["left"] = click_and_schedule_flip
+    program = compile_actions(
+        [
+            (
+                "flip",
+                "left",
+                (0, 0),
+                (10, 10),
+                (255, 0, 0),
+                0,
+                None,
+                None,
+                None,
+                None,
+                confirm,
+            ),
+            ("wake", "right", (1, 1), None, None, 0, None, None, None),
+        ],
+        handlers,
+    )
+
+    runner = SequenceRunner()
+    runner.install(program)
+    runner.turbo = True
+    latencies = []
+    try:
+        for _ in range(20 if quick else 100):
+            screen.set_pixel(10, 10, (0, 0, 0))
+            recorder.clear()
+            flipped_at.clear()
+            runner.prepare()
+            runner.running = True
+            runner.run(1)
+            woke_at = recorder.clicks()[-1][0]
+            latencies.append((woke_at - flipped_at[0]) * 1000)
+    finally:
+        runner.watcher.stop()
+    return latencies
+
+
+def bench_detection_latency(quick):
+    """Time from the watched pixel flipping to the next action's click"""
+    latencies = _detection_latencies(quick)
+    yield "detection_latency_mean", statistics.mean(latencies), "ms", LOWER
+    yield "detection_latency_p50", _percentile(latencies, 0.5), "ms", LOWER
+    yield "detection_latency_p95", _percentile(latencies, 0.95), "ms", LOWER
+    yield "detection_latency_max", max(latencies), "ms", LOWER
+
+
+def bench_confirm_latency(quick):
+    """Detection latency when a match must hold on 3 samples in a row"""
+    latencies = _detection_latencies(quick, watcher.Confirm(3))
+    yield "confirm3_latency_mean", statistics.mean(latencies), "ms", LOWER
+    yield "confirm3_latency_p95", _percentile(latencies, 0.95), "ms", LOWER
+
+
+def bench_dispatch(quick):
+    """Per-action overhead of the executor with clicks recorded in memory"""
+    capture.set_backend(capture.SyntheticCapture(64, 64))
+    inputs.set_backend(inputs.RecordingInput())
+    count = 2_000 if quick else 20_000
+    rows = [
+        ("", "left", (i % 64, i % 32), None, None, 0, None, None, None)
+        for i in range(count)
+    ]
+    program = compile_actions(rows, _handlers())
+
+    for turbo in (True, False):
+        log = MonitorLog(capacity=count * 4)
+        runner = SequenceRunner(log=log.append)
+        runner.install(program)
+        runner.turbo = turbo
+
+        def run():
+            runner.prepare()
+            runner.running = True
+            runner.run(1)
+            log.drain()
+
+        elapsed = _best_time(run)
+        runner.watcher.stop()
+        name = "dispatch_turbo" if turbo else "dispatch_verbose"
+        yield name, elapsed / count * 1e9, "ns/action", LOWER
+
+
+def bench_flow(quick):
+    """Cost of a jump, and of a conditional goto's one-off check"""
+    capture.set_backend(capture.SyntheticCapture(64, 64))
+    inputs.set_backend(inputs.RecordingInput())
+    rounds = 1_000 if quick else 10_000
+    # A two action loop that jumps back rounds times, then a check that
+    # jumps back to itself rounds times
+    loop = Flow(goto="top", loop=rounds)
+    check = Flow(label="check", goto="check", loop=rounds)
+    rows = [
+        ("", "left", (1, 1), None, None, 0, None, None, None, Flow(label="top")),
+        ("", "none", (0, 0), None, None, 0, None, None, None, loop),
+        ("", "none", (0, 0), (5, 5), (0, 0, 0), 0, None, None, None, check),
+    ]
+    runner = SequenceRunner()
+    runner.turbo = True
+    for name, program in (
+        ("flow_jump", compile_actions(rows[:2], _handlers())),
+        ("flow_check", compile_actions(rows[2:], _handlers())),
+    ):
+        runner.install(program)
+
+        def run():
+            runner.prepare()
+            runner.running = True
+            runner.run(1)
+
+        yield name, _best_time(run) / (rounds + 1) * 1e9, "ns/round", LOWER
+    runner.watcher.stop()
+
+
+def bench_stop_latency(quick):
+    """Time from stop() until run() returns, stopping mid-delay and mid-wait"""
+    capture.set_backend(capture.SyntheticCapture(64, 64))
+    inputs.set_backend(inputs.RecordingInput())
+    handlers = _handlers()
+    programs = {
+        "delay": [("sleep", "left", (1, 1), None, None, 30, None, None, None)],
+        "wait": [("wait", "left", (1, 1), (5, 5), (255, 0, 0), 0, None, None, None)],
+    }
+    for name, rows in programs.items():
+        runner = SequenceRunner()
+        runner.install(compile_actions(rows, handlers))
+        runner.turbo = True
+        latencies = []
+        for _ in range(5 if quick else 20):
+            runner.prepare()
+            runner.running = True
+            worker = threading.Thread(target=runner.run, args=(1,))
+            worker.start()
+            time.sleep(0.01)
+            stopped = time.perf_counter()
+            runner.stop()
+            worker.join()
+            latencies.append((time.perf_counter() - stopped) * 1000)
+        runner.watcher.stop()
+        yield f"stop_latency_{name}", max(latencies), "ms", LOWER
+
+
+def bench_hotkey_latency(quick):
+    """Hotkey press to first click, through the dispatcher and a new run thread"""
+    capture.set_backend(capture.SyntheticCapture(64, 64))
+    inputs.set_backend(inputs.RecordingInput())
+    program = compile_actions(
+        [("click", "left", (1, 1), None, None, 0, None, None, None)], _handlers()
+    )
+    runner = SequenceRunner()
+    runner.install(program)
+    runner.turbo = True
+    finished = threading.Event()
+
+    def start(pressed_at):
+        # What AutoClickerApp.toggle_sequence does, minus the Tk bookkeeping
+        runner.prepare()
+        runner.triggered_at = pressed_at
+        runner.running = True
+        threading.Thread(
+            target=lambda: (runner.run(1), finished.set()), daemon=True
+        ).start()
+
+    callbacks = []
+    dispatcher = HotkeyDispatcher(
+        lambda hotkey, callback: callbacks.append(callback), lambda handle: None
+    )
+    dispatcher.bind("toggle", "alt+1", start)
+    for _ in range(20 if quick else 200):
+        finished.clear()
+        callbacks[0]()  # What the keyboard hook thread calls on a press
+        finished.wait(1.0)
+        runner.wait_idle(1.0)
+    dispatcher.close()
+    runner.watcher.stop()
+
+    latencies = [t * 1000 for t in runner.trigger_latencies]
+    count, dispatch_ms, _ = dispatcher.latency_summary()
+    yield "hotkey_dispatch_mean", dispatch_ms, "ms", LOWER
+    yield "hotkey_to_click_p50", _percentile(latencies, 0.5), "ms", LOWER
+    yield "hotkey_to_click_max", max(latencies), "ms", LOWER
+
+
+def bench_trace(quick):
+    """Recording cost per screen read, and how fast a recorded run replays"""
+    screen = capture.SyntheticCapture(64, 64)
+    screen.set_pixel(5, 5, (255, 0, 0))
+    capture.set_backend(screen)
+    inputs.set_backend(inputs.RecordingInput())
+    rows = [
+        ("wait", "left", (1, 1), (5, 5), (255, 0, 0), 0, None, None, None),
+        ("click", "right", (2, 2), None, None, 0, None, None, None),
+    ]
+    program = compile_actions(rows, _handlers())
+    cycles = 50 if quick else 500
+    runner = SequenceRunner()
+    runner.install(program)
+    runner.turbo = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = runtrace.TraceWriter(os.path.join(tmp, "reads" + runtrace.EXTENSION))
+        traced = runtrace.TracingCapture(screen, writer, (runner,))
+        # Read as the runner would, so the grabs are recorded
+        capture.set_reader(runner)
+        plain = _rate(lambda: screen.grab(5, 5, 1, 1))
+        rate = _rate(lambda: traced.grab(5, 5, 1, 1))
+        capture.set_reader(None)
+        writer.close()
+        yield "trace_read_overhead", (1 / rate - 1 / plain) * 1e9, "ns/read", LOWER
+
+        path = os.path.join(tmp, "run" + runtrace.EXTENSION)
+        recording = runtrace.Recording(runner, path, repeat=cycles, turbo=True)
+        runner.prepare()
+        runner.running = True
+        outcome = runner.run(cycles)
+        runner.watcher.stop()
+        recording.close(outcome=outcome, cycles=cycles, elapsed=runner.elapsed)
+        trace = runtrace.read_trace(path)
+
+    result = runtrace.replay(trace, program)
+    if not result.matches:
+        raise RuntimeError("; ".join(result.lines()))
+    rate = len(result.actions) / result.elapsed
+    yield "trace_replay", rate, "actions/s", HIGHER
+
+
+def bench_macro_simplify(quick):
+    """Reducing a recorded stream of moves and clicks to actions"""
+    count = 2_000 if quick else 20_000
+    events = []
+    for i in range(count):
+        # A wandering path with a click every 500 moves
+        t = i * 0.002
+        x = 500 + int(300 * math.sin(i / 90)) + i % 3
+        y = 400 + int(200 * math.cos(i / 140))
+        events.append((t, inputs.MOVE, x, y, None))
+        if i % 500 == 499:
+            events.append((t, inputs.DOWN, x, y, inputs.LEFT))
+            events.append((t + 0.05, inputs.UP, x, y, inputs.LEFT))
+    elapsed = _best_time(lambda: recorder.simplify(events))
+    yield "macro_simplify", elapsed / len(events) * 1e9, "ns/event", LOWER
+    rows = recorder.simplify(events)
+    yield "macro_reduction", len(events) / len(rows), "events/action", HIGHER
+
+
+def _write_csv(path, count):
+    with open(path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        for i in range(count):
+            monitor = (i % 1920, i % 1080) if i % 3 == 0 else None
+            color = (i % 256, 128, 255 - i % 256) if i % 6 == 0 else None
+            click = (i % 1920, i % 1080)
+            writer.writerow(
+                format_row(
+                    f"step {i}", "left", click, monitor, color, 0.1, None, None, None
+                )
+            )
+
+
+def bench_csv_load(quick):
+    sizes = (10, 1_000, 10_000) if quick else (10, 1_000, 100_000)
+    handlers = _handlers()
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            path = os.path.join(tmp, f"seq{count}.csv")
+            _write_csv(path, count)
+            repeats = 1 if count >= 100_000 else 3
+            elapsed = _best_time(lambda: parse_file(path, handlers), repeats)
+            yield f"csv_load_{count}", elapsed * 1000, "ms", LOWER
+
+        count = sizes[-1]
+        csv_path = os.path.join(tmp, f"seq{count}.csv")
+        binary_path = os.path.join(tmp, f"seq{count}{binseq.EXTENSION}")
+        binseq.csv_to_binary(csv_path, binary_path)
+
+        def open_binary():
+            binseq.BinarySequence(binary_path, handlers).close()
+
+        yield f"acseq_open_{count}", _best_time(open_binary) * 1000, "ms", LOWER
+
+
+def bench_log_pipeline(quick):
+    """Lines per second through append, batched drain and file archiving"""
+    count = 20_000 if quick else 200_000
+    with tempfile.TemporaryDirectory() as tmp:
+        log = MonitorLog(log_path=os.path.join(tmp, "monitor.log"))
+        try:
+            # The UI drains about every 33 ms; here every 500 lines
+            started = time.perf_counter()
+            for i in range(count):
+                log.append("🖱️ Action 1: bench - Left Click at (100, 200)")
+                if i % 500 == 499:
+                    log.archive("".join(line for line in log.drain() if line))
+            log.archive("".join(line for line in log.drain() if line))
+            elapsed = time.perf_counter() - started
+        finally:
+            log.close()
+    yield "log_pipeline", count / elapsed, "lines/s", HIGHER
+
+
+BENCHMARKS = {
+    "pixel_reads": bench_pixel_reads,
+    "colors_close": bench_colors_close,
+    "region_check": bench_region_check,
+    "template_search": bench_template_search,
+    "detection_latency": bench_detection_latency,
+    "confirm_latency": bench_confirm_latency,
+    "dispatch": bench_dispatch,
+    "flow": bench_flow,
+    "stop_latency": bench_stop_latency,
+    "hotkey_latency": bench_hotkey_latency,
+    "trace": bench_trace,
+    "macro_simplify": bench_macro_simplify,
+    "csv_load": bench_csv_load,
+    "log_pipeline": bench_log_pipeline,
+}
+
+
+# --- Running and reporting ---
+def _commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(names, quick=False, progress=None):
+    results = {}
+    old_capture = capture.set_backend(None)
+    old_input = inputs.set_backend(None)
+    try:
+        for name in names:
+            if progress:
+                progress(name)
+            for metric, value, unit, better in BENCHMARKS[name](quick):
+                results[metric] = {"value": value, "unit": unit, "better": better}
+    finally:
+        capture.set_backend(old_capture)
+        inputs.set_backend(old_input)
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return (metric, old, new, change, regressed) for metrics in both runs"""
+    rows = []
+    for metric, entry in current["results"].items():
+        old = baseline["results"].get(metric)
+        if old is None or not old["value"]:
+            continue
+        change = (entry["value"] - old["value"]) / old["value"]
+        worse = -change if entry["better"] == HIGHER else change
+        rows.append((metric, old["value"], entry["value"], change, worse > threshold))
+    return rows
+
+
+def format_results(report):
+    lines = [f"commit {report['commit'] or 'unknown'}, Python {report['python']}"]
+    for metric, entry in report["results"].items():
+        lines.append(f"  {metric:<26} {entry['value']:>14,.2f} {entry['unit']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="NAME",
+        help=f"benchmarks to run (default all): {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument("--quick", action="store_true", help="use smaller sizes")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="fractional change counted as a regression (default 0.10)",
+    )
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark {', '.join(unknown)}")
+
+    report = run_benchmarks(
+        args.names or list(BENCHMARKS),
+        quick=args.quick,
+        progress=lambda name: print(f"running {name}...", file=sys.stderr),
+    )
+    print(format_results(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        rows = compare(report, baseline, args.threshold)
+        print(f"\nagainst {baseline.get('commit') or args.compare}:")
+        for metric, old, new, change, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(
+                f"  {metric:<26} {old:>14,.2f} -> {new:>14,.2f} {change:+7.1%}{flag}"
+            )
+        if any(row[4] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+"""Compact binary sequence format.
+
+Large generated sequences (grid sweeps and the like) are stored as a fixed
+width record array followed by a string table for names and options.  The
+file is memory mapped and a record only becomes an Action when it is
+accessed, so loading a 100k step sequence costs no per-record Python
+objects.  Converting to and from the CSV layout written by save_actions is
+lossless.
+
+Layout (little endian):
+    header   magic "ACSQ", version u16, reserved u16, count u32,
+             string table offset u64
+    records  ``count`` x RECORD
+    strings  UTF-8 names and option strings referenced by the records
+"""
+
+import csv
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from flow import FlowError, resolve
+from sequence import CLICK_TYPES, ActionError, action_fields, compile_action
+from sequence_io import (
+    field_column,
+    format_options,
+    format_row,
+    iter_rows,
+    parse_options,
+    parse_row,
+    SequenceParseError,
+)
+from template import require_numpy
+
+MAGIC = b"ACSQ"
+VERSION = 1
+EXTENSION = ".acseq"
+
+HEADER = struct.Struct("<4sHHIQ")
+# name offset/len, options offset/len, click type, flags, click x/y,
+# monitor x/y, r, g, b, pad, delay
+RECORD = struct.Struct("<IHIHBBiiiiBBBxd")
+
+HAS_MONITOR = 0x01
+HAS_COLOR = 0x02
+
+_CLICK_CODES = {click_type: code for code, click_type in enumerate(CLICK_TYPES)}
+
+
+def is_binary_file(path):
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class _StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets = {}
+
+    def add(self, text):
+        if not text:
+            return 0, 0
+        raw = text.encode("utf-8")
+        offset = self._offsets.get(raw)
+        if offset is None:
+            offset = self._offsets[raw] = len(self.data)
+            self.data += raw
+        return offset, len(raw)
+
+
+def _pack(strings, base_dir, name, click_type, click, monitor, color, delay, *options):
+    options = format_options(*options, base_dir=base_dir)
+    if any("," in option for option in options):
+        raise ValueError("options stored in .acseq files cannot contain commas")
+    name_off, name_len = strings.add(name)
+    opts_off, opts_len = strings.add(",".join(options))
+    flags = (HAS_MONITOR if monitor else 0) | (HAS_COLOR if color else 0)
+    mx, my = monitor or (0, 0)
+    r, g, b = color or (0, 0, 0)
+    return RECORD.pack(
+        name_off,
+        name_len,
+        opts_off,
+        opts_len,
+        _CLICK_CODES[click_type],
+        flags,
+        click[0],
+        click[1],
+        mx,
+        my,
+        r,
+        g,
+        b,
+        delay,
+    )
+
+
+def write_rows(path, rows):
+    """Write rows of the fields compile_action takes after the index.
+
+    The file is written next to path and moved into place once complete,
+    so a sequence still mapped from path (e.g. the one being saved) keeps
+    reading the old file instead of one being truncated under it.  Template
+    and call paths are stored relative to path's directory.
+    """
+    temp_path, count = _write_temp(path, rows)
+    _replace(temp_path, path)
+    return count
+
+
+def _write_temp(path, rows):
+    """Write rows to a new file next to path, returning it and the row count"""
+    strings = _StringTable()
+    count = 0
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(EXTENSION, ".tmp-", directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+            for row in rows:
+                file.write(_pack(strings, directory, *row))
+                count += 1
+            strings_offset = file.tell()
+            file.write(strings.data)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, VERSION, 0, count, strings_offset))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, count
+
+
+def _replace(temp_path, path):
+    try:
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def write_program(path, program):
+    write_rows(path, (action_fields(action) for action in program))
+
+
+class BinarySequence:
+    """Read-only, memory mapped sequence that builds Actions on access"""
+
+    def __init__(self, path, handlers, cache_size=4096):
+        self.path = path
+        self.handlers = handlers
+        # Recently used Actions are kept so short loops stay allocation free
+        self.cache_size = cache_size
+        self._cache = {}
+        # Label positions, found on the first goto that needs them
+        self._labels = None
+
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER.size:
+                raise SequenceParseError(path, [(0, 0, "file is truncated")])
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count, strings_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SequenceParseError(path, [(0, 0, "not a version 1 .acseq file")])
+        records_end = HEADER.size + count * RECORD.size
+        if records_end > strings_offset or strings_offset > size:
+            self.close()
+            raise SequenceParseError(path, [(0, 0, "file is truncated")])
+        self._count = count
+        self._strings_offset = strings_offset
+        if self._map.find(b"template=", strings_offset) >= 0:
+            try:
+                require_numpy()
+            except ValueError:
+                self._report_templates()
+
+    def _report_templates(self):
+        """Fail on open rather than mid-run when templates can't be searched"""
+        for i in range(self._count):
+            if "template=" in self._options(i):
+                try:
+                    self.record(i)
+                except ValueError as e:
+                    self.close()
+                    column = getattr(e, "column", 1)
+                    raise SequenceParseError(self.path, [(i + 1, column, str(e))])
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("sequence index out of range")
+        action = self._cache.get(i)
+        if action is None:
+            action = self._build(i)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[i] = action
+        return action
+
+    def __add__(self, other):
+        return tuple(self) + tuple(other)
+
+    def _string(self, offset, length):
+        if not length:
+            return ""
+        start = self._strings_offset + offset
+        return self._map[start : start + length].decode("utf-8")
+
+    def record(self, i):
+        """Return the raw fields of record i without building an Action"""
+        (
+            name_off,
+            name_len,
+            opts_off,
+            opts_len,
+            click_code,
+            flags,
+            cx,
+            cy,
+            mx,
+            my,
+            r,
+            g,
+            b,
+            delay,
+        ) = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+        options = self._string(opts_off, opts_len)
+        poll = region = template = flow = confirm = None
+        if options:
+            base_dir = os.path.dirname(os.path.abspath(self.path))
+            poll, region, template, flow, confirm = parse_options(
+                options.split(","), 11, base_dir
+            )
+        return (
+            self._string(name_off, name_len),
+            CLICK_TYPES[click_code],
+            (cx, cy),
+            (mx, my) if flags & HAS_MONITOR else None,
+            (r, g, b) if flags & HAS_COLOR else None,
+            delay,
+            poll,
+            region,
+            template,
+            flow,
+            confirm,
+        )
+
+    def _options(self, i):
+        opts_off, opts_len = struct.unpack_from(
+            "<IH", self._map, HEADER.size + i * RECORD.size + 6
+        )
+        return self._string(opts_off, opts_len)
+
+    def labels(self):
+        """Map every label to its record's position, scanning the records once"""
+        if self._labels is None:
+            positions = {}
+            for i in range(self._count):
+                # Only records with a label are parsed
+                if "label=" in self._options(i):
+                    flow = self.record(i)[9]
+                    if flow is not None and flow.label:
+                        if flow.label in positions:
+                            raise FlowError(
+                                i,
+                                f"Action {i + 1}: label '{flow.label}' is "
+                                f"already used by action {positions[flow.label] + 1}",
+                                "label",
+                            )
+                        positions[flow.label] = i
+            self._labels = positions
+        return self._labels
+
+    def _build(self, i):
+        action = compile_action(i + 1, *self.record(i), handlers=self.handlers)
+        if action.flow is not None and action.flow.goto:
+            resolve(action, self.labels())
+        return action
+
+    @property
+    def closed(self):
+        return self._map is None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def csv_to_binary(csv_path, binary_path):
+    """Convert a sequence CSV to the binary format, returning the row count.
+
+    Rows are compiled as parse_file would, and an existing binary_path is
+    only replaced once the whole file converted without errors.
+    """
+    errors = []
+    labels = {}
+    gotos = []
+    handlers = {click_type: None for click_type in CLICK_TYPES}
+
+    base_dir = os.path.dirname(os.path.abspath(csv_path))
+
+    def rows(file):
+        index = 0
+        for line_number, row in iter_rows(file):
+            index += 1
+            try:
+                fields = parse_row(row, base_dir)
+                compile_action(index, *fields, handlers=handlers)
+            except ActionError as e:
+                errors.append((line_number, field_column(row, e.field), str(e)))
+                continue
+            except ValueError as e:
+                errors.append((line_number, getattr(e, "column", 1), str(e)))
+                continue
+            flow = fields[9]
+            if flow is not None:
+                if flow.label in labels:
+                    column = field_column(row, "label")
+                    errors.append(
+                        (line_number, column, f"label '{flow.label}' is already used")
+                    )
+                elif flow.label:
+                    labels[flow.label] = line_number
+                if flow.goto:
+                    gotos.append((line_number, field_column(row, "goto"), flow.goto))
+            yield fields
+
+    with open(csv_path, mode="r", newline="") as file:
+        temp_path, count = _write_temp(binary_path, rows(file))
+    errors += [
+        (line_number, column, f"no action is labelled '{goto}'")
+        for line_number, column, goto in gotos
+        if goto not in labels
+    ]
+    if errors:
+        os.remove(temp_path)
+        raise SequenceParseError(csv_path, errors)
+    _replace(temp_path, binary_path)
+    return count
+
+
+def binary_to_csv(binary_path, csv_path):
+    """Convert a binary sequence back to the 10-column CSV layout"""
+    sequence = BinarySequence(binary_path, handlers={t: None for t in CLICK_TYPES})
+    base_dir = os.path.dirname(os.path.abspath(csv_path))
+    try:
+        with open(csv_path, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            for i in range(len(sequence)):
+                writer.writerow(format_row(*sequence.record(i), base_dir=base_dir))
+        return len(sequence)
+    finally:
+        sequence.close()
+
+
+if __name__ == "__main__":
+    # python binseq.py input.csv output.acseq  (or the other way around)
+    if len(sys.argv) != 3:
+        print(f"usage: {sys.argv[0]} SOURCE DEST", file=sys.stderr)
+        sys.exit(2)
+    source, dest = sys.argv[1], sys.argv[2]
+    if is_binary_file(source):
+        count = binary_to_csv(source, dest)
+    else:
+        count = csv_to_binary(source, dest)
+    print(f"Converted {count} actions from {source} to {dest}")
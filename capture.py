@@ -0,0 +1,358 @@
+"""Screen capture backends.
+
+A backend grabs a rectangle of the screen into a reusable buffer and any
+number of pixel lookups are then served from that frame, instead of paying
+for a GetDC/GetPixel/ReleaseDC round trip on every read.
+"""
+
+import sys
+import threading
+
+# Bytes per pixel in every frame buffer (32-bit BGRA, top-down)
+BYTES_PER_PIXEL = 4
+
+
+class Frame:
+    """A captured rectangle of the screen stored as top-down BGRA rows"""
+
+    __slots__ = ("left", "top", "width", "height", "stride", "data")
+
+    def __init__(self, left, top, width, height, data, stride=None):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.stride = stride or width * BYTES_PER_PIXEL
+        self.data = data
+
+    def contains(self, x, y):
+        return (
+            self.left <= x < self.left + self.width
+            and self.top <= y < self.top + self.height
+        )
+
+    def pixel(self, x, y):
+        """Return the (r, g, b) color at absolute screen coordinates"""
+        i = (y - self.top) * self.stride + (x - self.left) * BYTES_PER_PIXEL
+        data = self.data
+        return (data[i + 2], data[i + 1], data[i])
+
+
+def bounding_box(points):
+    """Return (left, top, width, height) covering all (x, y) points"""
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    left, top = min(xs), min(ys)
+    return (left, top, max(xs) - left + 1, max(ys) - top + 1)
+
+
+# The object the calling thread reads the screen for, see set_reader
+_reader = threading.local()
+
+
+def set_reader(reader):
+    """Count the calling thread's grabs in reader.reads, until set to None.
+
+    The runner and its pixel watcher tag their threads this way, so the
+    screen reads of a run can be told from the GUI's pixel readout and
+    from other sequences reading the same backend.
+    """
+    _reader.value = reader
+
+
+def current_reader():
+    """The reader set on the calling thread, or None"""
+    return getattr(_reader, "value", None)
+
+
+class CaptureBackend:
+    """Base class for screen capture backends.
+
+    ``grab`` returns a Frame whose buffer is reused by the next grab made
+    from the same thread, so callers must read what they need before
+    grabbing again.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.grab_count = 0
+
+    def grab(self, left, top, width, height):
+        raise NotImplementedError
+
+    def count_grab(self):
+        """Count one grab, also for the calling thread's reader if it has one"""
+        self.grab_count += 1
+        reader = getattr(_reader, "value", None)
+        if reader is not None:
+            reader.reads += 1
+
+    def get_pixel(self, x, y):
+        return self.grab(x, y, 1, 1).pixel(x, y)
+
+    def get_pixels(self, points):
+        """Read several pixels with a single capture of their bounding box"""
+        if not points:
+            return []
+        frame = self.grab(*bounding_box(points))
+        return [frame.pixel(x, y) for x, y in points]
+
+    def close(self):
+        pass
+
+
+class SyntheticCapture(CaptureBackend):
+    """In-memory framebuffer, used for testing and benchmarking without a display"""
+
+    name = "synthetic"
+
+    def __init__(self, width=1920, height=1080, fill=(0, 0, 0)):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.framebuffer = bytearray(width * height * BYTES_PER_PIXEL)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.fill_rect(0, 0, width, height, fill)
+
+    def _offset(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise ValueError(
+                f"Pixel ({x}, {y}) is outside the {self.width}x{self.height} screen"
+            )
+        return (y * self.width + x) * BYTES_PER_PIXEL
+
+    def set_pixel(self, x, y, color):
+        i = self._offset(x, y)
+        r, g, b = color
+        with self._lock:
+            self.framebuffer[i : i + BYTES_PER_PIXEL] = bytes((b, g, r, 255))
+
+    def fill_rect(self, left, top, width, height, color):
+        r, g, b = color
+        row = bytes((b, g, r, 255)) * width
+        with self._lock:
+            for y in range(top, top + height):
+                i = self._offset(left, y)
+                self.framebuffer[i : i + len(row)] = row
+
+    def grab(self, left, top, width, height):
+        self._offset(left, top)
+        self._offset(left + width - 1, top + height - 1)
+        size = width * height * BYTES_PER_PIXEL
+        buf = getattr(self._local, "buffer", None)
+        if buf is None or len(buf) < size:
+            buf = self._local.buffer = bytearray(size)
+
+        # Copy row by row into the reusable buffer, like BitBlt would
+        stride = width * BYTES_PER_PIXEL
+        src_stride = self.width * BYTES_PER_PIXEL
+        with self._lock:
+            src = (top * self.width + left) * BYTES_PER_PIXEL
+            for dst in range(0, size, stride):
+                buf[dst : dst + stride] = self.framebuffer[src : src + stride]
+                src += src_stride
+            self.count_grab()
+        return Frame(left, top, width, height, buf)
+
+
+class GdiCapture(CaptureBackend):
+    """Windows backend that BitBlts the screen into a reusable DIB section"""
+
+    name = "gdi"
+
+    SRCCOPY = 0x00CC0020
+    CAPTUREBLT = 0x40000000
+    DIB_RGB_COLORS = 0
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        from ctypes import wintypes
+
+        self._ctypes = ctypes
+        self.user32 = ctypes.windll.user32
+        self.gdi32 = ctypes.windll.gdi32
+
+        class BITMAPINFOHEADER(ctypes.Structure):
+            _fields_ = [
+                ("biSize", wintypes.DWORD),
+                ("biWidth", wintypes.LONG),
+                ("biHeight", wintypes.LONG),
+                ("biPlanes", wintypes.WORD),
+                ("biBitCount", wintypes.WORD),
+                ("biCompression", wintypes.DWORD),
+                ("biSizeImage", wintypes.DWORD),
+                ("biXPelsPerMeter", wintypes.LONG),
+                ("biYPelsPerMeter", wintypes.LONG),
+                ("biClrUsed", wintypes.DWORD),
+                ("biClrImportant", wintypes.DWORD),
+            ]
+
+        class BITMAPINFO(ctypes.Structure):
+            _fields_ = [
+                ("bmiHeader", BITMAPINFOHEADER),
+                ("bmiColors", wintypes.DWORD * 3),
+            ]
+
+        self._BITMAPINFO = BITMAPINFO
+
+        # Handles are pointer sized, so declare them or they get truncated on 64-bit
+        self.user32.GetDC.restype = wintypes.HDC
+        self.user32.GetDC.argtypes = [wintypes.HWND]
+        self.user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+        self.gdi32.CreateCompatibleDC.restype = wintypes.HDC
+        self.gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+        self.gdi32.CreateDIBSection.restype = wintypes.HBITMAP
+        self.gdi32.CreateDIBSection.argtypes = [
+            wintypes.HDC,
+            ctypes.c_void_p,
+            wintypes.UINT,
+            ctypes.POINTER(ctypes.c_void_p),
+            wintypes.HANDLE,
+            wintypes.DWORD,
+        ]
+        self.gdi32.SelectObject.restype = wintypes.HGDIOBJ
+        self.gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+        self.gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+        self.gdi32.DeleteDC.argtypes = [wintypes.HDC]
+        self.gdi32.GdiFlush.restype = wintypes.BOOL
+        self.gdi32.GdiFlush.argtypes = []
+        self.gdi32.BitBlt.argtypes = [
+            wintypes.HDC,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int,
+            wintypes.HDC,
+            ctypes.c_int,
+            ctypes.c_int,
+            wintypes.DWORD,
+        ]
+
+        # GDI objects are not shared between threads, each one gets its own
+        self._local = threading.local()
+        # Bumped by close(), so other threads release their surfaces too
+        self._generation = 0
+
+    def _surface(self, width, height):
+        """Return this thread's DIB surface, grown to at least width x height"""
+        ctypes = self._ctypes
+        s = getattr(self._local, "surface", None)
+        if s is not None and s["generation"] != self._generation:
+            self._release(s)
+            s = None
+        if s is not None and s["width"] >= width and s["height"] >= height:
+            return s
+
+        if s is not None:
+            width = max(width, s["width"])
+            height = max(height, s["height"])
+            self._release(s)
+
+        screen_dc = self.user32.GetDC(None)
+        mem_dc = self.gdi32.CreateCompatibleDC(screen_dc)
+        bmi = self._BITMAPINFO()
+        bmi.bmiHeader.biSize = ctypes.sizeof(bmi.bmiHeader)
+        bmi.bmiHeader.biWidth = width
+        bmi.bmiHeader.biHeight = -height  # Negative height = top-down rows
+        bmi.bmiHeader.biPlanes = 1
+        bmi.bmiHeader.biBitCount = 32
+        bits = ctypes.c_void_p()
+        bitmap = self.gdi32.CreateDIBSection(
+            mem_dc, ctypes.byref(bmi), self.DIB_RGB_COLORS, ctypes.byref(bits), None, 0
+        )
+        if not bitmap:
+            self.gdi32.DeleteDC(mem_dc)
+            self.user32.ReleaseDC(None, screen_dc)
+            raise OSError("CreateDIBSection failed")
+        old = self.gdi32.SelectObject(mem_dc, bitmap)
+
+        s = {
+            "width": width,
+            "height": height,
+            "screen_dc": screen_dc,
+            "mem_dc": mem_dc,
+            "bitmap": bitmap,
+            "old": old,
+            "bits": bits.value,
+            "generation": self._generation,
+        }
+        self._local.surface = s
+        return s
+
+    def _release(self, s):
+        self.gdi32.SelectObject(s["mem_dc"], s["old"])
+        self.gdi32.DeleteObject(s["bitmap"])
+        self.gdi32.DeleteDC(s["mem_dc"])
+        self.user32.ReleaseDC(None, s["screen_dc"])
+        self._local.surface = None
+
+    def grab(self, left, top, width, height):
+        ctypes = self._ctypes
+        s = self._surface(width, height)
+        if not self.gdi32.BitBlt(
+            s["mem_dc"],
+            0,
+            0,
+            width,
+            height,
+            s["screen_dc"],
+            left,
+            top,
+            self.SRCCOPY | self.CAPTUREBLT,
+        ):
+            raise OSError("BitBlt failed")
+        # GDI batches calls per thread; the bits are only complete once flushed
+        self.gdi32.GdiFlush()
+        self.count_grab()
+
+        # The DIB rows are s["width"] pixels wide, which may exceed the request
+        stride = s["width"] * BYTES_PER_PIXEL
+        data = (ctypes.c_ubyte * (stride * height)).from_address(s["bits"])
+        return Frame(left, top, width, height, data, stride)
+
+    def close(self):
+        """Release the calling thread's surface.
+
+        Another thread may be reading its own surface right now, and GDI
+        objects belong to the thread that made them, so the other threads
+        release theirs on their next grab.
+        """
+        self._generation += 1
+        s = getattr(self._local, "surface", None)
+        if s is not None:
+            self._release(s)
+
+
+# --- Active backend ---
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_default_backend():
+    if sys.platform == "win32":
+        return GdiCapture()
+    import x11
+
+    if x11.available():
+        return x11.XShmCapture(x11.get_connection())
+    raise RuntimeError(f"No screen capture backend available for {sys.platform}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_default_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap in another backend (e.g. a SyntheticCapture), returning the old one"""
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, backend
+    return old
@@ -0,0 +1,413 @@
+"""Headless command line runner.
+
+    python main.py run sequence.csv --repeat 10 --quiet
+    python main.py run main.csv --background keepalive.csv
+    python main.py run sequence.csv --trace run.actrace
+    python main.py replay run.actrace --profile
+    python main.py record recorded.csv --quantum 0.1
+
+Loads a sequence with the same parser as the GUI and runs it with a
+SequenceRunner, without importing Tk or the keyboard hook; python cli.py
+takes the same commands.  Several files, or any
+--background ones, run concurrently on a SequenceEngine instead; the
+background sequences repeat until all the others have finished.  The
+exit status is 0 when every cycle completed, 1 if a file could not be
+loaded or a cycle failed, and 130 when interrupted with Ctrl+C.  A replay
+exits with 0 when it did exactly what the recorded run did, and 1 if not.
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+from engine import SequenceEngine
+from executor import COMPLETED, FAILED, SequenceRunner
+from inputs import CLICK_HANDLERS
+from metrics import export as export_metrics
+from recorder import DEFAULT_QUANTUM, DEFAULT_TOLERANCE, MacroRecorder
+from runtrace import Recording, read_trace, replay
+from scheduler import ANCHOR_END, ANCHOR_START
+from sequence import compile_actions
+from sequence_io import SequenceCache, load_program, write_file
+from watcher import PollPolicy
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INTERRUPTED = 130
+
+# Subcommands, for main.py to tell them from GUI arguments
+COMMANDS = ("run", "replay", "record")
+
+# Functions shown by replay --profile
+PROFILE_LINES = 15
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Run sequences")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run a sequence file without the GUI")
+    run.add_argument(
+        "files", nargs="+", metavar="file", help="sequence file (.csv or .acseq)"
+    )
+    run.add_argument(
+        "--background",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="also run FILE until the other sequences finish (repeatable)",
+    )
+    run.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        metavar="N",
+        help="number of cycles, 0 to repeat until interrupted (default 1)",
+    )
+    run.add_argument(
+        "--quiet",
+        action="store_true",
+        help="only print the timing summary (runs in turbo mode)",
+    )
+    run.add_argument(
+        "--turbo", action="store_true", help="turbo mode, without per-action logs"
+    )
+    run.add_argument(
+        "--delay-from",
+        choices=(ANCHOR_END, ANCHOR_START),
+        default=ANCHOR_END,
+        help="measure delays from the end or start of each action",
+    )
+    run.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="write the run's metrics to FILE as JSON when it ends",
+    )
+    run.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="record the screen reads and clicks of the run to FILE for replay",
+    )
+    run.add_argument("--hot-ms", type=float, default=200, help="hot polling (ms)")
+    run.add_argument(
+        "--max-poll-ms", type=float, default=100, help="max poll interval (ms)"
+    )
+
+    rerun = commands.add_parser(
+        "replay", help="rerun a sequence against the screen recorded in a trace"
+    )
+    rerun.add_argument("trace", help="trace file written by run --trace")
+    rerun.add_argument(
+        "--sequence",
+        metavar="FILE",
+        help="sequence to replay (default: the file the trace was recorded from)",
+    )
+    rerun.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="run delays this many times faster, 0 to skip them (default)",
+    )
+    rerun.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the replay and print the functions that took longest",
+    )
+    rerun.add_argument("--verbose", action="store_true", help="print the run's log")
+
+    record = commands.add_parser(
+        "record", help="record mouse clicks and moves into a sequence file"
+    )
+    record.add_argument("output", help="sequence file to write (.csv or .acseq)")
+    record.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="drop path points closer than this to a straight line (pixels)",
+    )
+    record.add_argument(
+        "--quantum",
+        type=float,
+        default=DEFAULT_QUANTUM,
+        help="round delays to a multiple of this many seconds",
+    )
+    record.add_argument(
+        "--clicks-only", action="store_true", help="leave out the moves between clicks"
+    )
+    return parser
+
+
+def _print_line(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def run_command(args, handlers):
+    if args.repeat < 0:
+        print("error: --repeat must be non-negative", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        policy = PollPolicy(hot_ms=args.hot_ms, max_interval_ms=args.max_poll_ms)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    # Loads the files called by call=FILE actions, each only once
+    sequence_cache = SequenceCache(handlers)
+    programs = {}
+    for path in args.files + args.background:
+        try:
+            program = load_program(path, handlers)
+        except (OSError, ValueError) as e:
+            print(f"error: failed to load {path}: {e}", file=sys.stderr)
+            return EXIT_FAILED
+        if not program:
+            print(f"error: {path} has no actions", file=sys.stderr)
+            return EXIT_FAILED
+        programs[path] = program
+    if len(programs) > 1:
+        if args.trace:
+            print("error: --trace records a single sequence", file=sys.stderr)
+            return EXIT_FAILED
+        return run_concurrently(args, programs, policy, sequence_cache)
+    program = programs[args.files[0]]
+
+    # The summary is printed below, so quiet mode discards the runner's log
+    runner = SequenceRunner(log=None if args.quiet else _print_line)
+    runner.watcher.policy = policy
+    runner.scheduler.anchor = args.delay_from
+    runner.turbo = args.quiet or args.turbo
+    runner.sequence_cache = sequence_cache
+    sequence_cache.in_use = runner.uses
+    runner.install(program)
+    recording = None
+    if args.trace:
+        try:
+            recording = Recording(
+                runner,
+                args.trace,
+                sequence=os.path.abspath(args.files[0]),
+                repeat=args.repeat,
+                turbo=runner.turbo,
+                anchor=args.delay_from,
+            )
+        except OSError as e:
+            print(f"error: failed to write {args.trace}: {e}", file=sys.stderr)
+            return EXIT_FAILED
+        except RuntimeError as e:  # No capture or input backend
+            print(f"error: {e}", file=sys.stderr)
+            return EXIT_FAILED
+    try:
+        runner.prepare()
+    except RuntimeError as e:  # No capture backend
+        if recording is not None:
+            recording.close(outcome=FAILED, cycles=0, elapsed=0.0)
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    runner.running = True
+
+    # Run on a worker thread so Ctrl+C is handled promptly by the main one
+    result = []
+    done = threading.Event()
+
+    def work():
+        try:
+            result.append(runner.run(args.repeat))
+        finally:
+            done.set()
+
+    threading.Thread(target=work, daemon=True).start()
+    # Waiting on an event rather than joining: a join interrupted by Ctrl+C
+    # can return before the thread has finished
+    try:
+        while not done.wait(0.1):
+            pass
+    except KeyboardInterrupt:
+        runner.stop()
+        done.wait()
+    finally:
+        runner.watcher.stop()
+
+    outcome = result[0] if result else FAILED
+    if recording is not None:
+        recording.close(
+            outcome=outcome, cycles=len(runner.cycle_times), elapsed=runner.elapsed
+        )
+    if args.quiet:
+        for line in runner.summary_lines():
+            print(line)
+    print_summary(runner, outcome)
+    if args.metrics:
+        try:
+            export_metrics(
+                args.metrics,
+                runner.metrics_snapshot(),
+                sequence=args.files[0],
+                actions=len(program),
+                turbo=runner.turbo,
+            )
+        except OSError as e:
+            print(f"error: failed to write {args.metrics}: {e}", file=sys.stderr)
+            return EXIT_FAILED
+    if outcome == COMPLETED:
+        return EXIT_OK
+    if outcome == FAILED:
+        return EXIT_FAILED
+    return EXIT_INTERRUPTED
+
+
+def run_concurrently(args, programs, policy, sequence_cache):
+    engine = SequenceEngine(
+        log=None if args.quiet else _print_line, anchor=args.delay_from
+    )
+    engine.watcher.policy = policy
+    engine.sequence_cache = sequence_cache
+    sequence_cache.in_use = engine.uses
+    # Files are named by their path, which also keeps duplicates apart
+    for path, program in programs.items():
+        repeat = args.repeat if path in args.files else 0
+        engine.add(path, program, repeat)
+    foreground = [engine.sequences[path] for path in dict.fromkeys(args.files)]
+
+    for path in programs:
+        engine.start(path)
+    try:
+        for seq in foreground:
+            while not seq.wait(0.1):
+                pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+    for seq in engine.sequences.values():
+        print(f"{seq.state}: {seq.name}: {seq.summary()}")
+    lane = engine.lane
+    print(
+        f"input lane: {lane.clicks} clicks, avg wait {lane.mean_queue_ms():.2f} ms, "
+        f"max {lane.max_queue_time * 1000:.2f} ms"
+    )
+    if args.metrics:
+        snapshot = {
+            "lane": {
+                "clicks": lane.clicks,
+                "mean_wait_ms": lane.mean_queue_ms(),
+                "max_wait_ms": lane.max_queue_time * 1000,
+            },
+            "sequences": [
+                {
+                    "name": seq.name,
+                    "state": seq.state,
+                    "cycles": seq.cycles,
+                    "actions": seq.actions_run,
+                    "clicks": seq.clicks,
+                    "waits": seq.waits_run,
+                    "elapsed_s": seq.elapsed,
+                    "actions_per_s": seq.actions_per_second(),
+                }
+                for seq in engine.sequences.values()
+            ],
+        }
+        try:
+            export_metrics(args.metrics, snapshot)
+        except OSError as e:
+            print(f"error: failed to write {args.metrics}: {e}", file=sys.stderr)
+            return EXIT_FAILED
+    states = [seq.state for seq in foreground]
+    if FAILED in states or any(seq.error for seq in engine.sequences.values()):
+        return EXIT_FAILED
+    if all(state == COMPLETED for state in states):
+        return EXIT_OK
+    return EXIT_INTERRUPTED
+
+
+def replay_command(args, handlers):
+    try:
+        trace = read_trace(args.trace)
+    except (OSError, ValueError) as e:
+        print(f"error: failed to read {args.trace}: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    path = args.sequence or trace.meta.get("sequence")
+    if not path:
+        print("error: the trace names no sequence, use --sequence", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        program = load_program(path, handlers)
+    except (OSError, ValueError) as e:
+        print(f"error: failed to load {path}: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    log = _print_line if args.verbose else None
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        result = replay(trace, program, args.speed, log, SequenceCache(handlers))
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    for line in result.lines():
+        print(line)
+    if profiler is not None:
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_LINES)
+    return EXIT_OK if result.matches else EXIT_FAILED
+
+
+def record_command(args, handlers):
+    recorder = MacroRecorder(tolerance=args.tolerance, quantum=args.quantum)
+    try:
+        recorder.start()
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    print("Recording, press Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    rows = recorder.stop(moves=not args.clicks_only)
+    if not rows:
+        print("error: no clicks were recorded", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        write_file(args.output, compile_actions(rows, handlers))
+    except (OSError, ValueError) as e:
+        print(f"error: failed to write {args.output}: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    print(
+        f"Recorded {recorder.raw_count} mouse events as {len(rows)} actions "
+        f"in {args.output}"
+    )
+    return EXIT_OK
+
+
+def print_summary(runner, outcome):
+    cycles = len(runner.cycle_times)
+    average = sum(runner.cycle_times) / cycles * 1000 if cycles else 0.0
+    print(
+        f"{outcome}: {cycles} cycles in {runner.elapsed:.3f} s "
+        f"(avg {average:.1f} ms), {runner.actions_run} actions, "
+        f"{runner.waits_run} waits, drift {runner.scheduler.drift * 1000:.2f} ms"
+    )
+
+
+def main(argv, handlers=CLICK_HANDLERS):
+    """Entry point; handlers maps click types to click functions"""
+    args = build_parser().parse_args(argv)
+    if args.command == "replay":
+        return replay_command(args, handlers)
+    if args.command == "record":
+        return record_command(args, handlers)
+    return run_command(args, handlers)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
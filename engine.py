@@ -0,0 +1,470 @@
+"""Several sequences running at once.
+
+A SequenceEngine runs any number of loaded sequences side by side on one
+asyncio loop thread, so a keep-alive loop can run next to a main workflow
+and dozens of sequences cost no more than one.  Monitor waits go through
+the shared pixel watcher, which resumes the waiting sequence from a
+callback; delays are loop timers.  Screen reads that would block the loop,
+the samples of a conditional goto and the setup of a wait, run on the
+loop's default executor.  Every click goes through one InputLane that
+performs them one at a time in the order they were requested, so the
+actions of different sequences never interleave.  A SequenceRunner given
+the lane clicks through it from its own thread, so the main run doesn't
+interleave with them either.
+"""
+
+import asyncio
+import threading
+import time
+
+from executor import COMPLETED, FAILED, STOPPED, check_action, watch_action
+from flow import MAX_CALL_DEPTH, next_position
+from scheduler import ANCHOR_END, ANCHOR_START
+from template import ANCHOR_MATCH
+from watcher import PixelWatcher
+
+# States of a SequenceTask besides the executor outcomes
+IDLE = "idle"
+RUNNING = "running"
+
+
+def _no_log(message):
+    pass
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class InputLane:
+    """Performs the clicks of all sequences one at a time, first come first served.
+
+    Engine sequences queue on the loop with click(); a runner on another
+    thread calls click_now(), which takes turns with them.
+    """
+
+    def __init__(self, min_gap=0.0):
+        # Shortest time between two clicks, for apps that drop rapid input
+        self.min_gap = min_gap
+        self.clicks = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self._queue = None
+        self._task = None
+        self._last_click = 0.0
+        # Held while a click is performed, from whichever thread
+        self._input_lock = threading.Lock()
+
+    def start(self):
+        """Start serving clicks; call on the engine's loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._serve())
+
+    async def click(self, handler, x, y):
+        """Queue handler(x, y) and return the seconds it waited for the lane"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((handler, x, y, time.perf_counter(), future))
+        return await future
+
+    def click_now(self, handler, x, y):
+        """Perform handler(x, y) from outside the engine's loop.
+
+        Blocks while another click is being performed and returns the
+        seconds it waited for the lane.
+        """
+        queued_at = time.perf_counter()
+        with self._input_lock:
+            gap = self._gap()
+            if gap > 0:
+                time.sleep(gap)
+            return self._perform(handler, x, y, queued_at)
+
+    def _gap(self):
+        """Seconds until min_gap has passed since the last click"""
+        if not self.min_gap:
+            return 0.0
+        return self._last_click + self.min_gap - time.perf_counter()
+
+    def _perform(self, handler, x, y, queued_at):
+        # Called with _input_lock held
+        started = time.perf_counter()
+        handler(x, y)
+        self._last_click = time.perf_counter()
+        waited = started - queued_at
+        self.clicks += 1
+        self.queue_time += waited
+        self.max_queue_time = max(self.max_queue_time, waited)
+        return waited
+
+    async def _serve(self):
+        queue = self._queue
+        lock = self._input_lock
+        while True:
+            handler, x, y, queued_at, future = await queue.get()
+            while True:
+                gap = self._gap()
+                if gap > 0:
+                    await asyncio.sleep(gap)
+                    continue
+                # The sequence may have been stopped while its click was queued
+                if future.cancelled():
+                    break
+                with lock:
+                    # A runner may have clicked since, pushing the gap out again
+                    if self._gap() > 0:
+                        continue
+                    try:
+                        waited = self._perform(handler, x, y, queued_at)
+                    except Exception as e:
+                        future.set_exception(e)
+                        break
+                future.set_result(waited)
+                break
+
+    def mean_queue_ms(self):
+        return self.queue_time / self.clicks * 1000 if self.clicks else 0.0
+
+
+class SequenceTask:
+    """One sequence of an engine, with its own state and counters"""
+
+    def __init__(self, name, program, repeat=0):
+        self.name = name
+        self.program = program
+        self.repeat = repeat
+        self.state = IDLE
+        self.error = None
+        self.current_action_index = None
+        self.reset()
+        self._task = None
+        self._finished = threading.Event()
+
+    def reset(self):
+        self.cycles = 0
+        self.actions_run = 0
+        # Actions that pressed a button, unlike moves and "none" actions
+        self.clicks = 0
+        self.waits_run = 0
+        self.lane_wait = 0.0
+        self.started_at = None
+        self.elapsed = 0.0
+        self.stop_requested_at = None
+        self.stop_latency = None
+
+    @property
+    def running(self):
+        return self.state == RUNNING
+
+    def run_time(self):
+        if self.state == RUNNING and self.started_at is not None:
+            return time.perf_counter() - self.started_at
+        return self.elapsed
+
+    def actions_per_second(self):
+        run_time = self.run_time()
+        return self.actions_run / run_time if run_time > 0 else 0.0
+
+    def summary(self):
+        cycles = f"{self.cycles}/{self.repeat}" if self.repeat else f"{self.cycles}"
+        lane_ms = self.lane_wait / self.actions_run * 1000 if self.actions_run else 0.0
+        text = (
+            f"{cycles} cycles, {self.actions_run} actions "
+            f"({self.actions_per_second():.1f}/s), {self.waits_run} waits, "
+            f"lane wait {lane_ms:.2f} ms"
+        )
+        if self.stop_latency is not None:
+            text += f", stopped in {self.stop_latency * 1000:.2f} ms"
+        return text
+
+    def wait(self, timeout=None):
+        """Block until the sequence has finished, return False on timeout"""
+        return self._finished.wait(timeout)
+
+
+class SequenceEngine:
+    """Runs loaded sequences concurrently on one event loop thread"""
+
+    def __init__(self, log=None, watcher=None, lane=None, anchor=ANCHOR_END):
+        if anchor not in (ANCHOR_END, ANCHOR_START):
+            raise ValueError(f"Unknown delay anchor '{anchor}'")
+        self.log = log or _no_log
+        self.watcher = watcher or PixelWatcher()
+        self.lane = lane or InputLane()
+        self.anchor = anchor
+        self.sequences = {}
+        # SequenceCache the call=FILE of an action is loaded from
+        self.sequence_cache = None
+        self._called = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    # --- Loop thread ---
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.call_soon(self.lane.start)
+                self._thread = threading.Thread(target=loop.run_forever, daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def close(self, timeout=1.0):
+        """Stop every sequence and the loop thread"""
+        for seq in self.stop_all():
+            seq.wait(timeout)
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(self._shutdown, loop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                loop.close()
+        self.watcher.stop()
+
+    # --- Sequences ---
+    def add(self, name, program, repeat=0):
+        """Add or replace a sequence; repeat 0 runs it until stopped"""
+        if repeat < 0:
+            raise ValueError("repeat count must be non-negative")
+        with self._lock:
+            old = self.sequences.get(name)
+            if old is not None and old.running:
+                raise ValueError(f"sequence '{name}' is running")
+            seq = self.sequences[name] = SequenceTask(name, program, repeat)
+        if old is not None and self.sequence_cache is not None:
+            self.sequence_cache.release()
+        return seq
+
+    def uses(self, program):
+        """Whether any sequence has program loaded or has called it"""
+        with self._lock:
+            loaded = [seq.program for seq in self.sequences.values()]
+        loaded += self._called.values()
+        return any(other is program for other in loaded)
+
+    def remove(self, name):
+        seq = self._get(name)
+        if seq.running:
+            raise ValueError(f"sequence '{name}' is running")
+        with self._lock:
+            del self.sequences[name]
+        if self.sequence_cache is not None:
+            self.sequence_cache.release()
+
+    def _get(self, name):
+        try:
+            return self.sequences[name]
+        except KeyError:
+            raise ValueError(f"no sequence named '{name}'") from None
+
+    def start(self, name):
+        """Start a sequence, returning False if it is already running"""
+        seq = self._get(name)
+        with self._lock:
+            if seq.running:
+                return False
+            if not seq.program:
+                raise ValueError(f"sequence '{name}' has no actions")
+            seq.reset()
+            seq.error = None
+            seq.state = RUNNING
+            seq._finished.clear()
+        self._ensure_loop().call_soon_threadsafe(self._spawn, seq)
+        return True
+
+    def stop(self, name):
+        """Stop a sequence; its current wait or delay ends straight away"""
+        seq = self._get(name)
+        if not seq.running:
+            return False
+        seq.stop_requested_at = time.perf_counter()
+        # _spawn skips a sequence stopped before it, see there
+        self._ensure_loop().call_soon_threadsafe(self._cancel, seq)
+        return True
+
+    def stop_all(self):
+        """Stop every running sequence and return them"""
+        with self._lock:
+            running = [seq for seq in self.sequences.values() if seq.running]
+        for seq in running:
+            self.stop(seq.name)
+        return running
+
+    # --- Execution, on the loop thread ---
+    def _shutdown(self, loop):
+        if self.lane._task is not None:
+            self.lane._task.cancel()
+        # Stops once the lane task has unwound
+        loop.call_soon(loop.stop)
+
+    def _spawn(self, seq):
+        if seq.stop_requested_at is not None:
+            # Stopped before it got here, e.g. on the loop close() replaced
+            seq.state = STOPPED
+            seq._finished.set()
+            return
+        seq._task = asyncio.get_running_loop().create_task(self._run(seq))
+        seq._task.add_done_callback(lambda task: self._finish(seq))
+
+    def _cancel(self, seq):
+        task = seq._task
+        if task is None:
+            return
+        if task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+        elif seq.state == RUNNING:
+            # Left on a loop that close() ended, which never resumes it
+            self._finish(seq)
+
+    def _finish(self, seq):
+        # A sequence cancelled before it started never ran its own cleanup
+        if seq.state == RUNNING:
+            seq.state = STOPPED
+        seq._finished.set()
+
+    async def _run(self, seq):
+        log = self.log
+        name = seq.name
+        seq.started_at = time.perf_counter()
+        times = "until stopped" if seq.repeat == 0 else f"{seq.repeat} times"
+        log(f"▶️ [{name}] Started, {len(seq.program)} actions {times}")
+        try:
+            while seq.repeat == 0 or seq.cycles < seq.repeat:
+                await self._run_program(seq, seq.program)
+                seq.cycles += 1
+            seq.state = COMPLETED
+        except asyncio.CancelledError:
+            seq.state = STOPPED
+        except Exception as e:
+            seq.state = FAILED
+            seq.error = e
+            log(f"❌ [{name}] Error: {e}")
+        finally:
+            finished = time.perf_counter()
+            seq.elapsed = finished - seq.started_at
+            seq.current_action_index = None
+            if seq.state == STOPPED and seq.stop_requested_at is not None:
+                seq.stop_latency = finished - seq.stop_requested_at
+        log(f"⏹️ [{name}] {seq.state.capitalize()}: {seq.summary()}")
+        return seq.state
+
+    async def _run_program(self, seq, program, depth=0):
+        """Run a program once, following its jumps and sequence calls"""
+        loops = {}
+        action_start = None
+        position = 0
+        end = len(program)
+        while position < end:
+            action = program[position]
+            if depth == 0:
+                seq.current_action_index = position
+            action_start, position = await self._run_action(
+                seq, action, action_start, position, loops, depth
+            )
+
+    async def _run_action(self, seq, action, due, position, loops, depth):
+        """Run one action.
+
+        Returns when the next one is due in "start" mode, and its position.
+        """
+        start = time.perf_counter()
+        if self.anchor == ANCHOR_START and due is not None and start - due < 1.0:
+            start = due
+
+        anchored = action.template and action.template.anchor == ANCHOR_MATCH
+        if not anchored:
+            await self._click(seq, action, *action.click_pos)
+        if action.checks:
+            # With confirm=K this samples K times, sleeping in between
+            policy = self.watcher.policy
+            taken = (await self._off_loop(check_action, action, policy))[0]
+        elif action.monitor_pos:
+            condition = await self._wait(seq, await self._watch(action))
+            if anchored:
+                x, y = condition.match
+                dx, dy = action.click_pos
+                await self._click(seq, action, x + dx, y + dy)
+
+        flow = action.flow
+        if flow is None:
+            position += 1
+        else:
+            if flow.call:
+                await self._call(seq, flow, depth)
+            if not action.checks:
+                taken = action.jump is not None
+            position = next_position(action, position, taken, loops)
+
+        if action.delay > 0:
+            if self.anchor == ANCHOR_START:
+                deadline = start + action.delay
+            else:
+                deadline = time.perf_counter() + action.delay
+            await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+            return deadline, position
+        return None, position
+
+    async def _call(self, seq, flow, depth):
+        """Run the sequence file an action calls as part of seq"""
+        if depth >= MAX_CALL_DEPTH:
+            raise ValueError(f"sequence calls nested more than {MAX_CALL_DEPTH} deep")
+        if self.sequence_cache is None:
+            raise ValueError("calling a sequence file needs a sequence cache")
+        path = flow.resolved_call()
+        program, _ = self.sequence_cache.load(path)
+        self._called[path] = program
+        await self._run_program(seq, program, depth + 1)
+
+    async def _click(self, seq, action, x, y):
+        seq.lane_wait += await self.lane.click(action.click, x, y)
+        seq.actions_run += 1
+        if action.sends_click:
+            seq.clicks += 1
+
+    async def _off_loop(self, fn, *args):
+        """Run a blocking fn(*args) on the default executor and return its result"""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _watch(self, action):
+        """Register the wait of an action from the executor.
+
+        A change wait reads its initial pixel and a template wait loads the
+        image.  When the sequence is stopped meanwhile, the condition is
+        cancelled once it has been registered.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, watch_action, self.watcher, action)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(self._cancel_watch)
+            raise
+
+    def _cancel_watch(self, future):
+        if future.exception() is None:
+            self.watcher.cancel(future.result())
+
+    async def _wait(self, seq, condition):
+        """Wait for a watcher condition without blocking the loop"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def done(_):
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:  # The loop was closed meanwhile
+                pass
+
+        condition.add_done_callback(done)
+        try:
+            await future
+        finally:
+            if not condition.matched:
+                self.watcher.cancel(condition)
+        if condition.error is not None:
+            raise condition.error
+        seq.waits_run += 1
+        return condition
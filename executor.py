@@ -0,0 +1,675 @@
+"""Sequence execution, independent of any user interface.
+
+SequenceRunner drives a compiled program for a number of cycles, using the
+pixel watcher for monitor conditions and the deadline scheduler for
+delays.  The Tk app and the headless command line runner both use it; all
+they supply is a function to send log lines to.
+"""
+
+import os
+import threading
+import time
+
+import capture
+import region
+from flow import MAX_CALL_DEPTH, next_position
+from metrics import RunMetrics
+from scheduler import DeadlineScheduler
+from template import ANCHOR_MATCH
+from watcher import (
+    DEFAULT_POLL_POLICY,
+    ColorMatch,
+    PixelWatcher,
+    RegionMatch,
+    TemplateMatch,
+    colors_close,
+)
+
+# Outcomes of SequenceRunner.run
+COMPLETED = "completed"
+STOPPED = "stopped"
+FAILED = "failed"
+
+
+def _no_log(message):
+    pass
+
+
+def _no_record(index, duration, delay):
+    pass
+
+
+def watch_region(watcher, action):
+    """Register the wait of a region action with the watcher"""
+    spec = action.region
+    if action.target_color:
+        return watcher.watch_region(
+            action.monitor_pos,
+            spec,
+            action.target_color,
+            policy=action.policy_for(watcher.policy),
+            confirm=action.confirm,
+        )
+    # Snapshot the region now, so a change before the first sample counts
+    frame = capture.get_backend().grab(*spec.rect(action.monitor_pos))
+    return watcher.watch_region_change(
+        action.monitor_pos,
+        spec,
+        region.snapshot(frame),
+        policy=action.policy_for(watcher.policy),
+        confirm=action.confirm,
+    )
+
+
+def watch_template(watcher, action):
+    """Register the image search of a template action with the watcher"""
+    spec = action.template
+    return watcher.watch_template(
+        action.monitor_pos,
+        action.region,
+        spec.load(),
+        spec.threshold,
+        policy=action.policy_for(watcher.policy),
+        confirm=action.confirm,
+    )
+
+
+def watch_action(watcher, action):
+    """Register the monitor wait of any action that has one"""
+    if action.template:
+        return watch_template(watcher, action)
+    if action.region:
+        return watch_region(watcher, action)
+    if action.target_color:
+        return watcher.watch_color(
+            action.monitor_pos,
+            action.target_color,
+            policy=action.policy_for(watcher.policy),
+            confirm=action.confirm,
+        )
+    initial = capture.get_backend().get_pixel(*action.monitor_pos)
+    return watcher.watch_change(
+        action.monitor_pos,
+        initial,
+        policy=action.policy_for(watcher.policy),
+        confirm=action.confirm,
+    )
+
+
+def check_action(action, base_policy=DEFAULT_POLL_POLICY):
+    """Sample the condition of a conditional goto.
+
+    Returns (holds, value), value being the pixel color, the fraction of
+    region pixels matching or the best template score.  With confirm=K the
+    condition must hold on K samples in a row, taken at the hot interval
+    of base_policy with the action's overrides.
+    """
+    backend = capture.get_backend()
+    if action.confirm is None and not action.region:
+        color = backend.get_pixel(*action.monitor_pos)
+        return colors_close(color, action.target_color), color
+    if action.template:
+        spec = action.template
+        condition = TemplateMatch(
+            action.monitor_pos, action.region, spec.load(), spec.threshold
+        )
+    elif action.region:
+        condition = RegionMatch(action.monitor_pos, action.region, action.target_color)
+    else:
+        condition = ColorMatch(action.monitor_pos, action.target_color)
+    if action.confirm is not None:
+        condition.configure(action.confirm)
+    interval = action.policy_for(base_policy).hot_interval_ms / 1000
+    while True:
+        if condition.rect is None:
+            value = backend.get_pixel(*condition.point)
+            holds = condition.check(value)
+        else:
+            holds, value = condition.check_frame(backend.grab(*condition.rect))
+        streak = condition.streak
+        if streak is None:
+            return holds, value
+        now = time.perf_counter()
+        if condition.confirmed(holds, value, now):
+            return True, value
+        # Broken, or complete but spread over more than the window
+        if not streak or len(streak) == streak.maxlen:
+            return False, value
+        condition.last_sample_at = now
+        time.sleep(interval)
+
+
+class SequenceRunner:
+    """Runs a compiled program; reloads are swapped in between cycles"""
+
+    def __init__(self, log=None, watcher=None, scheduler=None):
+        self.log = log or _no_log
+        self.watcher = watcher or PixelWatcher()
+        self.scheduler = scheduler or DeadlineScheduler()
+        self.program = ()
+        self.pending_program = None
+        self._program_lock = threading.Lock()
+        # Called with the new program whenever one is swapped in
+        self.on_program_changed = None
+
+        self.running = False
+        self.turbo = False
+        # Set by stop() to end the current delay, and cleared by prepare()
+        self.cancel = threading.Event()
+        # Clear from prepare() until run() has returned
+        self.idle = threading.Event()
+        self.idle.set()
+        self.current_condition = None
+        self.stop_requested_at = None
+        self.stop_latencies = []
+        # perf_counter of the hotkey press that started this run, until the
+        # first click is made
+        self.triggered_at = None
+        self.trigger_latencies = []
+        self.trigger_target_ms = None
+        # Receives action starts and wait outcomes, see runtrace.TraceWriter
+        self.trace = None
+        self.current_action_index = None
+        self.actions_run = 0
+        # Actions that pressed a button, unlike moves and "none" actions
+        self.clicks_run = 0
+        self.waits_run = 0
+        # Screen reads made by the runner thread, see capture.set_reader
+        self.reads = 0
+        self.cycle_times = []
+        self.elapsed = 0.0
+        self.metrics = RunMetrics()
+        # SequenceCache the call=FILE of an action is loaded from
+        self.sequence_cache = None
+        # engine.InputLane shared with concurrent sequences, None to click
+        # directly
+        self.lane = None
+        # Called programs bound to the current policy, by path
+        self._called = {}
+
+    # --- Program management ---
+    def install(self, program):
+        """Make program current, or queue it for the next cycle while running.
+
+        Returns True if it was installed immediately.
+        """
+        with self._program_lock:
+            if self.running:
+                self.pending_program = program
+                return False
+            self.pending_program = None
+            self.program = program
+        self.release_programs()
+        return True
+
+    def latest_program(self):
+        """The program queued for the next cycle if there is one, else the current.
+
+        Edits start from this one, so they don't drop a queued reload.
+        """
+        with self._program_lock:
+            pending = self.pending_program
+            return self.program if pending is None else pending
+
+    def swap_pending_program(self):
+        """Install a program queued by install, between cycles"""
+        with self._program_lock:
+            program, self.pending_program = self.pending_program, None
+            if program is None:
+                return False
+            self.program = program
+        self.release_programs()
+        if self.on_program_changed:
+            self.on_program_changed(program)
+        return True
+
+    def uses(self, program):
+        """Whether program is installed, queued or being called"""
+        return (
+            program is self.program
+            or program is self.pending_program
+            or any(called is program for called in self._called.values())
+        )
+
+    def release_programs(self):
+        """Let the sequence cache close binary sequences swapped out here"""
+        if self.sequence_cache is not None:
+            self.sequence_cache.release()
+
+    # --- Running ---
+    def prepare(self):
+        """Reset per-run state; call before run() with running set"""
+        self.idle.clear()
+        self.cancel.clear()
+        self.stop_requested_at = None
+        self.triggered_at = None
+        self.scheduler.reset()
+        self.watcher.reset_stats()
+        self.actions_run = 0
+        self.clicks_run = 0
+        self.waits_run = 0
+        self.cycle_times = []
+        self.elapsed = 0.0
+        self._called = {}
+        self.metrics.start(self.program, self.run_reads())
+
+    def stop(self):
+        """Stop running; the current wait or delay ends straight away"""
+        if self.running:
+            self.stop_requested_at = time.perf_counter()
+        self.running = False
+        self.cancel.set()
+        condition = self.current_condition
+        if condition is not None:
+            condition.event.set()
+
+    def wait_condition(self, condition, on_timeout=None):
+        """Block until condition holds or stop() is called.
+
+        on_timeout is called every second while still waiting.
+        """
+        # Published before running is checked, so stop() always sees it
+        self.current_condition = condition
+        while self.running and not condition.wait(1.0):
+            if on_timeout is not None:
+                on_timeout()
+        self.current_condition = None
+        if condition.error is not None:
+            raise condition.error
+        if condition.matched:
+            self.metrics.record_wait(
+                self.current_action_index + 1,
+                condition.matched_at - condition.registered_at,
+            )
+        if self.trace is not None:
+            ended = condition.matched_at or time.perf_counter()
+            self.trace.wait(
+                self.current_action_index + 1,
+                condition.matched,
+                ended - condition.registered_at,
+            )
+
+    def run(self, repeat_count):
+        """Run the program repeat_count times (0 = until stopped)"""
+        log = self.log
+        turbo = self.turbo
+        execute = self.execute_actions_turbo if turbo else self.execute_actions
+        cycle_times = self.cycle_times
+        outcome = STOPPED
+        run_started = time.perf_counter()
+        capture.set_reader(self)
+        try:
+            cycle = 1
+            while self.running and (repeat_count == 0 or cycle <= repeat_count):
+                if self.swap_pending_program():
+                    log("🔁 Switched to the reloaded sequence")
+                if not turbo:
+                    if repeat_count == 0:
+                        log(f"🔄 Starting infinite cycle #{cycle}")
+                    else:
+                        log(f"🔄 Starting cycle {cycle}/{repeat_count}")
+                started = time.perf_counter()
+                execute()
+                cycle_times.append(time.perf_counter() - started)
+                self.metrics.cycles = len(cycle_times)
+                if not turbo:
+                    self.log_cycle_timing(cycle)
+                cycle += 1
+
+            if self.running:  # Completed normally
+                outcome = COMPLETED
+                log("✅ Action sequence completed successfully!")
+        except Exception as e:
+            outcome = FAILED
+            log(f"❌ Error during execution: {e}")
+        capture.set_reader(None)
+
+        finished = time.perf_counter()
+        self.elapsed = finished - run_started
+        self.metrics.finish(outcome)
+        self.current_action_index = None
+        if outcome == STOPPED and self.stop_requested_at is not None:
+            self.stop_latencies.append(finished - self.stop_requested_at)
+        for line in self.summary_lines():
+            log(line)
+        self.idle.set()
+        return outcome
+
+    def run_reads(self):
+        """Screen reads made by the runner and watcher threads, not the GUI's"""
+        return self.reads + self.watcher.reads
+
+    def metrics_snapshot(self, top=None):
+        """The run's metrics, see metrics.RunMetrics.snapshot"""
+        return self.metrics.snapshot(
+            self.clicks_run, self.scheduler.drift, top, self.run_reads()
+        )
+
+    def note_first_click(self):
+        """Record how long after the triggering hotkey the first click came"""
+        latency = time.perf_counter() - self.triggered_at
+        self.triggered_at = None
+        self.trigger_latencies.append(latency)
+        target = self.trigger_target_ms
+        over = (
+            f" ⚠️ over the {target:g} ms target"
+            if target is not None and latency * 1000 > target
+            else ""
+        )
+        self.log(f"⌨️ First click {latency * 1000:.2f} ms after the hotkey{over}")
+
+    def wait_idle(self, timeout=None):
+        """Wait for a stopped run to unwind, return False on timeout"""
+        return self.idle.wait(timeout)
+
+    def stop_latency_summary(self):
+        """Return (count, last_ms, max_ms) of the time stops took to take effect"""
+        latencies = self.stop_latencies
+        if not latencies:
+            return (0, 0.0, 0.0)
+        return (len(latencies), latencies[-1] * 1000, max(latencies) * 1000)
+
+    def summary_lines(self):
+        lines = []
+        cycle_times = self.cycle_times
+        if cycle_times:
+            mode = "turbo" if self.turbo else "verbose"
+            lines.append(
+                f"⏱️ {len(cycle_times)} cycles of {len(self.program)} actions, avg cycle {sum(cycle_times) / len(cycle_times) * 1000:.1f} ms ({mode})"
+            )
+        if self.turbo:
+            lines.append(
+                f"⚡ {self.actions_run} actions, {self.waits_run} waits, cumulative drift {self.scheduler.drift * 1000:.2f} ms"
+            )
+        count, mean_ms, max_ms = self.watcher.latency_summary()
+        if count:
+            lines.append(
+                f"📈 Detection latency over {count} waits: avg {mean_ms:.1f} ms, max {max_ms:.1f} ms"
+            )
+        if self.trigger_latencies:
+            latencies = self.trigger_latencies
+            lines.append(
+                f"⌨️ Hotkey to first click: last {latencies[-1] * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms over {len(latencies)} starts"
+            )
+        if self.stop_requested_at is not None and self.stop_latencies:
+            count, last_ms, max_ms = self.stop_latency_summary()
+            lines.append(
+                f"🛑 Stopped {last_ms:.2f} ms after the request (max {max_ms:.2f} ms over {count} stops)"
+            )
+        return lines
+
+    def log_cycle_timing(self, cycle):
+        scheduler = self.scheduler
+        if scheduler.cycle_errors:
+            self.log(
+                f"📐 Cycle {cycle} jitter {scheduler.cycle_jitter() * 1000:.2f} ms, cumulative drift {scheduler.drift * 1000:.2f} ms"
+            )
+
+    def click(self, action, x, y):
+        """Perform an action's click, through the input lane if there is one"""
+        if self.lane is None:
+            action.click(x, y)
+        else:
+            self.lane.click_now(action.click, x, y)
+        self.actions_run += 1
+        if action.sends_click:
+            self.clicks_run += 1
+        if self.triggered_at is not None:
+            self.note_first_click()
+
+    def watch_region(self, action):
+        return watch_region(self.watcher, action)
+
+    def watch_template(self, action):
+        return watch_template(self.watcher, action)
+
+    def run_template_action(self, action, log=None):
+        """Click and search for a template; anchored clicks wait for the match"""
+        anchored = action.template.anchor == ANCHOR_MATCH
+        if not anchored:
+            self.click(action, *action.click_pos)
+
+        if log:
+            log(action.monitor_message)
+        condition = self.watch_template(action)
+        if log:
+            self.wait_condition(
+                condition,
+                lambda: log(action.waiting_template.format(condition.last_value or 0)),
+            )
+        else:
+            self.wait_condition(condition)
+        self.waits_run += 1
+        if not condition.matched:
+            self.watcher.cancel(condition)
+            return
+
+        x, y = condition.match
+        if log:
+            log(
+                f"🎯 Template {action.template.name} found at ({x}, {y}), score {condition.last_value:.2f} (within {condition.detection_latency * 1000:.1f} ms, {condition.mean_search_ms():.1f} ms per search)"
+            )
+        if anchored:
+            dx, dy = action.click_pos
+            self.click(action, x + dx, y + dy)
+
+    def call_sequence(self, flow, depth, log=None):
+        """Run the sequence file an action calls, then return to the caller"""
+        if depth >= MAX_CALL_DEPTH:
+            raise ValueError(f"sequence calls nested more than {MAX_CALL_DEPTH} deep")
+        if self.sequence_cache is None:
+            raise ValueError("calling a sequence file needs a sequence cache")
+        path = flow.resolved_call()
+        program, _ = self.sequence_cache.load(path)
+        self._called[path] = program
+        if log:
+            log(f"📞 Calling {os.path.basename(path)} ({len(program)} actions)")
+        if self.turbo:
+            self.execute_actions_turbo(program, depth + 1)
+        else:
+            self.execute_actions(program, depth + 1)
+        if log:
+            log(f"📞 Returned from {os.path.basename(path)}")
+
+    def execute_actions_turbo(self, program=None, depth=0):
+        """Same as execute_actions, without any logging or extra screen reads"""
+        watcher = self.watcher
+        scheduler = self.scheduler
+        get_pixel = capture.get_backend().get_pixel
+        record_action = self.metrics.record_action if depth == 0 else _no_record
+        trace = self.trace
+        if program is None:
+            program = self.program
+            scheduler.begin_cycle()
+        waits_run = 0
+        loops = {}
+        position = 0
+        end = len(program)
+
+        while position < end:
+            action = program[position]
+            if not self.running:
+                break
+            if trace is not None and not trace.action(action.index):
+                break
+
+            started = scheduler.start_action()
+            if depth == 0:
+                self.current_action_index = position
+            if action.template and not action.checks:
+                self.run_template_action(action)
+            else:
+                self.click(action, *action.click_pos)
+
+            monitor_pos = action.monitor_pos
+            if action.checks:
+                taken = check_action(action, watcher.policy)[0]
+            elif monitor_pos and not action.template:
+                if action.region:
+                    condition = self.watch_region(action)
+                elif action.target_color:
+                    condition = watcher.watch_color(
+                        monitor_pos,
+                        action.target_color,
+                        policy=action.policy_for(watcher.policy),
+                        confirm=action.confirm,
+                    )
+                else:
+                    condition = watcher.watch_change(
+                        monitor_pos,
+                        get_pixel(*monitor_pos),
+                        policy=action.policy_for(watcher.policy),
+                        confirm=action.confirm,
+                    )
+                self.wait_condition(condition)
+                if not condition.matched:
+                    watcher.cancel(condition)
+                waits_run += 1
+
+            flow = action.flow
+            if flow is None:
+                position += 1
+            else:
+                if flow.call and self.running:
+                    self.call_sequence(flow, depth)
+                if not action.checks:
+                    taken = action.jump is not None
+                position = next_position(action, position, taken, loops)
+            # The delay is recorded apart from the action's own time
+            finished = time.perf_counter()
+            delayed = 0.0
+            if action.delay > 0 and self.running:
+                scheduler.wait(action.delay, self.cancel)
+                delayed = time.perf_counter() - finished
+            record_action(action.index, finished - started, delayed)
+
+        self.waits_run += waits_run
+
+    def execute_actions(self, program=None, depth=0):
+        log = self.log
+        watcher = self.watcher
+        scheduler = self.scheduler
+        get_pixel = capture.get_backend().get_pixel
+        record_action = self.metrics.record_action if depth == 0 else _no_record
+        trace = self.trace
+        if program is None:
+            program = self.program
+            scheduler.begin_cycle()
+        loops = {}
+        position = 0
+        end = len(program)
+
+        while position < end:
+            action = program[position]
+            if not self.running:
+                break
+            if trace is not None and not trace.action(action.index):
+                break
+
+            started = scheduler.start_action()
+            if depth == 0:
+                self.current_action_index = position
+
+            log(action.start_message)
+            if action.template and not action.checks:
+                self.run_template_action(action, log)
+            else:
+                self.click(action, *action.click_pos)
+
+            # Monitor pixel if specified
+            monitor_pos = action.monitor_pos
+            if action.checks:
+                taken, value = check_action(action, watcher.policy)
+                if isinstance(value, float):
+                    value = f"{value:.2f}" if action.template else f"{value:.0%}"
+                log(f"🔀 Condition {'met' if taken else 'not met'} ({value})")
+            elif monitor_pos and not action.template:
+                self.waits_run += 1
+                if action.region:
+                    log(action.monitor_message)
+                    condition = self.watch_region(action)
+
+                    self.wait_condition(
+                        condition,
+                        lambda: log(
+                            action.waiting_template.format(condition.last_value or 0)
+                        ),
+                    )
+
+                    if condition.matched:
+                        counted = "matching" if action.target_color else "changed"
+                        log(
+                            f"🎯 Region condition met! {condition.last_value:.0%} of pixels {counted} (within {condition.detection_latency * 1000:.1f} ms)"
+                        )
+                    else:
+                        watcher.cancel(condition)
+                elif action.target_color:
+                    # Monitor for specific color change
+                    log(action.monitor_message)
+                    condition = watcher.watch_color(
+                        monitor_pos,
+                        action.target_color,
+                        policy=action.policy_for(watcher.policy),
+                        confirm=action.confirm,
+                    )
+
+                    self.wait_condition(
+                        condition,
+                        lambda: log(
+                            action.waiting_template.format(condition.last_value)
+                        ),
+                    )
+
+                    if condition.matched:
+                        log(
+                            f"🎯 Color change detected! Pixel is now {condition.last_value} (within {condition.detection_latency * 1000:.1f} ms)"
+                        )
+                    else:
+                        watcher.cancel(condition)
+                else:
+                    # Monitor for any color change
+                    initial_color = get_pixel(*monitor_pos)
+                    log(action.monitor_message.format(initial_color))
+                    condition = watcher.watch_change(
+                        monitor_pos,
+                        initial_color,
+                        policy=action.policy_for(watcher.policy),
+                        confirm=action.confirm,
+                    )
+
+                    self.wait_condition(
+                        condition,
+                        lambda: log(action.waiting_template.format(initial_color)),
+                    )
+
+                    if condition.matched:
+                        log(
+                            f"🎯 Color change detected! Pixel changed from {initial_color} to {condition.last_value} (within {condition.detection_latency * 1000:.1f} ms)"
+                        )
+                    else:
+                        watcher.cancel(condition)
+
+            # Sequence calls and jumps
+            flow = action.flow
+            if flow is None:
+                position += 1
+            else:
+                if flow.call and self.running:
+                    self.call_sequence(flow, depth, log)
+                if not action.checks:
+                    taken = action.jump is not None
+                following = next_position(action, position, taken, loops)
+                if taken and following == action.jump:
+                    log(f"↪️ Jumping to {flow.goto} (action {following + 1})")
+                elif taken:
+                    log(f"🔁 Loop at {flow.goto} done after {flow.loop} rounds")
+                position = following
+
+            # Delay after action, recorded apart from the action's own time
+            finished = time.perf_counter()
+            delayed = 0.0
+            if action.delay > 0 and self.running:
+                log(f"⏰ Waiting {action.delay} seconds...")
+                scheduler.wait(action.delay, self.cancel)
+                delayed = time.perf_counter() - finished
+            record_action(action.index, finished - started, delayed)
@@ -0,0 +1,168 @@
+"""Watching the active sequence file for edits.
+
+On Linux the file's directory is watched with inotify, so saves that
+replace the file through a rename are seen too.  Everywhere else (or if
+inotify is unavailable) the file is polled with os.stat.  The callback runs
+on the watcher thread once the file has been quiet for a short moment.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class FileWatcher:
+    """Calls ``callback(path)`` whenever the watched file changes"""
+
+    def __init__(self, callback, poll_interval=0.5, settle_time=0.1):
+        self.callback = callback
+        self.poll_interval = poll_interval
+        # Editors often write in several steps; wait for them to finish
+        self.settle_time = settle_time
+        self.path = None
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._inotify = _Inotify.create() if sys.platform.startswith("linux") else None
+
+    @property
+    def mode(self):
+        return "inotify" if self._inotify else "polling"
+
+    def watch(self, path):
+        """Start watching ``path`` instead of the previous file (None to stop)"""
+        path = os.path.abspath(path) if path else None
+        with self._lock:
+            if path == self.path:
+                return
+            self.path = path
+            if self._inotify:
+                self._inotify.watch_dir(os.path.dirname(path) if path else None)
+            self._changed.set()
+            if path and (self._thread is None or not self._thread.is_alive()):
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+    def _run(self):
+        path = None
+        signature = None
+        while not self._stopped.is_set():
+            with self._lock:
+                if self.path != path:
+                    path = self.path
+                    signature = _file_signature(path) if path else None
+            if path is None:
+                self._changed.wait()
+                self._changed.clear()
+                continue
+
+            inotify = self._inotify
+            if inotify and inotify.wd is not None:
+                names = inotify.read(self.poll_interval)
+                if os.path.basename(path) not in names:
+                    continue
+            else:
+                self._changed.wait(self.poll_interval)
+                self._changed.clear()
+
+            current = _file_signature(path)
+            if current is None or current == signature:
+                continue
+
+            # Let the writer finish, then report the settled state
+            self._stopped.wait(self.settle_time)
+            settled = _file_signature(path)
+            if settled != current:
+                continue
+            signature = settled
+            with self._lock:
+                still_watched = self.path == path
+            if still_watched and not self._stopped.is_set():
+                self.callback(path)
+
+
+class _Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API"""
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.wd = None
+
+    @classmethod
+    def create(cls):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def watch_dir(self, directory):
+        if self.wd is not None:
+            self.libc.inotify_rm_watch(self.fd, self.wd)
+            self.wd = None
+        if directory:
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+            self.wd = wd if wd >= 0 else None
+
+    def read(self, timeout):
+        """Return the set of file names touched within ``timeout`` seconds"""
+        names = set()
+        fd = self.fd
+        if fd is None:
+            return names
+        try:
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                return names
+            data = os.read(fd, 64 * 1024)
+        except (OSError, ValueError):
+            return names
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
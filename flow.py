@@ -0,0 +1,133 @@
+"""Control flow between the actions of a sequence.
+
+A sequence runs top to bottom unless an action carries flow options:
+
+    label=NAME   names the action, as a jump target
+    goto=NAME    continue at the action labelled NAME.  On an action with a
+                 monitor position and a target color, region or template,
+                 the condition is checked once instead of waited for, and
+                 the jump is only taken if it holds ("if matches, goto")
+    loop=N       take the goto at most N times in a row, then fall through
+    call=FILE    run another sequence file, from the sequence cache, before
+                 going on
+
+link() resolves every goto to the position of its label when a program
+is loaded, so at run time a jump is a list index and nothing is looked
+up or parsed again.
+"""
+
+import os
+
+# Calls nested deeper than this fail the run, e.g. a file calling itself
+MAX_CALL_DEPTH = 16
+
+
+class FlowError(ValueError):
+    """A goto without its label, or a label used twice.
+
+    position is the action's, and key the option at fault, goto or label.
+    """
+
+    def __init__(self, position, message, key="goto"):
+        super().__init__(message)
+        self.position = position
+        self.key = key
+
+
+class Flow:
+    """The flow options of one action as written in a sequence file"""
+
+    __slots__ = ("label", "goto", "loop", "call", "base_dir")
+
+    def __init__(self, label=None, goto=None, loop=None, call=None, base_dir=None):
+        if loop is not None:
+            if goto is None:
+                raise ValueError("loop needs a goto=LABEL option")
+            if loop < 1:
+                raise ValueError("loop must be at least 1")
+        self.label = label
+        self.goto = goto
+        self.loop = loop
+        self.call = call
+        self.base_dir = base_dir
+
+    def __eq__(self, other):
+        return isinstance(other, Flow) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def resolved_call(self):
+        """The called file, relative paths being taken from the sequence file"""
+        if self.base_dir and not os.path.isabs(self.call):
+            return os.path.join(self.base_dir, self.call)
+        return self.call
+
+    def describe(self, conditional=False):
+        parts = []
+        if self.label:
+            parts.append(f"label {self.label}")
+        if self.call:
+            parts.append(f"call {os.path.basename(self.call)}")
+        if self.goto:
+            when = " if it matches" if conditional else ""
+            loop = f" up to {self.loop} times" if self.loop else ""
+            parts.append(f"goto {self.goto}{when}{loop}")
+        return ", ".join(parts)
+
+
+def labels(program):
+    """Map every label of a program to its action's position"""
+    positions = {}
+    for position, action in enumerate(program):
+        flow = action.flow
+        if flow is not None and flow.label:
+            if flow.label in positions:
+                raise FlowError(
+                    position,
+                    f"Action {action.index}: label '{flow.label}' is already "
+                    f"used by action {positions[flow.label] + 1}",
+                    "label",
+                )
+            positions[flow.label] = position
+    return positions
+
+
+def resolve(action, positions):
+    """Set the jump of an action with a goto from a labels() map"""
+    try:
+        action.jump = positions[action.flow.goto]
+    except KeyError:
+        raise FlowError(
+            action.index - 1,
+            f"Action {action.index}: no action is labelled '{action.flow.goto}'",
+        ) from None
+
+
+def link(program):
+    """Resolve the gotos of a program to positions, the jump table, in place"""
+    positions = None
+    for action in program:
+        flow = action.flow
+        if flow is not None and flow.goto:
+            if positions is None:
+                positions = labels(program)
+            resolve(action, positions)
+    return program
+
+
+def next_position(action, position, taken, loops):
+    """Position of the action after the one at position.
+
+    taken says whether the action's goto condition held.  loops counts the
+    jumps each bounded loop made in a row and is reset by falling through.
+    """
+    limit = action.flow.loop
+    if limit is None:
+        return action.jump if taken else position + 1
+    if taken:
+        count = loops.get(position, 0)
+        if count < limit:
+            loops[position] = count + 1
+            return action.jump
+    loops[position] = 0
+    return position + 1
@@ -0,0 +1,116 @@
+"""Global hotkey dispatch.
+
+The keyboard library calls hotkey callbacks on its hook thread, and every
+keystroke on the system waits for them to return.  The callbacks bound by
+HotkeyDispatcher only timestamp the press and put the command on a
+queue.SimpleQueue, whose put never blocks; a dispatcher thread runs the
+commands.  Anything that touches Tk is handed to a UiQueue, which the Tk
+thread drains on a short timer.
+"""
+
+import collections
+import queue
+import threading
+import time
+import traceback
+
+
+class UiQueue:
+    """Calls made from any thread, run later on the Tk thread by pump()"""
+
+    def __init__(self):
+        # deque.append/popleft are atomic, so callers need no lock
+        self._calls = collections.deque()
+
+    def call(self, fn, *args):
+        self._calls.append((fn, args))
+
+    def pump(self):
+        """Run every queued call; call from the Tk thread"""
+        calls = self._calls
+        while calls:
+            fn, args = calls.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+
+
+class HotkeyDispatcher:
+    """Runs hotkey commands on its own thread instead of the hook thread.
+
+    add_hotkey and remove_hotkey are keyboard.add_hotkey and
+    keyboard.remove_hotkey, or stand-ins with the same signatures.
+    """
+
+    def __init__(self, add_hotkey, remove_hotkey):
+        self._add_hotkey = add_hotkey
+        self._remove_hotkey = remove_hotkey
+        self._queue = queue.SimpleQueue()
+        self._handles = {}
+        self._thread = None
+        # Seconds from each key press until its command started running
+        self.latencies = collections.deque(maxlen=1000)
+
+    def bind(self, name, hotkey, command):
+        """Bind hotkey to command(pressed_at), replacing the old binding of name.
+
+        pressed_at is the time.perf_counter() of the key press.  Errors from
+        add_hotkey (e.g. an unknown key name) are raised to the caller.
+        """
+        self.unbind(name)
+        post = self._queue.put
+        self._handles[name] = self._add_hotkey(
+            hotkey, lambda: post((command, time.perf_counter()))
+        )
+        self._ensure_thread()
+
+    def unbind(self, name):
+        handle = self._handles.pop(name, None)
+        if handle is not None:
+            try:
+                self._remove_hotkey(handle)
+            except Exception:
+                pass
+
+    def post(self, command, pressed_at=None):
+        """Queue a command as if its hotkey had been pressed"""
+        self._queue.put((command, pressed_at or time.perf_counter()))
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        get = self._queue.get
+        latencies = self.latencies
+        while True:
+            item = get()
+            if item is None:
+                return
+            command, pressed_at = item
+            latencies.append(time.perf_counter() - pressed_at)
+            try:
+                command(pressed_at)
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        for name in list(self._handles):
+            self.unbind(name)
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(1.0)
+
+    def latency_summary(self):
+        """Return (count, mean_ms, max_ms) of press-to-dispatch latencies"""
+        latencies = list(self.latencies)
+        if not latencies:
+            return (0, 0.0, 0.0)
+        return (
+            len(latencies),
+            sum(latencies) / len(latencies) * 1000,
+            max(latencies) * 1000,
+        )
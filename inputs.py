@@ -0,0 +1,287 @@
+"""Mouse input backends.
+
+A backend takes a batch of (kind, x, y, button) events and injects them in
+one go, so a click is a single SendInput call carrying the move and both
+button transitions instead of SetCursorPos plus two mouse_event calls.
+RecordingInput keeps the events in memory with timestamps, which lets the
+sequence engine run and be measured without a desktop.
+"""
+
+import sys
+import threading
+import time
+
+# Event kinds
+MOVE = "move"
+DOWN = "down"
+UP = "up"
+
+# Buttons
+LEFT = "left"
+RIGHT = "right"
+MIDDLE = "middle"
+BUTTONS = (LEFT, RIGHT, MIDDLE)
+
+
+def click_events(x, y, button):
+    """Return the move, press and release events of one click"""
+    return ((MOVE, x, y, None), (DOWN, x, y, button), (UP, x, y, button))
+
+
+class InputBackend:
+    """Base class for input backends.
+
+    ``send`` injects a sequence of (kind, x, y, button) events in order;
+    ``button`` is None for moves.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.send_count = 0
+        self.event_count = 0
+
+    def send(self, events):
+        raise NotImplementedError
+
+    def get_position(self):
+        raise NotImplementedError
+
+    def move(self, x, y):
+        self.send(((MOVE, x, y, None),))
+
+    def click(self, x, y, button=LEFT):
+        self.send(click_events(x, y, button))
+
+    def close(self):
+        pass
+
+
+class RecordingInput(InputBackend):
+    """Records events in memory instead of injecting them"""
+
+    name = "recording"
+
+    def __init__(self, position=(0, 0)):
+        super().__init__()
+        self.position = position
+        # (timestamp, kind, x, y, button), timestamps from time.perf_counter
+        self.events = []
+        self._lock = threading.Lock()
+
+    def send(self, events):
+        now = time.perf_counter()
+        with self._lock:
+            for kind, x, y, button in events:
+                if button is not None and button not in BUTTONS:
+                    raise ValueError(f"Unknown mouse button '{button}'")
+                self.events.append((now, kind, x, y, button))
+                if kind == MOVE:
+                    self.position = (x, y)
+            self.send_count += 1
+            self.event_count += len(events)
+
+    def get_position(self):
+        return self.position
+
+    def clicks(self):
+        """Return (timestamp, x, y, button) for every recorded button press"""
+        with self._lock:
+            return [(t, x, y, b) for t, kind, x, y, b in self.events if kind == DOWN]
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.send_count = 0
+            self.event_count = 0
+
+
+class SendInputBackend(InputBackend):
+    """Windows backend that injects each batch with a single SendInput call"""
+
+    name = "sendinput"
+
+    INPUT_MOUSE = 0
+    MOUSEEVENTF_MOVE = 0x0001
+    MOUSEEVENTF_VIRTUALDESK = 0x4000
+    MOUSEEVENTF_ABSOLUTE = 0x8000
+    BUTTON_FLAGS = {
+        (DOWN, LEFT): 0x0002,
+        (UP, LEFT): 0x0004,
+        (DOWN, RIGHT): 0x0008,
+        (UP, RIGHT): 0x0010,
+        (DOWN, MIDDLE): 0x0020,
+        (UP, MIDDLE): 0x0040,
+    }
+
+    # GetSystemMetrics indices of the virtual screen spanning all monitors
+    SM_XVIRTUALSCREEN = 76
+    SM_YVIRTUALSCREEN = 77
+    SM_CXVIRTUALSCREEN = 78
+    SM_CYVIRTUALSCREEN = 79
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        from ctypes import wintypes
+
+        self._ctypes = ctypes
+        self.user32 = ctypes.windll.user32
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [
+                ("dx", wintypes.LONG),
+                ("dy", wintypes.LONG),
+                ("mouseData", wintypes.DWORD),
+                ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t),
+            ]
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [
+                ("wVk", wintypes.WORD),
+                ("wScan", wintypes.WORD),
+                ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t),
+            ]
+
+        # Only mouse input is sent, but the union must have its full size
+        class _INPUTUNION(ctypes.Union):
+            _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT)]
+
+        class INPUT(ctypes.Structure):
+            _fields_ = [("type", wintypes.DWORD), ("u", _INPUTUNION)]
+
+        class POINT(ctypes.Structure):
+            _fields_ = [("x", wintypes.LONG), ("y", wintypes.LONG)]
+
+        self._INPUT = INPUT
+        self._POINT = POINT
+        self._input_size = ctypes.sizeof(INPUT)
+
+        self.user32.SendInput.restype = wintypes.UINT
+        self.user32.SendInput.argtypes = [
+            wintypes.UINT,
+            ctypes.POINTER(INPUT),
+            ctypes.c_int,
+        ]
+        self.user32.GetCursorPos.argtypes = [ctypes.POINTER(POINT)]
+        self.user32.GetSystemMetrics.argtypes = [ctypes.c_int]
+
+        # Input arrays are reused per thread, grown to the largest batch seen
+        self._local = threading.local()
+
+    def _buffer(self, count):
+        buf = getattr(self._local, "buffer", None)
+        if buf is None or len(buf) < count:
+            buf = self._local.buffer = (self._INPUT * max(count, 3))()
+            for item in buf:
+                item.type = self.INPUT_MOUSE
+        return buf
+
+    def _virtual_screen(self):
+        metrics = self.user32.GetSystemMetrics
+        return (
+            metrics(self.SM_XVIRTUALSCREEN),
+            metrics(self.SM_YVIRTUALSCREEN),
+            max(1, metrics(self.SM_CXVIRTUALSCREEN)),
+            max(1, metrics(self.SM_CYVIRTUALSCREEN)),
+        )
+
+    def send(self, events):
+        count = len(events)
+        if not count:
+            return
+        buf = self._buffer(count)
+        # Monitors can be rearranged while running, so read the layout per batch
+        left, top, width, height = self._virtual_screen()
+        for item, (kind, x, y, button) in zip(buf, events):
+            mi = item.u.mi
+            if kind == MOVE:
+                # Absolute coordinates are 0-65535 across the virtual screen;
+                # rounding up lands exactly on the requested pixel
+                mi.dx = ((x - left) * 65536 + width - 1) // width
+                mi.dy = ((y - top) * 65536 + height - 1) // height
+                mi.dwFlags = (
+                    self.MOUSEEVENTF_MOVE
+                    | self.MOUSEEVENTF_ABSOLUTE
+                    | self.MOUSEEVENTF_VIRTUALDESK
+                )
+            else:
+                try:
+                    mi.dwFlags = self.BUTTON_FLAGS[kind, button]
+                except KeyError:
+                    raise ValueError(f"Unknown mouse event {kind} {button}") from None
+                mi.dx = mi.dy = 0
+
+        sent = self.user32.SendInput(count, buf, self._input_size)
+        if sent != count:
+            raise OSError(f"SendInput injected {sent} of {count} events")
+        self.send_count += 1
+        self.event_count += count
+
+    def get_position(self):
+        pt = self._POINT()
+        self.user32.GetCursorPos(self._ctypes.byref(pt))
+        return (pt.x, pt.y)
+
+
+# --- Active backend ---
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_default_backend():
+    if sys.platform == "win32":
+        return SendInputBackend()
+    import x11
+
+    if x11.available():
+        return x11.XTestInput(x11.get_connection())
+    raise RuntimeError(f"No mouse input backend available for {sys.platform}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_default_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap in another backend (e.g. a RecordingInput), returning the old one"""
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, backend
+    return old
+
+
+# --- Click handlers ---
+# Each click is one batched injection through the active backend
+def move_to(x, y):
+    get_backend().move(x, y)
+
+
+def left_click(x, y):
+    get_backend().click(x, y, LEFT)
+
+
+def right_click(x, y):
+    get_backend().click(x, y, RIGHT)
+
+
+def middle_click(x, y):
+    get_backend().click(x, y, MIDDLE)
+
+
+# Click handlers resolved once when a sequence is compiled, by click type
+CLICK_HANDLERS = {
+    LEFT: left_click,
+    RIGHT: right_click,
+    MIDDLE: middle_click,
+    MOVE: move_to,
+}
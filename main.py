@@ -1,55 +1,51 @@
 import sys
+
+import cli
+
+# python main.py run sequence.csv ... runs headless.  It is dispatched before
+# Tk and the keyboard hook are imported, so it needs neither a display nor
+# the GUI's dependencies.
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+    sys.exit(cli.main(sys.argv[1:]))
+
 import threading
-import time
-import csv
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import keyboard  # type: ignore # External global hotkey library
-import ctypes
-from ctypes import wintypes
 import json
 import os
+import time
 
-# --- Windows ctypes setup ---
-user32 = ctypes.windll.user32
-gdi32 = ctypes.windll.gdi32
-
-
-# Struct for mouse position
-class POINT(ctypes.Structure):
-    _fields_ = [("x", wintypes.LONG), ("y", wintypes.LONG)]
+import capture
+import inputs
+from action_list_view import ActionListView
+from filewatch import FileWatcher
+from hotkeys import HotkeyDispatcher, UiQueue
+from metrics import export as export_metrics, format_lines
+from monitor_log import CLEAR, MonitorLog
+from region import DEFAULT_TOLERANCE, Region, parse_match
+from engine import SequenceEngine
+from executor import SequenceRunner
+from inputs import CLICK_HANDLERS, move_to
+from recorder import MacroRecorder
+from runtrace import EXTENSION as TRACE_EXTENSION, Recording
+from scheduler import ANCHOR_END, ANCHOR_START
+from sequence import append_action
+from sequence_io import SequenceCache, parse_region_size, write_file
+from watcher import PollPolicy, colors_close
 
 
 # --- Helper functions ---
 def get_mouse_position():
-    pt = POINT()
-    user32.GetCursorPos(ctypes.byref(pt))
-    return (pt.x, pt.y)
+    return inputs.get_backend().get_position()
 
 
 def get_pixel_color(x, y):
-    hdc = user32.GetDC(0)
-    color = gdi32.GetPixel(hdc, x, y)
-    user32.ReleaseDC(0, hdc)
-    # Convert BGR to RGB
-    r = color & 0xFF
-    g = (color >> 8) & 0xFF
-    b = (color >> 16) & 0xFF
-    return (r, g, b)
+    return capture.get_backend().get_pixel(x, y)
 
 
 def mouse_click(x, y, click_type="left"):
-    user32.SetCursorPos(x, y)
-    if click_type == "left":
-        user32.mouse_event(2, 0, 0, 0, 0)  # Left button down
-        user32.mouse_event(4, 0, 0, 0, 0)  # Left button up
-    elif click_type == "right":
-        user32.mouse_event(8, 0, 0, 0, 0)  # Right button down
-        user32.mouse_event(16, 0, 0, 0, 0)  # Right button up
-    elif click_type == "middle":
-        user32.mouse_event(32, 0, 0, 0, 0)  # Middle button down
-        user32.mouse_event(64, 0, 0, 0, 0)  # Middle button up
-    # If click_type is "move", just move the cursor (no click)
+    CLICK_HANDLERS.get(click_type, move_to)(x, y)
 
 
 def validate_and_parse_xy(text):
@@ -86,8 +82,14 @@ def parse_color(text):
         return None
 
 
-def colors_close(col1, col2, tolerance=10):
-    return all(abs(a - b) <= tolerance for a, b in zip(col1, col2))
+# Action Monitor refresh period and widget line limit
+MONITOR_REFRESH_MS = 33
+# How often calls queued for the Tk thread are run
+UI_POLL_MS = 10
+METRICS_REFRESH_MS = 500
+# Hotkey press to first click; slower starts are flagged in the monitor
+HOTKEY_LATENCY_TARGET_MS = 20
+MONITOR_MAX_LINES = 1000
 
 
 # --- Main App ---
@@ -99,21 +101,49 @@ class AutoClickerApp(tk.Tk):
         self.wm_attributes("-topmost", 1)
         self.configure(bg="#2c3e50")
 
-        self.running = False
         self.thread = None
-        self.actions = []
-        self.current_hotkey = None
-        self.copy_pos_hotkey = None
-        self.copy_color_hotkey = None
-
-        # Preload hotkeys and paths
-        self.preload_hotkeys = {"alt+2": None, "alt+3": None, "alt+4": None}
+        # Work from other threads that needs Tk is queued here
+        self.ui = UiQueue()
+        # The loaded sequence is an immutable snapshot; reloads made while
+        # running are swapped in by the runner at the next cycle boundary
+        self.runner = SequenceRunner(log=self.log_to_monitor)
+        self.runner.on_program_changed = lambda program: self.ui.call(
+            self.show_actions, program
+        )
+        self.runner.trigger_target_ms = HOTKEY_LATENCY_TARGET_MS
+        # Serializes starting and stopping between the Tk and hotkey threads
+        self._launch_lock = threading.Lock()
+        # Counts runs, so a finished worker only ends the run it started
+        self._run_id = 0
+        self.macro_recorder = MacroRecorder()
+        # Controls settings as last read on the Tk thread, for hotkey starts
+        self.run_settings = (None, "Settings not read yet.")
+        # Background sequences (e.g. keep-alive loops) run next to the main one
+        self.engine = SequenceEngine(log=self.log_to_monitor)
+        self.file_watcher = FileWatcher(self.on_sequence_file_changed)
+        self.sequence_cache = SequenceCache(CLICK_HANDLERS)
+        # Files called by call=FILE actions share the cache of loaded files
+        self.runner.sequence_cache = self.sequence_cache
+        self.engine.sequence_cache = self.sequence_cache
+        # The main run clicks through the engine's lane, never between its clicks
+        self.runner.lane = self.engine.lane
+        self.sequence_cache.in_use = self.program_in_use
+        # Hotkey callbacks only queue commands; a dispatcher thread runs them
+        self.hotkeys = HotkeyDispatcher(keyboard.add_hotkey, keyboard.remove_hotkey)
+
+        # Preload paths
         self.preload_csv_paths = {"alt+2": "", "alt+3": "", "alt+4": ""}
         self.config_file = "autoclicker_config.json"
 
         # Load saved configuration
         self.load_config()
 
+        self.monitor_log = MonitorLog(
+            log_path=os.path.join(
+                os.path.dirname(self.get_config_path()), "autoclicker_monitor.log"
+            )
+        )
+
         # Configure styles
         self.setup_styles()
 
@@ -161,9 +191,15 @@ class AutoClickerApp(tk.Tk):
         # Monitor section
         self.create_monitor_section(main_frame)
 
+        # Metrics section
+        self.create_metrics_section(main_frame)
+
         # Control buttons section
         self.create_control_section(main_frame)
 
+        # Background sequences section
+        self.create_background_section(main_frame)
+
         # CSV Preload section
         self.create_preload_section(main_frame)
 
@@ -172,8 +208,13 @@ class AutoClickerApp(tk.Tk):
 
         # Start info updates and default hotkeys
         self.update_info()
+        self.pump_ui()
+        self.drain_monitor()
+        self.refresh_background_list()
+        self.refresh_metrics()
         self.register_hotkey()
         self.register_copy_shortcuts()
+        self.register_turbo_hotkey()
         self.register_preload_hotkeys()
 
         self.protocol("WM_DELETE_WINDOW", self.close_window)
@@ -351,7 +392,13 @@ class AutoClickerApp(tk.Tk):
         self.click_type_dropdown = ttk.Combobox(
             grid_frame,
             textvariable=self.click_type_var,
-            values=["Left Click", "Right Click", "Middle Click", "Move Only"],
+            values=[
+                "Left Click",
+                "Right Click",
+                "Middle Click",
+                "Move Only",
+                "No Click",
+            ],
             state="readonly",
             font=("Arial", 9),
             width=12,
@@ -390,6 +437,45 @@ class AutoClickerApp(tk.Tk):
             row=2, column=5, sticky="w", padx=5, pady=(2, 0)
         )
 
+        # Region monitoring: a rectangle at the monitor position
+        ttk.Label(grid_frame, text="Monitor Region", style="Input.TLabel").grid(
+            row=3, column=0, sticky="w", padx=5, pady=(8, 0)
+        )
+        ttk.Label(grid_frame, text="Region Match", style="Input.TLabel").grid(
+            row=3, column=1, sticky="w", padx=5, pady=(8, 0)
+        )
+        ttk.Label(grid_frame, text="Tolerance", style="Input.TLabel").grid(
+            row=3, column=2, sticky="w", padx=5, pady=(8, 0)
+        )
+
+        self.region_size_input = ttk.Entry(grid_frame, font=("Arial", 9))
+        self.region_size_input.grid(row=4, column=0, sticky="ew", padx=5, pady=(3, 0))
+
+        self.region_match_var = tk.StringVar(value="any")
+        self.region_match_dropdown = ttk.Combobox(
+            grid_frame,
+            textvariable=self.region_match_var,
+            values=["any", "all", "50%", "75%", "90%"],
+            font=("Arial", 9),
+            width=12,
+        )
+        self.region_match_dropdown.grid(
+            row=4, column=1, sticky="ew", padx=5, pady=(3, 0)
+        )
+
+        self.tolerance_input = ttk.Entry(grid_frame, font=("Arial", 9))
+        self.tolerance_input.grid(row=4, column=2, sticky="ew", padx=5, pady=(3, 0))
+
+        ttk.Label(grid_frame, text="e.g. '200x200' (opt)", style="Regular.TLabel").grid(
+            row=5, column=0, sticky="w", padx=5, pady=(2, 0)
+        )
+        ttk.Label(grid_frame, text="e.g. 'all' or '60%'", style="Regular.TLabel").grid(
+            row=5, column=1, sticky="w", padx=5, pady=(2, 0)
+        )
+        ttk.Label(grid_frame, text="0-255, default 10", style="Regular.TLabel").grid(
+            row=5, column=2, sticky="w", padx=5, pady=(2, 0)
+        )
+
         # Add action button
         self.add_action_button = ttk.Button(
             input_frame,
@@ -399,6 +485,15 @@ class AutoClickerApp(tk.Tk):
         )
         self.add_action_button.pack(pady=(10, 0), fill=tk.X)
 
+        # Records clicks and moves straight into actions
+        self.record_button = ttk.Button(
+            input_frame,
+            text="⏺️ Record Macro",
+            command=self.toggle_macro_recording,
+            style="Action.TButton",
+        )
+        self.record_button.pack(pady=(5, 0), fill=tk.X)
+
     def create_action_list_section(self, parent):
         list_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
         list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
@@ -407,28 +502,18 @@ class AutoClickerApp(tk.Tk):
             anchor="w"
         )
 
-        # Action list with scrollbar
-        list_content = ttk.Frame(list_frame, style="Input.TFrame")
-        list_content.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
-
-        self.action_list = tk.Listbox(
-            list_content,
+        # Virtualized action list, only the visible rows are rendered
+        self.action_list = ActionListView(
+            list_frame,
             height=6,
             bg="#34495e",
             fg="#ecf0f1",
-            selectbackground="#3498db",
-            selectforeground="#ffffff",
+            select_bg="#3498db",
+            current_bg="#16a085",
             font=("Arial", 9),
-            relief="sunken",
-            borderwidth=2,
+            style="Input.TFrame",
         )
-
-        self.action_scrollbar = ttk.Scrollbar(
-            list_content, orient=tk.VERTICAL, command=self.action_list.yview
-        )
-        self.action_list.config(yscrollcommand=self.action_scrollbar.set)
-        self.action_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.action_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.action_list.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
 
     def create_monitor_section(self, parent):
         monitor_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
@@ -463,6 +548,33 @@ class AutoClickerApp(tk.Tk):
         monitor_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.monitor_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
+    def create_metrics_section(self, parent):
+        metrics_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
+        metrics_frame.pack(fill=tk.X, pady=(0, 10))
+
+        header = ttk.Frame(metrics_frame, style="Input.TFrame")
+        header.pack(fill=tk.X)
+        ttk.Label(header, text="📊 Run Metrics", style="Section.TLabel").pack(
+            side=tk.LEFT
+        )
+        ttk.Button(
+            header,
+            text="💾 Export JSON",
+            command=self.export_run_metrics,
+            style="Copy.TButton",
+        ).pack(side=tk.RIGHT, padx=2)
+
+        self.metrics_var = tk.StringVar(value="No run yet")
+        tk.Label(
+            metrics_frame,
+            textvariable=self.metrics_var,
+            justify=tk.LEFT,
+            anchor="w",
+            bg="#2c3e50",
+            fg="#ecf0f1",
+            font=("Consolas", 9),
+        ).pack(fill=tk.X, pady=(5, 0))
+
     def create_control_section(self, parent):
         control_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
         control_frame.pack(fill=tk.X, pady=(0, 10))
@@ -482,6 +594,60 @@ class AutoClickerApp(tk.Tk):
         self.repeat_input.pack(side=tk.LEFT, padx=5)
         self.repeat_input.insert(0, "1")
 
+        ttk.Label(repeat_frame, text="Hot Polling (ms):", style="Input.TLabel").pack(
+            side=tk.LEFT, padx=5
+        )
+        self.hot_poll_input = ttk.Entry(repeat_frame, font=("Arial", 9), width=8)
+        self.hot_poll_input.pack(side=tk.LEFT, padx=5)
+        self.hot_poll_input.insert(0, "200")
+
+        ttk.Label(
+            repeat_frame, text="Max Poll Interval (ms):", style="Input.TLabel"
+        ).pack(side=tk.LEFT, padx=5)
+        self.max_poll_input = ttk.Entry(repeat_frame, font=("Arial", 9), width=8)
+        self.max_poll_input.pack(side=tk.LEFT, padx=5)
+        self.max_poll_input.insert(0, "100")
+
+        ttk.Label(repeat_frame, text="Delay From:", style="Input.TLabel").pack(
+            side=tk.LEFT, padx=5
+        )
+        self.delay_anchor_var = tk.StringVar(value="Action End")
+        ttk.Combobox(
+            repeat_frame,
+            textvariable=self.delay_anchor_var,
+            values=["Action End", "Action Start"],
+            state="readonly",
+            font=("Arial", 9),
+            width=12,
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Turbo mode can also be enabled with --turbo on the command line
+        self.turbo_var = tk.BooleanVar(value="--turbo" in sys.argv)
+        tk.Checkbutton(
+            control_frame,
+            text="⚡ Turbo mode (no per-action logging, summary only)",
+            variable=self.turbo_var,
+            bg="#34495e",
+            fg="#ecf0f1",
+            selectcolor="#2c3e50",
+            activebackground="#34495e",
+            activeforeground="#ecf0f1",
+            font=("Arial", 9),
+        ).pack(anchor="w")
+
+        self.trace_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            control_frame,
+            text="🎞️ Record trace (screen reads and clicks, for offline replay)",
+            variable=self.trace_var,
+            bg="#34495e",
+            fg="#ecf0f1",
+            selectcolor="#2c3e50",
+            activebackground="#34495e",
+            activeforeground="#ecf0f1",
+            font=("Arial", 9),
+        ).pack(anchor="w", pady=(0, 10))
+
         # File operations and control buttons
         button_frame = ttk.Frame(control_frame, style="Input.TFrame")
         button_frame.pack(fill=tk.X)
@@ -517,6 +683,39 @@ class AutoClickerApp(tk.Tk):
         self.start_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         self.stop_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
 
+    def create_background_section(self, parent):
+        background_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
+        background_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(
+            background_frame,
+            text="🧵 Background Sequences (run until stopped)",
+            style="Section.TLabel",
+        ).pack(anchor="w")
+
+        self.background_list = tk.Listbox(
+            background_frame,
+            height=4,
+            bg="#34495e",
+            fg="#ecf0f1",
+            selectbackground="#3498db",
+            font=("Arial", 9),
+            activestyle="none",
+        )
+        self.background_list.pack(fill=tk.X, pady=(5, 5))
+
+        button_frame = ttk.Frame(background_frame, style="Input.TFrame")
+        button_frame.pack(fill=tk.X)
+        for text, command, style in (
+            ("➕ Add", self.add_background_sequence, "Action.TButton"),
+            ("▶️ Start", self.start_background_sequence, "Start.TButton"),
+            ("⏹️ Stop", self.stop_background_sequence, "Stop.TButton"),
+            ("🗑️ Remove", self.remove_background_sequence, "Action.TButton"),
+        ):
+            ttk.Button(button_frame, text=text, command=command, style=style).pack(
+                side=tk.LEFT, fill=tk.X, expand=True, padx=2
+            )
+
     def create_all_shortcuts_section(self, parent):
         """Combined section for all keyboard shortcuts/hotkeys"""
         shortcuts_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
@@ -602,6 +801,33 @@ class AutoClickerApp(tk.Tk):
             color_shortcut_frame, text="(Copies: R,G,B)", style="Shortcut.TLabel"
         ).pack(side=tk.LEFT, padx=5)
 
+        # Turbo toggle shortcut
+        turbo_shortcut_frame = ttk.Frame(shortcuts_content, style="Input.TFrame")
+        turbo_shortcut_frame.pack(fill=tk.X, pady=(5, 0))
+
+        ttk.Label(
+            turbo_shortcut_frame, text="Toggle Turbo:", style="Input.TLabel"
+        ).pack(side=tk.LEFT, padx=5)
+        self.turbo_shortcut_input = ttk.Entry(
+            turbo_shortcut_frame, font=("Arial", 9), width=15
+        )
+        self.turbo_shortcut_input.pack(side=tk.LEFT, padx=5)
+        self.turbo_shortcut_input.insert(0, "alt+7")
+
+        ttk.Button(
+            turbo_shortcut_frame,
+            text="🔧 Set",
+            command=self.register_turbo_hotkey,
+            style="Action.TButton",
+            width=8,
+        ).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(
+            turbo_shortcut_frame,
+            text="(Applies from the next start)",
+            style="Shortcut.TLabel",
+        ).pack(side=tk.LEFT, padx=5)
+
     def create_preload_section(self, parent):
         """Section for CSV preload shortcuts"""
         preload_frame = ttk.Frame(parent, style="Section.TFrame", padding="10")
@@ -648,73 +874,137 @@ class AutoClickerApp(tk.Tk):
                 width=8,
             ).pack(side=tk.LEFT, padx=2)
 
-    def copy_position(self):
-        """Copy current mouse position to clipboard"""
-        x, y = get_mouse_position()
-        position_text = f"{x},{y}"
+    def copy_to_clipboard(self, text, what):
         self.clipboard_clear()
-        self.clipboard_append(position_text)
-        self.log_to_monitor(f"📋 Copied position to clipboard: {position_text}")
+        self.clipboard_append(text)
+        self.log_to_monitor(f"📋 Copied {what} to clipboard: {text}")
+
+    def copy_position(self, pressed_at=None):
+        """Copy current mouse position to clipboard; runs on the dispatcher"""
+        x, y = get_mouse_position()
+        self.ui.call(self.copy_to_clipboard, f"{x},{y}", "position")
 
-    def copy_color(self):
-        """Copy current pixel color to clipboard"""
+    def copy_color(self, pressed_at=None):
+        """Copy current pixel color to clipboard; runs on the dispatcher"""
         x, y = get_mouse_position()
         color = get_pixel_color(x, y)
         color_text = f"{color[0]},{color[1]},{color[2]}"
-        self.clipboard_clear()
-        self.clipboard_append(color_text)
-        self.log_to_monitor(f"📋 Copied color to clipboard: {color_text}")
+        self.ui.call(self.copy_to_clipboard, color_text, "color")
 
     def register_copy_shortcuts(self):
         """Register global shortcuts for copying position and color"""
-        # Remove old shortcuts
-        if self.copy_pos_hotkey:
-            try:
-                keyboard.remove_hotkey(self.copy_pos_hotkey)
-            except Exception:
-                pass
-        if self.copy_color_hotkey:
-            try:
-                keyboard.remove_hotkey(self.copy_color_hotkey)
-            except Exception:
-                pass
-
-        # Register new shortcuts
         pos_shortcut = self.pos_shortcut_input.get().strip().lower()
         color_shortcut = self.color_shortcut_input.get().strip().lower()
 
         try:
-            self.copy_pos_hotkey = keyboard.add_hotkey(pos_shortcut, self.copy_position)
-            self.copy_color_hotkey = keyboard.add_hotkey(
-                color_shortcut, self.copy_color
-            )
+            self.hotkeys.bind("copy_position", pos_shortcut, self.copy_position)
+            self.hotkeys.bind("copy_color", color_shortcut, self.copy_color)
         except Exception as e:
             messagebox.showwarning(
                 "Shortcut Error", f"Failed to register shortcuts: {e}"
             )
 
-    def log_to_monitor(self, message):
-        """Add a message to the monitor section with timestamp"""
-        timestamp = time.strftime("%H:%M:%S")
-        full_message = f"[{timestamp}] {message}\n"
+    def register_turbo_hotkey(self):
+        """Register the global shortcut that toggles turbo mode"""
+        shortcut = self.turbo_shortcut_input.get().strip().lower()
+        try:
+            self.hotkeys.bind(
+                "turbo", shortcut, lambda pressed_at: self.ui.call(self.toggle_turbo)
+            )
+        except Exception as e:
+            messagebox.showwarning(
+                "Shortcut Error", f"Failed to register turbo shortcut: {e}"
+            )
 
-        def update_text():
-            self.monitor_text.config(state=tk.NORMAL)
-            self.monitor_text.insert(tk.END, full_message)
-            self.monitor_text.see(tk.END)  # Auto-scroll to bottom
-            self.monitor_text.config(state=tk.DISABLED)
+    def toggle_turbo(self):
+        self.turbo_var.set(not self.turbo_var.get())
+        state = "on" if self.turbo_var.get() else "off"
+        self.log_to_monitor(f"⚡ Turbo mode {state}")
 
-        self.after(0, update_text)
+    def log_to_monitor(self, message):
+        """Add a message to the monitor section with timestamp"""
+        self.monitor_log.append(message)
 
     def clear_monitor(self):
         """Clear the monitor section"""
+        self.monitor_log.clear()
+
+    def drain_monitor(self):
+        """Move queued monitor lines into the widget, one batch per frame"""
+        overflow = self.monitor_log.take_overflow()
+        lines = self.monitor_log.drain()
+        if lines or overflow:
+            text = self.monitor_text
+            text.config(state=tk.NORMAL)
+
+            if overflow:
+                # Everything in the widget is older than the overflowed lines
+                self.monitor_log.archive(text.get("1.0", "end-1c"))
+                self.monitor_log.archive("".join(overflow))
+                text.delete("1.0", tk.END)
+
+            batch = []
+            for line in lines:
+                if line is CLEAR:
+                    batch = []
+                    text.delete("1.0", tk.END)
+                else:
+                    batch.append(line)
+            if batch:
+                text.insert(tk.END, "".join(batch))
+
+            # Keep only the last lines, streaming the rest to the log file
+            line_count = int(text.index("end-1c").split(".")[0])
+            excess = line_count - MONITOR_MAX_LINES
+            if excess > 0:
+                self.monitor_log.archive(text.get("1.0", f"{excess + 1}.0"))
+                text.delete("1.0", f"{excess + 1}.0")
+
+            text.see(tk.END)  # Auto-scroll to bottom
+            text.config(state=tk.DISABLED)
+
+        self.update_current_action()
+        self.after(MONITOR_REFRESH_MS, self.drain_monitor)
+
+    def update_current_action(self):
+        """Move the action list highlight to the action being executed"""
+        runner = self.runner
+        index = runner.current_action_index if runner.running else None
+        if index != self.action_list.current:
+            if index is not None:
+                self.action_list.see(index)
+            self.action_list.set_current(index)
+
+    def refresh_metrics(self):
+        """Show the current or last run's metrics, at a fixed rate"""
+        if self.runner.running or self.runner.cycle_times:
+            snapshot = self.runner.metrics_snapshot(top=3)
+            self.metrics_var.set("\n".join(format_lines(snapshot)))
+        self.after(METRICS_REFRESH_MS, self.refresh_metrics)
+
+    def export_run_metrics(self):
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json", filetypes=[("JSON Files", "*.json")]
+        )
+        if not path:
+            return
+        runner = self.runner
+        try:
+            export_metrics(
+                path,
+                runner.metrics_snapshot(),
+                sequence=self.file_watcher.path,
+                actions=len(runner.program),
+                turbo=runner.turbo,
+            )
+            messagebox.showinfo("Success", f"Saved metrics to {path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save: {e}")
 
-        def clear_text():
-            self.monitor_text.config(state=tk.NORMAL)
-            self.monitor_text.delete(1.0, tk.END)
-            self.monitor_text.config(state=tk.DISABLED)
-
-        self.after(0, clear_text)
+    def pump_ui(self):
+        """Run the calls other threads queued for the Tk thread"""
+        self.ui.pump()
+        self.after(UI_POLL_MS, self.pump_ui)
 
     def update_info(self):
         try:
@@ -724,6 +1014,8 @@ class AutoClickerApp(tk.Tk):
             self.color_var.set(f"Pixel Color: {color}")
         except Exception as e:
             print(f"Error updating info: {e}")
+        # Kept current so the start hotkey never has to wait for Tk
+        self.run_settings = self.read_run_settings()
         self.after(100, self.update_info)
 
     def add_action(self):
@@ -733,6 +1025,9 @@ class AutoClickerApp(tk.Tk):
         delay_text = self.delay_input.get().strip()
         monitor_text = self.monitor_pos_input.get().strip()
         target_color_text = self.target_color_input.get().strip()
+        region_text = self.region_size_input.get().strip()
+        match_text = self.region_match_var.get().strip() or "any"
+        tolerance_text = self.tolerance_input.get().strip()
 
         error_message = ""
 
@@ -742,6 +1037,7 @@ class AutoClickerApp(tk.Tk):
             "Right Click": "right",
             "Middle Click": "middle",
             "Move Only": "move",
+            "No Click": "none",
         }
         click_type = click_type_map.get(click_type_text, "left")
 
@@ -770,31 +1066,40 @@ class AutoClickerApp(tk.Tk):
             if target_color is None:
                 error_message += "• Target color must be R,G,B (0-255) or empty.\n"
 
+        monitor_region = None
+        if region_text:
+            try:
+                width, height = parse_region_size(region_text)
+                mode, percent = parse_match(match_text)
+                tolerance = int(tolerance_text) if tolerance_text else DEFAULT_TOLERANCE
+                monitor_region = Region(width, height, mode, percent, tolerance)
+            except ValueError as e:
+                error_message += f"• Region: {e}.\n"
+            if monitor_coords is None:
+                error_message += "• A monitor region needs a position to monitor.\n"
+
         if error_message:
             messagebox.showwarning("Input Error", error_message.strip())
             return
 
         if not name_text:
-            name_text = f"Action {len(self.actions) + 1}"
+            name_text = f"Action {len(self.runner.latest_program()) + 1}"
 
-        if monitor_coords and target_color:
-            action_text = f"{name_text} - {click_type_text} {click_coords}, monitor {monitor_coords} for color {target_color}, delay {delay_time}s"
-        elif monitor_coords:
-            action_text = f"{name_text} - {click_type_text} {click_coords}, monitor {monitor_coords} for any color change, delay {delay_time}s"
-        else:
-            action_text = f"{name_text} - {click_type_text} {click_coords}, no monitoring, delay {delay_time}s"
-
-        self.action_list.insert(tk.END, action_text)
-        self.actions.append(
-            (
-                name_text,
-                click_type,
-                click_coords,
-                monitor_coords,
-                target_color,
-                delay_time,
-            )
+        row = (
+            name_text,
+            click_type,
+            click_coords,
+            monitor_coords,
+            target_color,
+            delay_time,
+            None,
+            monitor_region,
+            None,
         )
+        # The sequence no longer mirrors a file, so stop hot-reloading it.
+        # A reload queued while running is kept, with the action added to it
+        program = self.runner.latest_program()
+        self.install_program(append_action(program, row, CLICK_HANDLERS))
 
         # Clear inputs after adding
         self.name_input.delete(0, tk.END)
@@ -803,260 +1108,351 @@ class AutoClickerApp(tk.Tk):
         self.delay_input.delete(0, tk.END)
         self.monitor_pos_input.delete(0, tk.END)
         self.target_color_input.delete(0, tk.END)
+        self.region_size_input.delete(0, tk.END)
+        self.region_match_var.set("any")
+        self.tolerance_input.delete(0, tk.END)
+
+    def toggle_macro_recording(self):
+        """Start recording the mouse, or append what was recorded as actions"""
+        recorder = self.macro_recorder
+        if not recorder.recording:
+            try:
+                recorder.start()
+            except Exception as e:
+                messagebox.showerror("Error", f"Cannot record the mouse: {e}")
+                return
+            self.record_button.config(text="⏹️ Stop Recording")
+            self.log_to_monitor("⏺️ Recording clicks and moves...")
+            return
+
+        # Clicks on this window, like the one that stopped recording, are not steps
+        window = (
+            self.winfo_rootx(),
+            self.winfo_rooty(),
+            self.winfo_width(),
+            self.winfo_height(),
+        )
+        program = self.runner.latest_program()
+        rows = recorder.stop(exclude=window, first_number=len(program) + 1)
+        self.record_button.config(text="⏺️ Record Macro")
+        for row in rows:
+            program = append_action(program, row, CLICK_HANDLERS)
+        self.install_program(program)
+        self.log_to_monitor(
+            f"⏺️ Recorded {recorder.raw_count} mouse events as {len(rows)} actions"
+        )
+
+    def install_program(self, program, path=None):
+        """Make program the current sequence and hot-reload it from path.
+
+        While a sequence is running the program is only queued, and the
+        runner swaps it in at the next cycle boundary.
+        """
+        self.file_watcher.watch(path)
+        if self.runner.install(program):
+            self.ui.call(self.show_actions, program)
+
+    def show_actions(self, program):
+        self.action_list.set_program(program)
+        # The list no longer draws the previous program, which may be closed
+        self.sequence_cache.release()
+
+    def program_in_use(self, program):
+        """Whether a run, a background sequence or the action list reads program"""
+        action_list = getattr(self, "action_list", None)
+        return (
+            self.runner.uses(program)
+            or self.engine.uses(program)
+            or (action_list is not None and action_list.program is program)
+        )
+
+    def on_sequence_file_changed(self, path):
+        """Recompile the active sequence file in the background after an edit"""
+        filename = os.path.basename(path)
+        try:
+            program, _ = self.sequence_cache.load(path)
+        except Exception as e:
+            self.log_to_monitor(
+                f"❌ Reload of {filename} failed, keeping current sequence - {e}"
+            )
+            return
+        self.install_program(program, path)
+        when = " (applies at next cycle)" if self.runner.running else ""
+        self.log_to_monitor(
+            f"🔁 {filename} changed, reloaded {len(program)} actions{when}"
+        )
 
     def save_actions(self):
         path = filedialog.asksaveasfilename(
-            defaultextension=".csv", filetypes=[("CSV Files", "*.csv")]
+            defaultextension=".csv",
+            filetypes=[("CSV Files", "*.csv"), ("Binary Sequences", "*.acseq")],
         )
         if not path:
             return
         try:
-            with open(path, mode="w", newline="") as file:
-                writer = csv.writer(file)
-                for name, click_type, click, monitor, color, delay in self.actions:
-                    row = [name, click_type, click[0], click[1]]
-                    row += [monitor[0], monitor[1]] if monitor else ["", ""]
-                    row += [color[0], color[1], color[2]] if color else ["", "", ""]
-                    row += [delay]
-                    writer.writerow(row)
+            write_file(path, self.runner.latest_program())
             messagebox.showinfo("Success", f"Saved to {path}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save: {e}")
 
     def load_actions(self):
-        path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
+        path = filedialog.askopenfilename(
+            filetypes=[("Sequences", "*.csv *.acseq"), ("All Files", "*.*")]
+        )
         if not path:
             return
         try:
-            with open(path, mode="r") as file:
-                reader = csv.reader(file)
-                self.actions.clear()
-                self.action_list.delete(0, tk.END)
-
-                # Map for display names
-                click_type_display = {
-                    "left": "Left Click",
-                    "right": "Right Click",
-                    "middle": "Middle Click",
-                    "move": "Move Only",
-                }
-
-                for row in reader:
-                    # ignore `#` lines as comments
-                    if not row or row[0].strip().startswith("#"):
-                        continue
-
-                    if len(row) >= 4:
-                        name = row[0] if row[0] else f"Action {len(self.actions) + 1}"
-                        click_type = (
-                            row[1]
-                            if row[1] in ["left", "right", "middle", "move"]
-                            else "left"
-                        )
-                        click_coords = (int(row[2]), int(row[3]))
-                        monitor_coords = None
-                        target_color = None
-                        delay_time = 0.5
-                        if len(row) >= 6 and row[4] and row[5]:
-                            monitor_coords = (int(row[4]), int(row[5]))
-                        if len(row) >= 9 and row[6] and row[7] and row[8]:
-                            target_color = (int(row[6]), int(row[7]), int(row[8]))
-                        if len(row) >= 10:
-                            delay_time = float(row[9])
-
-                        click_type_text = click_type_display.get(
-                            click_type, "Left Click"
-                        )
-
-                        if monitor_coords and target_color:
-                            action_text = f"{name} - {click_type_text} {click_coords}, monitor {monitor_coords} for color {target_color}, delay {delay_time}s"
-                        elif monitor_coords:
-                            action_text = f"{name} - {click_type_text} {click_coords}, monitor {monitor_coords} for any color change, delay {delay_time}s"
-                        else:
-                            action_text = f"{name} - {click_type_text} {click_coords}, no monitoring, delay {delay_time}s"
-                        self.actions.append(
-                            (
-                                name,
-                                click_type,
-                                click_coords,
-                                monitor_coords,
-                                target_color,
-                                delay_time,
-                            )
-                        )
-                        self.action_list.insert(tk.END, action_text)
+            program, _ = self.sequence_cache.load(path)
+            self.install_program(program, path)
             messagebox.showinfo("Success", f"Loaded from {path}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load: {e}")
 
-    def start_sequence(self):
-        if not self.actions:
-            messagebox.showinfo("Info", "No actions to perform.")
-            return
-        if self.running:
-            return
+    def read_run_settings(self):
+        """Read the Controls inputs on the Tk thread.
+
+        Returns ((repeat_count, policy, anchor, turbo, record_trace), None),
+        or (None, error message) if an input is invalid.
+        """
         repeat_text = self.repeat_input.get().strip()
         try:
             repeat_count = int(repeat_text) if repeat_text else 1
-            if repeat_count < 0:
-                messagebox.showwarning(
-                    "Input Error", "Repeat count must be non-negative."
-                )
-                return
         except ValueError:
-            messagebox.showwarning("Input Error", "Repeat count must be an integer.")
-            return
+            return None, "Repeat count must be an integer."
+        if repeat_count < 0:
+            return None, "Repeat count must be non-negative."
 
-        self.clear_monitor()
-        self.log_to_monitor("🚀 Starting action sequence...")
-
-        self.running = True
-        self.start_button["state"] = "disabled"
-        self.stop_button["state"] = "normal"
-        self.thread = threading.Thread(
-            target=self.run_actions, args=(repeat_count,), daemon=True
+        try:
+            policy = PollPolicy(
+                hot_ms=float(self.hot_poll_input.get().strip() or 200),
+                max_interval_ms=float(self.max_poll_input.get().strip() or 100),
+            )
+        except ValueError:
+            return None, "Polling times must be positive numbers."
+        anchor = (
+            ANCHOR_START
+            if self.delay_anchor_var.get() == "Action Start"
+            else ANCHOR_END
+        )
+        settings = (
+            repeat_count,
+            policy,
+            anchor,
+            self.turbo_var.get(),
+            self.trace_var.get(),
         )
-        self.thread.start()
+        return settings, None
 
-    def stop_sequence(self):
-        if self.running:
-            self.log_to_monitor("🛑 Stopping action sequence...")
-        self.running = False
-        self.start_button["state"] = "normal"
-        self.stop_button["state"] = "disabled"
+    def start_sequence(self):
+        settings, error = self.run_settings = self.read_run_settings()
+        if error:
+            messagebox.showwarning("Input Error", error)
+            return
+        if self.runner.idle.is_set():
+            self.launch_sequence(settings)
+        else:
+            # Waiting for the previous run to unwind would freeze the UI
+            threading.Thread(
+                target=self.launch_sequence, args=(settings,), daemon=True
+            ).start()
+
+    def launch_sequence(self, settings, triggered_at=None):
+        """Start a run from any thread; triggered_at is the hotkey press time"""
+        runner = self.runner
+        with self._launch_lock:
+            runner.swap_pending_program()
+            if not runner.program:
+                self.ui.call(messagebox.showinfo, "Info", "No actions to perform.")
+                return
+            if runner.running:
+                return
+            # A stopped run unwinds within milliseconds; never start a second one
+            if not runner.wait_idle(0.5):
+                self.log_to_monitor("⚠️ The previous run is still stopping, try again")
+                return
 
-    def run_actions(self, repeat_count):
-        try:
-            if repeat_count == 0:
-                cycle = 1
-                while self.running:
-                    self.log_to_monitor(f"🔄 Starting infinite cycle #{cycle}")
-                    self.execute_actions()
-                    cycle += 1
-            else:
-                for cycle in range(1, repeat_count + 1):
-                    if not self.running:
-                        break
-                    self.log_to_monitor(f"🔄 Starting cycle {cycle}/{repeat_count}")
-                    self.execute_actions()
-
-            if self.running:  # Completed normally
-                self.log_to_monitor("✅ Action sequence completed successfully!")
-        except Exception as e:
-            self.log_to_monitor(f"❌ Error during execution: {e}")
+            repeat_count, policy, anchor, turbo, record_trace = settings
+            runner.watcher.policy = policy
+            runner.scheduler.anchor = anchor
+            runner.turbo = turbo
+            self.clear_monitor()
+            recording = None
+            if record_trace:
+                recording = self.start_trace(repeat_count, anchor, turbo)
+            runner.prepare()
+            runner.triggered_at = triggered_at
+
+            self.log_to_monitor("🚀 Starting action sequence...")
+
+            runner.running = True
+            self._run_id += 1
+            self.thread = threading.Thread(
+                target=self.run_actions,
+                args=(repeat_count, self._run_id, recording),
+                daemon=True,
+            )
+            self.thread.start()
+        self.ui.call(self.show_running, True)
 
-        self.after(0, self.stop_sequence)
+    def stop_sequence(self, run_id=None):
+        """Stop the run; safe to call from any thread.
 
-    def execute_actions(self):
-        # Map for display names
-        click_type_display = {
-            "left": "Left Click",
-            "right": "Right Click",
-            "middle": "Middle Click",
-            "move": "Move Only",
-        }
+        With a run_id nothing happens unless that run is still the latest,
+        so a worker cleaning up never stops a run started after its own.
+        """
+        with self._launch_lock:
+            if run_id is not None and run_id != self._run_id:
+                return
+            if self.runner.running:
+                self.log_to_monitor("🛑 Stopping action sequence...")
+            self.runner.stop()
+            self.runner.swap_pending_program()
+        self.ui.call(self.show_running, False)
+
+    def show_running(self, running):
+        self.start_button["state"] = "disabled" if running else "normal"
+        self.stop_button["state"] = "normal" if running else "disabled"
+
+    def start_trace(self, repeat_count, anchor, turbo):
+        """Start a trace of the run about to start, next to its sequence file"""
+        sequence = self.file_watcher.path
+        stem = os.path.splitext(sequence)[0] if sequence else "run"
+        path = f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}{TRACE_EXTENSION}"
+        try:
+            return Recording(
+                self.runner,
+                path,
+                sequence=os.path.abspath(sequence) if sequence else None,
+                repeat=repeat_count,
+                turbo=turbo,
+                anchor=anchor,
+            )
+        except OSError as e:
+            self.log_to_monitor(f"⚠️ Not recording a trace: {e}")
+            return None
 
-        for i, (
-            name,
-            click_type,
-            click_pos,
-            monitor_pos,
-            target_color,
-            delay_time,
-        ) in enumerate(self.actions, 1):
-            if not self.running:
-                break
+    def run_actions(self, repeat_count, run_id, recording):
+        runner = self.runner
+        outcome = runner.run(repeat_count)
+        if recording is not None:
+            recording.close(
+                outcome=outcome, cycles=len(runner.cycle_times), elapsed=runner.elapsed
+            )
+            self.log_to_monitor(f"🎞️ Trace saved to {recording.path}")
+        self.stop_sequence(run_id)
 
-            # Log the action being performed
-            action_desc = click_type_display.get(click_type, "Left Click")
-            self.log_to_monitor(
-                f"🖱️ Action {i}: {name} - {action_desc} at ({click_pos[0]}, {click_pos[1]})"
+    def selected_background_sequence(self):
+        selection = self.background_list.curselection()
+        if not selection:
+            messagebox.showinfo("Info", "Select a background sequence first.")
+            return None
+        return list(self.engine.sequences)[selection[0]]
+
+    def add_background_sequence(self):
+        path = filedialog.askopenfilename(
+            filetypes=[("Sequences", "*.csv *.acseq"), ("All Files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            program, _ = self.sequence_cache.load(path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load: {e}")
+            return
+        name = base = os.path.basename(path)
+        number = 2
+        while name in self.engine.sequences:
+            name = f"{base} ({number})"
+            number += 1
+        self.engine.add(name, program)
+        self.show_background_sequences()
+
+    def start_background_sequence(self):
+        name = self.selected_background_sequence()
+        if name is None:
+            return
+        # Same polling and delay settings as the main sequence
+        try:
+            self.engine.watcher.policy = PollPolicy(
+                hot_ms=float(self.hot_poll_input.get().strip() or 200),
+                max_interval_ms=float(self.max_poll_input.get().strip() or 100),
             )
-            mouse_click(click_pos[0], click_pos[1], click_type)
-
-            # Monitor pixel if specified
-            if monitor_pos:
-                if target_color:
-                    # Monitor for specific color change
-                    self.log_to_monitor(
-                        f"👁️ Monitoring pixel ({monitor_pos[0]}, {monitor_pos[1]}) for color {target_color}"
-                    )
-                    last_log_time = time.time()
-
-                    while self.running and not colors_close(
-                        get_pixel_color(*monitor_pos), target_color
-                    ):
-                        current_time = time.time()
-                        if current_time - last_log_time >= 1.0:  # Log once per second
-                            current_color = get_pixel_color(*monitor_pos)
-                            self.log_to_monitor(
-                                f"⏳ Waiting ({monitor_pos[0]}, {monitor_pos[1]}) with color {current_color} to become {target_color}"
-                            )
-                            last_log_time = current_time
-                        time.sleep(0.1)
-
-                    if self.running:
-                        final_color = get_pixel_color(*monitor_pos)
-                        self.log_to_monitor(
-                            f"🎯 Color change detected! Pixel is now {final_color}"
-                        )
-                else:
-                    # Monitor for any color change
-                    initial_color = get_pixel_color(*monitor_pos)
-                    self.log_to_monitor(
-                        f"👁️ Monitoring pixel ({monitor_pos[0]}, {monitor_pos[1]}) for any color change (initial: {initial_color})"
-                    )
-                    last_log_time = time.time()
-
-                    while (
-                        self.running and get_pixel_color(*monitor_pos) == initial_color
-                    ):
-                        current_time = time.time()
-                        if current_time - last_log_time >= 1.0:  # Log once per second
-                            self.log_to_monitor(
-                                f"⏳ Waiting ({monitor_pos[0]}, {monitor_pos[1]}) with color {initial_color} for any change"
-                            )
-                            last_log_time = current_time
-                        time.sleep(0.1)
-
-                    if self.running:
-                        final_color = get_pixel_color(*monitor_pos)
-                        self.log_to_monitor(
-                            f"🎯 Color change detected! Pixel changed from {initial_color} to {final_color}"
-                        )
-
-            # Delay after action
-            if delay_time > 0 and self.running:
-                self.log_to_monitor(f"⏰ Waiting {delay_time} seconds...")
-                time.sleep(delay_time)
+        except ValueError:
+            messagebox.showwarning(
+                "Input Error", "Polling times must be positive numbers."
+            )
+            return
+        self.engine.anchor = (
+            ANCHOR_START
+            if self.delay_anchor_var.get() == "Action Start"
+            else ANCHOR_END
+        )
+        self.engine.start(name)
+        self.show_background_sequences()
+
+    def stop_background_sequence(self):
+        name = self.selected_background_sequence()
+        if name is not None:
+            self.engine.stop(name)
+
+    def remove_background_sequence(self):
+        name = self.selected_background_sequence()
+        if name is None:
+            return
+        if self.engine.sequences[name].running:
+            messagebox.showinfo("Info", "Stop the sequence before removing it.")
+            return
+        self.engine.remove(name)
+        self.show_background_sequences()
+
+    def show_background_sequences(self):
+        """List each background sequence with its state and throughput"""
+        listbox = self.background_list
+        lines = [
+            f"{seq.name} - {seq.state} - {seq.summary()}"
+            for seq in list(self.engine.sequences.values())
+        ]
+        selection = listbox.curselection()
+        if lines != list(listbox.get(0, tk.END)):
+            listbox.delete(0, tk.END)
+            for line in lines:
+                listbox.insert(tk.END, line)
+            for index in selection:
+                if index < len(lines):
+                    listbox.selection_set(index)
+
+    def refresh_background_list(self):
+        self.show_background_sequences()
+        self.after(500, self.refresh_background_list)
 
     def register_hotkey(self):
         hotkey_str = self.hotkey_input.get().strip().lower()
 
-        # Remove previous hotkey if any
-        if self.current_hotkey:
-            try:
-                keyboard.remove_hotkey(self.current_hotkey)
-            except Exception:
-                pass
-
         try:
             # ✅ Register toggle instead of only start
-            self.current_hotkey = keyboard.add_hotkey(hotkey_str, self.toggle_sequence)
+            self.hotkeys.bind("toggle", hotkey_str, self.toggle_sequence)
             messagebox.showinfo(
                 "Hotkey", f"Hotkey '{hotkey_str}' registered as Start/Stop toggle."
             )
         except Exception as e:
             messagebox.showwarning("Hotkey Error", f"Failed to register: {e}")
 
-    def toggle_sequence(self):
-        """Start or stop depending on current running state."""
-        if self.running:
+    def toggle_sequence(self, pressed_at):
+        """Start or stop depending on current running state.
+
+        Runs on the hotkey dispatcher thread, so starting uses the Controls
+        settings last read on the Tk thread instead of waiting for it.
+        """
+        if self.runner.running:
             self.stop_sequence()
             print("⏹️ Sequence stopped via hotkey.")
-        else:
-            self.start_sequence()
-            print("▶️ Sequence started via hotkey.")
+            return
+        settings, error = self.run_settings
+        if error:
+            self.ui.call(messagebox.showwarning, "Input Error", error)
+            return
+        self.launch_sequence(settings, pressed_at)
+        print("▶️ Sequence started via hotkey.")
 
     def get_config_path(self):
         """Return a writable path for the config file"""
@@ -1099,7 +1495,7 @@ class AutoClickerApp(tk.Tk):
         """Browse and select a CSV file for preloading"""
         path = filedialog.askopenfilename(
             title=f"Select CSV for {hotkey.upper()}",
-            filetypes=[("CSV Files", "*.csv"), ("All Files", "*.*")],
+            filetypes=[("Sequences", "*.csv *.acseq"), ("All Files", "*.*")],
         )
         if path:
             self.preload_csv_paths[hotkey] = path
@@ -1120,21 +1516,17 @@ class AutoClickerApp(tk.Tk):
     def register_preload_hotkeys(self):
         """Register hotkeys for quick CSV loading"""
         for hotkey in ["alt+2", "alt+3", "alt+4"]:
-            if self.preload_hotkeys.get(hotkey):
-                try:
-                    keyboard.remove_hotkey(self.preload_hotkeys[hotkey])
-                except Exception:
-                    pass
-
             try:
-                self.preload_hotkeys[hotkey] = keyboard.add_hotkey(
-                    hotkey, lambda k=hotkey: self.quick_load_csv(k)
+                self.hotkeys.bind(
+                    f"preload {hotkey}",
+                    hotkey,
+                    lambda pressed_at, k=hotkey: self.quick_load_csv(k),
                 )
             except Exception as e:
                 print(f"Failed to register {hotkey}: {e}")
 
     def quick_load_csv(self, hotkey):
-        """Quick load CSV from preloaded path"""
+        """Quick load CSV from preloaded path, on the hotkey dispatcher thread"""
         path = self.preload_csv_paths.get(hotkey, "")
 
         if not path:
@@ -1145,72 +1537,14 @@ class AutoClickerApp(tk.Tk):
             self.log_to_monitor(f"❌ {hotkey.upper()}: File not found - {path}")
             return
 
-        # Load the CSV file
+        # Load the CSV file, skipping the read entirely if it is unchanged
         try:
-            with open(path, mode="r") as file:
-                reader = csv.reader(file)
-                self.actions.clear()
-                self.action_list.delete(0, tk.END)
-
-                # Map for display names
-                click_type_display = {
-                    "left": "Left Click",
-                    "right": "Right Click",
-                    "middle": "Middle Click",
-                    "move": "Move Only",
-                }
-
-                action_count = 0
-                for row in reader:
-                    # ignore `#` lines as comments
-                    if not row or row[0].strip().startswith("#"):
-                        continue
-
-                    if len(row) >= 4:
-                        name = row[0] if row[0] else f"Action {len(self.actions) + 1}"
-                        click_type = (
-                            row[1]
-                            if row[1] in ["left", "right", "middle", "move"]
-                            else "left"
-                        )
-                        click_coords = (int(row[2]), int(row[3]))
-                        monitor_coords = None
-                        target_color = None
-                        delay_time = 0.5
-                        if len(row) >= 6 and row[4] and row[5]:
-                            monitor_coords = (int(row[4]), int(row[5]))
-                        if len(row) >= 9 and row[6] and row[7] and row[8]:
-                            target_color = (int(row[6]), int(row[7]), int(row[8]))
-                        if len(row) >= 10:
-                            delay_time = float(row[9])
-
-                        click_type_text = click_type_display.get(
-                            click_type, "Left Click"
-                        )
-
-                        if monitor_coords and target_color:
-                            action_text = f"{name} - {click_type_text} {click_coords}, monitor {monitor_coords} for color {target_color}, delay {delay_time}s"
-                        elif monitor_coords:
-                            action_text = f"{name} - {click_type_text} {click_coords}, monitor {monitor_coords} for any color change, delay {delay_time}s"
-                        else:
-                            action_text = f"{name} - {click_type_text} {click_coords}, no monitoring, delay {delay_time}s"
-
-                        self.actions.append(
-                            (
-                                name,
-                                click_type,
-                                click_coords,
-                                monitor_coords,
-                                target_color,
-                                delay_time,
-                            )
-                        )
-                        self.action_list.insert(tk.END, action_text)
-                        action_count += 1
-
+            program, cached = self.sequence_cache.load(path)
+            self.install_program(program, path)
             filename = os.path.basename(path)
+            source = " (cached)" if cached else ""
             self.log_to_monitor(
-                f"⚡ {hotkey.upper()}: Loaded {action_count} actions from {filename}"
+                f"⚡ {hotkey.upper()}: Loaded {len(program)} actions from {filename}{source}"
             )
 
         except Exception as e:
@@ -1218,7 +1552,16 @@ class AutoClickerApp(tk.Tk):
 
     def close_window(self):
         self.stop_sequence()
+        self.hotkeys.close()
         keyboard.unhook_all()
+        if self.macro_recorder.recording:
+            self.macro_recorder.stop()
+        self.engine.close()
+        self.runner.watcher.stop()
+        self.file_watcher.stop()
+        self.monitor_log.close()
+        capture.get_backend().close()
+        inputs.get_backend().close()
         self.destroy()
 
 
@@ -0,0 +1,160 @@
+"""Per-run metrics.
+
+SequenceRunner feeds a RunMetrics with the duration of every action and
+monitor wait while it runs, keeping the configured delay after an action
+apart from the time the action itself took.  The metrics panel reads
+snapshot() a few times a second, and export() saves the same numbers as
+JSON once a run is over, so it is easy to see which action or wait
+dominates the cycle time of a long loop.
+"""
+
+import collections
+import json
+import time
+
+# Wait durations kept for the percentiles; older ones only count in max
+MAX_WAIT_SAMPLES = 10_000
+
+
+def percentile(ordered, fraction):
+    """Value at fraction (0-1) of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class RunMetrics:
+    """Counters and timings of one run.
+
+    Only the runner thread writes, without locking; snapshot() copies the
+    containers in single C-level calls, which the GIL keeps consistent.
+    """
+
+    def __init__(self):
+        self.start((), 0)
+
+    def start(self, program, reads):
+        """Reset for a new run of program; reads is the run's screen reads so far"""
+        self.program = program
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.outcome = None
+        self.cycles = 0
+        # index -> [count, total seconds, max seconds, wait seconds,
+        #           delay seconds]; the delay is not part of the others
+        self.actions = {}
+        self.waits = collections.deque(maxlen=MAX_WAIT_SAMPLES)
+        self.wait_count = 0
+        self.wait_max = 0.0
+        self._reads_at_start = reads
+
+    def record_action(self, index, duration, delay=0.0):
+        entry = self.actions.get(index)
+        if entry is None:
+            self.actions[index] = [1, duration, duration, 0.0, delay]
+            return
+        entry[0] += 1
+        entry[1] += duration
+        if duration > entry[2]:
+            entry[2] = duration
+        entry[4] += delay
+
+    def record_wait(self, index, duration):
+        self.waits.append(duration)
+        self.wait_count += 1
+        if duration > self.wait_max:
+            self.wait_max = duration
+        entry = self.actions.get(index)
+        if entry is None:
+            entry = self.actions[index] = [0, 0.0, 0.0, 0.0, 0.0]
+        entry[3] += duration
+
+    def finish(self, outcome):
+        self.finished_at = time.perf_counter()
+        self.outcome = outcome
+
+    def _action_name(self, index):
+        try:
+            return self.program[index - 1].name
+        except (IndexError, TypeError):
+            return ""
+
+    def snapshot(self, clicks=0, drift=0.0, top=None, reads=0):
+        """Return the metrics as a dict of plain numbers.
+
+        clicks counts the actions that pressed a button and reads the
+        run's screen reads.  Actions are sorted by the total time spent in
+        them, delays left out, and cut to the first top entries if top is
+        given.  Their times are means per run of the action.
+        """
+        waits = sorted(self.waits)
+        wait_count = self.wait_count
+        wait_max = self.wait_max
+        actions = [(index, *entry) for index, entry in list(self.actions.items())]
+        cycles = self.cycles
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at
+        reads -= self._reads_at_start
+        actions.sort(key=lambda item: item[2], reverse=True)
+        busy = sum(item[2] for item in actions) or 1.0
+        if top is not None:
+            actions = actions[:top]
+        return {
+            "outcome": self.outcome,
+            "elapsed_s": elapsed,
+            "cycles": cycles,
+            "cycles_per_minute": cycles / elapsed * 60 if elapsed > 0 else 0.0,
+            "clicks": clicks,
+            "screen_reads": reads,
+            "screen_reads_per_s": reads / elapsed if elapsed > 0 else 0.0,
+            "drift_ms": drift * 1000,
+            "waits": {
+                "count": wait_count,
+                "p50_ms": percentile(waits, 0.5) * 1000,
+                "p95_ms": percentile(waits, 0.95) * 1000,
+                "max_ms": wait_max * 1000,
+            },
+            "actions": [
+                {
+                    "index": index,
+                    "name": self._action_name(index),
+                    "runs": count,
+                    "mean_ms": total / count * 1000 if count else 0.0,
+                    "max_ms": longest * 1000,
+                    "wait_mean_ms": waited / count * 1000 if count else 0.0,
+                    "delay_mean_ms": delayed / count * 1000 if count else 0.0,
+                    "share": total / busy,
+                }
+                for index, count, total, longest, waited, delayed in actions
+            ],
+        }
+
+
+def format_lines(snapshot):
+    """Compact text lines of a snapshot, for the metrics panel"""
+    waits = snapshot["waits"]
+    lines = [
+        f"Cycles {snapshot['cycles']} ({snapshot['cycles_per_minute']:.1f}/min)"
+        f" | Clicks {snapshot['clicks']}"
+        f" | Reads {snapshot['screen_reads_per_s']:.0f}/s"
+        f" | Drift {snapshot['drift_ms']:.2f} ms",
+        f"Waits {waits['count']}: p50 {waits['p50_ms']:.1f} ms,"
+        f" p95 {waits['p95_ms']:.1f} ms, max {waits['max_ms']:.1f} ms",
+    ]
+    slowest = [
+        f"#{a['index']} {a['name']} {a['share']:.0%} ({a['mean_ms']:.1f} ms)"
+        for a in snapshot["actions"][:3]
+    ]
+    if slowest:
+        lines.append("Slowest: " + " | ".join(slowest))
+    return lines
+
+
+def export(path, snapshot, **info):
+    """Write a snapshot and any extra fields (e.g. the sequence file) as JSON"""
+    document = dict(info)
+    document["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    document.update(snapshot)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=2)
+        file.write("\n")
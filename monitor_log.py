@@ -0,0 +1,97 @@
+"""Bounded log pipeline for the Action Monitor panel.
+
+Worker threads append messages to a ring buffer without touching Tk.  The
+UI drains it in batches at a fixed frame rate and keeps only the last lines
+in the widget; anything pushed out of the buffer or the widget is streamed
+to a rotating log file instead of being kept in memory.
+"""
+
+import collections
+import logging
+import logging.handlers
+import time
+
+# Marker queued by clear() so the widget is emptied in order with messages
+CLEAR = None
+
+
+class MonitorLog:
+    """Ring buffer of monitor lines shared between threads"""
+
+    def __init__(self, capacity=2000, log_path=None, max_bytes=1_000_000, backups=3):
+        # capacity should be at least the widget line limit, so anything that
+        # overflows the buffer is newer than everything in the widget
+        self.capacity = capacity
+        self.dropped = 0
+        # deque.append/popleft are atomic, so producers need no lock
+        self._pending = collections.deque()
+        self._overflow = collections.deque()
+        # Set when a CLEAR is pushed out of the buffer, see drain
+        self._cleared = False
+
+        self._file_logger = None
+        if log_path:
+            handler = logging.handlers.RotatingFileHandler(
+                log_path,
+                maxBytes=max_bytes,
+                backupCount=backups,
+                encoding="utf-8",
+                delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file_logger = logging.getLogger(f"autoclicker.monitor.{id(self)}")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+
+    def append(self, message):
+        """Queue a message with a timestamp; safe to call from any thread"""
+        self._pending.append(f"[{time.strftime('%H:%M:%S')}] {message}\n")
+        while len(self._pending) > self.capacity:
+            try:
+                line = self._pending.popleft()
+            except IndexError:
+                break
+            if line is CLEAR:
+                self._cleared = True
+            else:
+                self._overflow.append(line)
+                self.dropped += 1
+        if len(self._overflow) > self.capacity:
+            # The UI isn't draining, so the file gets these from here instead
+            self.archive("".join(self.take_overflow()))
+
+    def clear(self):
+        self._pending.append(CLEAR)
+
+    def drain(self):
+        """Return the queued lines in order, with CLEAR marking a reset"""
+        lines = self._take(self._pending)
+        if self._cleared:
+            # A CLEAR pushed out of the buffer came before all of these
+            self._cleared = False
+            lines.insert(0, CLEAR)
+        return lines
+
+    def take_overflow(self):
+        """Return lines that were pushed out before they could be displayed"""
+        return self._take(self._overflow)
+
+    @staticmethod
+    def _take(queue):
+        lines = []
+        for _ in range(len(queue)):
+            lines.append(queue.popleft())
+        return lines
+
+    def archive(self, text):
+        """Stream lines that leave the monitor to the log file"""
+        if self._file_logger and text.strip():
+            self._file_logger.info(text.rstrip("\n"))
+
+    def close(self):
+        self.archive("".join(self.take_overflow()))
+        if self._file_logger:
+            for handler in list(self._file_logger.handlers):
+                handler.close()
+                self._file_logger.removeHandler(handler)
@@ -0,0 +1,379 @@
+"""Macro recording.
+
+A MouseHook collects the user's mouse events as (timestamp, kind, x, y,
+button) tuples, doing nothing in its callback but appending to a deque,
+so recording does not slow the pointer down.  When recording stops the
+raw stream, easily thousands of moves, is reduced to the steps that
+matter: every button press becomes a click action, the path between two
+clicks is simplified with Ramer-Douglas-Peucker so only its corners are
+kept as moves, and delays are rounded to a fixed step.  Drags are
+recorded as a click where the button went down.
+"""
+
+import collections
+import sys
+import threading
+import time
+
+from inputs import BUTTONS, DOWN, LEFT, MIDDLE, MOVE, RIGHT, UP
+
+# Path points closer than this (pixels) to the simplified line are dropped
+DEFAULT_TOLERANCE = 8
+# Delays are rounded to a multiple of this many seconds
+DEFAULT_QUANTUM = 0.05
+
+# Action names of recorded steps, numbered in order
+STEP_NAMES = {
+    LEFT: "Click",
+    RIGHT: "Right click",
+    MIDDLE: "Middle click",
+    "move": "Move",
+}
+
+
+class MouseHook:
+    """Base class for sources of the user's mouse events.
+
+    Between start and stop, events are appended to ``events`` as
+    (perf_counter timestamp, kind, x, y, button) tuples.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        # deque.append is atomic, so hook callbacks take no lock
+        self.events = collections.deque()
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def take(self):
+        """Return and forget the events collected so far"""
+        events = []
+        popleft = self.events.popleft
+        while self.events:
+            events.append(popleft())
+        return events
+
+
+class PollingMouseHook(MouseHook):
+    """Samples the pointer on a thread, for systems without an input hook.
+
+    query returns (x, y, held buttons); presses shorter than the interval
+    can be missed.
+    """
+
+    name = "polling"
+
+    def __init__(self, query, interval=0.005):
+        super().__init__()
+        self.query = query
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        append = self.events.append
+        last_x, last_y, last_held = self.query()
+        while not self._stopped.wait(self.interval):
+            x, y, held = self.query()
+            now = time.perf_counter()
+            if (x, y) != (last_x, last_y):
+                append((now, MOVE, x, y, None))
+                last_x, last_y = x, y
+            if held != last_held:
+                for button in BUTTONS:
+                    if (button in held) != (button in last_held):
+                        append((now, DOWN if button in held else UP, x, y, button))
+                last_held = held
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+
+class LowLevelMouseHook(MouseHook):
+    """Windows WH_MOUSE_LL hook, run on its own message loop thread.
+
+    Events injected by a running sequence carry the injected flag and are
+    not recorded.
+    """
+
+    name = "lowlevel"
+
+    WH_MOUSE_LL = 14
+    WM_QUIT = 0x0012
+    LLMHF_INJECTED = 0x01
+    MESSAGES = {
+        0x0200: (MOVE, None),
+        0x0201: (DOWN, LEFT),
+        0x0202: (UP, LEFT),
+        0x0204: (DOWN, RIGHT),
+        0x0205: (UP, RIGHT),
+        0x0207: (DOWN, MIDDLE),
+        0x0208: (UP, MIDDLE),
+    }
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        from ctypes import wintypes
+
+        self._ctypes = ctypes
+        self.user32 = ctypes.windll.user32
+        self.kernel32 = ctypes.windll.kernel32
+
+        class MSLLHOOKSTRUCT(ctypes.Structure):
+            _fields_ = [
+                ("x", wintypes.LONG),
+                ("y", wintypes.LONG),
+                ("mouseData", wintypes.DWORD),
+                ("flags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t),
+            ]
+
+        self._HOOKSTRUCT = MSLLHOOKSTRUCT
+        self._MSG = wintypes.MSG
+        self._HOOKPROC = ctypes.WINFUNCTYPE(
+            ctypes.c_ssize_t, ctypes.c_int, wintypes.WPARAM, wintypes.LPARAM
+        )
+        self.user32.SetWindowsHookExW.restype = wintypes.HHOOK
+        self.user32.SetWindowsHookExW.argtypes = [
+            ctypes.c_int,
+            self._HOOKPROC,
+            wintypes.HINSTANCE,
+            wintypes.DWORD,
+        ]
+        self.user32.CallNextHookEx.restype = ctypes.c_ssize_t
+        self.user32.CallNextHookEx.argtypes = [
+            wintypes.HHOOK,
+            ctypes.c_int,
+            wintypes.WPARAM,
+            wintypes.LPARAM,
+        ]
+        self.user32.UnhookWindowsHookEx.argtypes = [wintypes.HHOOK]
+        self.user32.GetMessageW.argtypes = [
+            ctypes.POINTER(wintypes.MSG),
+            wintypes.HWND,
+            wintypes.UINT,
+            wintypes.UINT,
+        ]
+        self.user32.PostThreadMessageW.argtypes = [
+            wintypes.DWORD,
+            wintypes.UINT,
+            wintypes.WPARAM,
+            wintypes.LPARAM,
+        ]
+        self.kernel32.GetModuleHandleW.restype = wintypes.HMODULE
+        self._thread = None
+        self._thread_id = None
+        self._ready = threading.Event()
+        # The OSError of a hook that could not be installed, raised by start
+        self._error = None
+
+    def start(self):
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(1.0)
+        if self._error is not None:
+            self._thread.join(1.0)
+            self._thread = None
+            raise self._error
+
+    def _run(self):
+        ctypes = self._ctypes
+        user32 = self.user32
+        append = self.events.append
+        messages = self.MESSAGES
+        hookstruct = self._HOOKSTRUCT
+        injected = self.LLMHF_INJECTED
+
+        # Runs for every mouse event on the desktop: append and pass it on
+        def callback(code, wparam, lparam):
+            if code >= 0:
+                event = messages.get(wparam)
+                if event is not None:
+                    info = hookstruct.from_address(lparam)
+                    if not info.flags & injected:
+                        kind, button = event
+                        append((time.perf_counter(), kind, info.x, info.y, button))
+            return user32.CallNextHookEx(None, code, wparam, lparam)
+
+        proc = self._HOOKPROC(callback)  # Kept alive for the hook's lifetime
+        hook = user32.SetWindowsHookExW(
+            self.WH_MOUSE_LL, proc, self.kernel32.GetModuleHandleW(None), 0
+        )
+        if not hook:
+            self._error = ctypes.WinError()
+            self._ready.set()
+            return
+        self._thread_id = self.kernel32.GetCurrentThreadId()
+        self._ready.set()
+        try:
+            msg = self._MSG()
+            while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+                pass
+        finally:
+            user32.UnhookWindowsHookEx(hook)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+        self._thread.join(1.0)
+        self._thread = None
+
+
+def create_default_hook():
+    if sys.platform == "win32":
+        return LowLevelMouseHook()
+    import x11
+
+    if x11.available():
+        return PollingMouseHook(x11.get_connection().pointer_state)
+    raise RuntimeError(f"No mouse hook available for {sys.platform}")
+
+
+# --- Simplification ---
+def _farthest(points, first, last):
+    """(index, squared distance) of the point farthest from segment first-last"""
+    ax, ay = points[first]
+    bx, by = points[last]
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    farthest, index = 0.0, None
+    for i in range(first + 1, last):
+        px, py = points[i]
+        px -= ax
+        py -= ay
+        if length:
+            t = (px * dx + py * dy) / length
+            if t > 1.0:
+                t = 1.0
+            elif t < 0.0:
+                t = 0.0
+            px -= t * dx
+            py -= t * dy
+        d = px * px + py * py
+        if d > farthest:
+            farthest, index = d, i
+    return index, farthest
+
+
+def simplify_path(points, tolerance=DEFAULT_TOLERANCE):
+    """Indices of the points Ramer-Douglas-Peucker keeps, first and last included"""
+    if len(points) < 3:
+        return list(range(len(points)))
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    limit = tolerance * tolerance
+    # An explicit stack, so long paths do not hit the recursion limit
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        index, farthest = _farthest(points, first, last)
+        if index is not None and farthest > limit:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def quantize(delay, quantum=DEFAULT_QUANTUM):
+    """Round a delay to the nearest multiple of quantum (seconds)"""
+    if quantum <= 0:
+        return round(delay, 3)
+    return round(round(delay / quantum) * quantum, 3)
+
+
+def _inside(rect, x, y):
+    left, top, width, height = rect
+    return left <= x < left + width and top <= y < top + height
+
+
+def simplify(
+    events,
+    tolerance=DEFAULT_TOLERANCE,
+    quantum=DEFAULT_QUANTUM,
+    moves=True,
+    exclude=None,
+    first_number=1,
+):
+    """Turn raw hook events into sequence rows.
+
+    Rows have the fields compile_action takes after the index, and are
+    named "Click 1", "Move 2" and so on from first_number.  With moves
+    False only clicks are kept.  Presses inside the exclude rectangle
+    (left, top, width, height), e.g. the recorder's own window, are dropped
+    with the path leading to them.
+    """
+    steps = []  # (timestamp, click type, x, y)
+    path = []  # (x, y) of the moves since the last press
+    times = []
+    for t, kind, x, y, button in events:
+        if kind == MOVE:
+            path.append((x, y))
+            times.append(t)
+            continue
+        if kind != DOWN:
+            continue
+        if exclude is not None and _inside(exclude, x, y):
+            path, times = [], []
+            continue
+        if moves and path:
+            # The path runs from the previous step to this press
+            start = [(steps[-1][2], steps[-1][3])] if steps else []
+            points = start + path + [(x, y)]
+            for i in simplify_path(points, tolerance)[1:-1]:
+                px, py = points[i]
+                steps.append((times[i - len(start)], "move", px, py))
+        steps.append((t, button, x, y))
+        path, times = [], []
+
+    rows = []
+    for n, (t, click_type, x, y) in enumerate(steps):
+        delay = quantize(steps[n + 1][0] - t, quantum) if n + 1 < len(steps) else 0
+        name = f"{STEP_NAMES[click_type]} {first_number + n}"
+        rows.append((name, click_type, (x, y), None, None, delay, None, None, None))
+    return rows
+
+
+class MacroRecorder:
+    """Records the user's mouse into sequence rows"""
+
+    def __init__(self, hook=None, tolerance=DEFAULT_TOLERANCE, quantum=DEFAULT_QUANTUM):
+        self.hook = hook
+        self.tolerance = tolerance
+        self.quantum = quantum
+        self.recording = False
+        self.raw_count = 0
+
+    def start(self):
+        if self.hook is None:
+            self.hook = create_default_hook()
+        self.hook.take()
+        self.hook.start()
+        self.recording = True
+
+    def stop(self, moves=True, exclude=None, first_number=1):
+        """Stop recording and return the simplified rows, see simplify"""
+        self.hook.stop()
+        self.recording = False
+        events = self.hook.take()
+        self.raw_count = len(events)
+        return simplify(
+            events, self.tolerance, self.quantum, moves, exclude, first_number
+        )
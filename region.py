@@ -0,0 +1,180 @@
+"""Rectangle monitor conditions.
+
+A Region turns a monitor position into a rectangle that holds when any,
+all, or at least a percentage of its pixels match.  Pixels are counted
+over one captured frame, with NumPy when it is installed; without it a
+plain Python loop gives the same answers, only slower.
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:  # Optional, only makes large regions faster
+    np = None
+
+from capture import BYTES_PER_PIXEL
+
+MATCH_ANY = "any"
+MATCH_ALL = "all"
+MATCH_PERCENT = "percent"
+
+DEFAULT_TOLERANCE = 10
+
+
+def parse_match(text):
+    """Parse 'any', 'all' or 'NN%' into (mode, percent)"""
+    text = text.strip().lower()
+    if text in (MATCH_ANY, MATCH_ALL):
+        return text, None
+    number = text[:-1] if text.endswith("%") else text
+    try:
+        percent = float(number)
+    except ValueError:
+        raise ValueError(f"match must be any, all or a percentage, not '{text}'")
+    if not 0 < percent <= 100:
+        raise ValueError("match percentage must be between 0 and 100")
+    return MATCH_PERCENT, percent
+
+
+class Region:
+    """A width x height rectangle anchored at the monitor position"""
+
+    __slots__ = ("width", "height", "mode", "percent", "tolerance")
+
+    def __init__(
+        self, width, height, mode=MATCH_ANY, percent=None, tolerance=DEFAULT_TOLERANCE
+    ):
+        if width < 1 or height < 1:
+            raise ValueError("region size must be at least 1x1")
+        if mode not in (MATCH_ANY, MATCH_ALL, MATCH_PERCENT):
+            raise ValueError(f"unknown match mode '{mode}'")
+        if mode == MATCH_PERCENT and not (percent and 0 < percent <= 100):
+            raise ValueError("match percentage must be between 0 and 100")
+        if not 0 <= tolerance <= 255:
+            raise ValueError("tolerance must be 0-255")
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.percent = percent if mode == MATCH_PERCENT else None
+        self.tolerance = tolerance
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return (
+            f"Region({self.size_text()}, match={self.match_text()}, "
+            f"tolerance={self.tolerance})"
+        )
+
+    def rect(self, origin):
+        x, y = origin
+        return (x, y, self.width, self.height)
+
+    def required(self):
+        """Number of matching pixels needed for the condition to hold"""
+        total = self.width * self.height
+        if self.mode == MATCH_ANY:
+            return 1
+        if self.mode == MATCH_ALL:
+            return total
+        return max(1, math.ceil(total * self.percent / 100))
+
+    def size_text(self):
+        return f"{self.width}x{self.height}"
+
+    def match_text(self):
+        if self.mode == MATCH_PERCENT:
+            return f"{self.percent:g}%"
+        return self.mode
+
+    def describe(self):
+        """Short phrase for logs, e.g. 'all pixels' or '75% of pixels'"""
+        if self.mode == MATCH_ANY:
+            return "any pixel"
+        if self.mode == MATCH_ALL:
+            return "all pixels"
+        return f"{self.percent:g}% of pixels"
+
+
+def snapshot(frame):
+    """Copy a frame's pixels into packed BGRA bytes, for later comparison"""
+    row_bytes = frame.width * BYTES_PER_PIXEL
+    data = memoryview(frame.data).cast("B")
+    if frame.stride == row_bytes:
+        return bytes(data[: row_bytes * frame.height])
+    return b"".join(
+        data[y * frame.stride : y * frame.stride + row_bytes]
+        for y in range(frame.height)
+    )
+
+
+# The B, G and R bytes of a little-endian BGRA pixel read as one word
+_COLOR_BYTES = 0x00010101
+
+
+def _rows(frame):
+    """A (height, width * 4) view of the frame's BGRA bytes, without copying"""
+    buf = np.frombuffer(frame.data, dtype=np.uint8, count=frame.stride * frame.height)
+    rows = buf.reshape(frame.height, frame.stride)
+    return rows[:, : frame.width * BYTES_PER_PIXEL]
+
+
+def _count_pixels(mask):
+    """Count pixels whose B, G and R flags are all set in a byte mask"""
+    words = mask.view("<u4")
+    return int(np.count_nonzero((words & _COLOR_BYTES) == _COLOR_BYTES))
+
+
+def count_matching(frame, target, tolerance):
+    """Number of pixels in frame within tolerance of the (r, g, b) target"""
+    r, g, b = target
+    if np is not None:
+        low = [max(c - tolerance, 0) for c in (b, g, r)] + [0]
+        span = [min(c + tolerance, 255) - lo for c, lo in zip((b, g, r), low)] + [255]
+        low_row = np.tile(np.array(low, np.uint8), frame.width)
+        span_row = np.tile(np.array(span, np.uint8), frame.width)
+        # Bytes below low wrap around past the span, so one compare checks both
+        return _count_pixels(_rows(frame) - low_row <= span_row)
+
+    data = frame.data
+    row_bytes = frame.width * BYTES_PER_PIXEL
+    count = 0
+    for y in range(frame.height):
+        start = y * frame.stride
+        for i in range(start, start + row_bytes, BYTES_PER_PIXEL):
+            if (
+                abs(data[i] - b) <= tolerance
+                and abs(data[i + 1] - g) <= tolerance
+                and abs(data[i + 2] - r) <= tolerance
+            ):
+                count += 1
+    return count
+
+
+def count_changed(frame, initial, tolerance):
+    """Number of pixels that differ from a snapshot by more than tolerance"""
+    if np is not None:
+        rows = _rows(frame)
+        before = np.frombuffer(initial, dtype=np.uint8).reshape(rows.shape)
+        diff = np.maximum(rows, before)
+        diff -= np.minimum(rows, before)
+        return frame.width * frame.height - _count_pixels(diff <= tolerance)
+
+    data = frame.data
+    row_bytes = frame.width * BYTES_PER_PIXEL
+    count = 0
+    for y in range(frame.height):
+        i = y * frame.stride
+        j = y * row_bytes
+        for k in range(0, row_bytes, BYTES_PER_PIXEL):
+            if (
+                abs(data[i + k] - initial[j + k]) > tolerance
+                or abs(data[i + k + 1] - initial[j + k + 1]) > tolerance
+                or abs(data[i + k + 2] - initial[j + k + 2]) > tolerance
+            ):
+                count += 1
+    return count
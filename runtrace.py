@@ -0,0 +1,494 @@
+"""Run traces and offline replay.
+
+A trace records what a run saw and did: every frame the capture backend
+returned to the monitor loops, every batch of mouse events, the start of
+every action and the outcome of every wait.  Replaying feeds the recorded
+frames back through a ReplayCapture to the same SequenceRunner, with
+polls back to back and delays scaled down, so a misbehaving loop can be
+reproduced and profiled on any machine faster than it ran.
+
+Frames repeat a lot while a wait polls, so each rectangle is declared
+once and a frame identical to the previous one of its rectangle is a
+7-byte record.
+
+Layout (little endian): magic "ACTR", version u16, reserved u16, then
+records of tag u8 and microseconds since the previous record u32:
+    META    length u32, UTF-8 JSON (sequence, repeat, turbo, anchor)
+    RECT    rect id u16, left i32, top i32, width u16, height u16
+    FRAME   rect id u16, encoding u8, length u32, packed BGRA pixels
+    SAME    rect id u16; the previous frame of the rectangle again
+    INPUT   count u8, count x (kind u8, button u8, x i32, y i32)
+    ACTION  action index u32
+    WAIT    action index u32, matched u8, seconds f64
+    END     length u32, UTF-8 JSON (outcome, cycles, elapsed)
+"""
+
+import json
+import struct
+import threading
+import time
+import zlib
+
+import capture
+import inputs
+import region
+from executor import SequenceRunner
+from scheduler import ANCHOR_END, DeadlineScheduler
+from watcher import PixelWatcher, PollPolicy
+
+MAGIC = b"ACTR"
+VERSION = 1
+EXTENSION = ".actrace"
+
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<BI")
+RECT = struct.Struct("<HiiHH")
+FRAME = struct.Struct("<HBI")
+SAME = struct.Struct("<H")
+COUNT = struct.Struct("<B")
+EVENT = struct.Struct("<BBii")
+ACTION = struct.Struct("<I")
+WAIT = struct.Struct("<IBd")
+BLOB = struct.Struct("<I")
+
+# Record tags
+TAG_META = 1
+TAG_RECT = 2
+TAG_FRAME = 3
+TAG_SAME = 4
+TAG_INPUT = 5
+TAG_ACTION = 6
+TAG_WAIT = 7
+TAG_END = 8
+
+# Frame encodings
+RAW = 0
+ZLIB = 1
+
+# Frames smaller than this are stored raw, compressing them does not pay
+MIN_COMPRESS = 64
+MAX_DELTA_US = 0xFFFFFFFF
+
+_KINDS = (inputs.MOVE, inputs.DOWN, inputs.UP)
+_KIND_CODES = {kind: code for code, kind in enumerate(_KINDS)}
+_BUTTONS = (None,) + inputs.BUTTONS
+_BUTTON_CODES = {button: code for code, button in enumerate(_BUTTONS)}
+
+
+class TraceWriter:
+    """Writes the records of one run; safe to use from several threads"""
+
+    def __init__(self, path, **meta):
+        self.path = path
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+        self._last = time.perf_counter()
+        # rect -> [id, last packed frame]
+        self._rects = {}
+        self.frames = 0
+        self.repeats = 0
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0))
+        self._blob(TAG_META, meta)
+
+    def _record(self, tag, *parts):
+        """Write one record; call with the lock held"""
+        now = time.perf_counter()
+        delta = min(MAX_DELTA_US, max(0, round((now - self._last) * 1e6)))
+        self._last = now
+        self._file.write(RECORD.pack(tag, delta) + b"".join(parts))
+
+    def _blob(self, tag, values):
+        raw = json.dumps(values).encode("utf-8")
+        with self._lock:
+            self._record(tag, BLOB.pack(len(raw)), raw)
+
+    def frame(self, frame):
+        rect = (frame.left, frame.top, frame.width, frame.height)
+        pixels = region.snapshot(frame)
+        with self._lock:
+            if self._file is None:
+                return
+            entry = self._rects.get(rect)
+            if entry is None:
+                entry = self._rects[rect] = [len(self._rects), None]
+                self._record(TAG_RECT, RECT.pack(entry[0], *rect))
+            elif entry[1] == pixels:
+                self.repeats += 1
+                self._record(TAG_SAME, SAME.pack(entry[0]))
+                return
+            entry[1] = pixels
+            encoding, data = RAW, pixels
+            if len(pixels) >= MIN_COMPRESS:
+                packed = zlib.compress(pixels, 1)
+                if len(packed) < len(pixels):
+                    encoding, data = ZLIB, packed
+            self.frames += 1
+            self._record(TAG_FRAME, FRAME.pack(entry[0], encoding, len(data)), data)
+
+    def send(self, events):
+        parts = [COUNT.pack(len(events))]
+        for kind, x, y, button in events:
+            parts.append(EVENT.pack(_KIND_CODES[kind], _BUTTON_CODES[button], x, y))
+        with self._lock:
+            if self._file is not None:
+                self._record(TAG_INPUT, *parts)
+
+    def action(self, index):
+        """Record the start of an action; always lets it run"""
+        with self._lock:
+            if self._file is not None:
+                self._record(TAG_ACTION, ACTION.pack(index))
+        return True
+
+    def wait(self, index, matched, duration):
+        with self._lock:
+            if self._file is not None:
+                self._record(TAG_WAIT, WAIT.pack(index, matched, duration))
+
+    def close(self, **summary):
+        """Write the END record with summary (outcome, cycles, elapsed)"""
+        if self._file is None:
+            return
+        self._blob(TAG_END, summary)
+        with self._lock:
+            file, self._file = self._file, None
+        file.close()
+
+
+class TracingCapture(capture.CaptureBackend):
+    """Passes grabs through to another backend and records their frames.
+
+    Only grabs from threads whose capture.set_reader is one of readers,
+    the traced runner and its watcher, are recorded; the GUI's color
+    display, hotkeys and other sequences read the screen untraced.
+    """
+
+    name = "trace"
+
+    def __init__(self, inner, writer, readers):
+        super().__init__()
+        self.inner = inner
+        self.writer = writer
+        self.readers = readers
+
+    def grab(self, left, top, width, height):
+        frame = self.inner.grab(left, top, width, height)
+        if capture.current_reader() in self.readers:
+            self.grab_count += 1
+            self.writer.frame(frame)
+        return frame
+
+    def close(self):
+        self.inner.close()
+
+
+class TracingInput(inputs.InputBackend):
+    """Passes events through to another backend and records the runner's"""
+
+    name = "trace"
+
+    def __init__(self, inner, writer, runner):
+        super().__init__()
+        self.inner = inner
+        self.writer = writer
+        self.runner = runner
+
+    def send(self, events):
+        self.inner.send(events)
+        if capture.current_reader() is self.runner:
+            self.writer.send(events)
+            self.send_count += 1
+            self.event_count += len(events)
+
+    def get_position(self):
+        return self.inner.get_position()
+
+    def close(self):
+        self.inner.close()
+
+
+class Recording:
+    """Records runner's runs from the active capture and input backends"""
+
+    def __init__(self, runner, path, **meta):
+        # Backends first, so a missing one leaves no empty trace behind
+        self._capture = capture.get_backend()
+        self._input = inputs.get_backend()
+        self.writer = TraceWriter(path, **meta)
+        self.runner = runner
+        readers = (runner, runner.watcher)
+        capture.set_backend(TracingCapture(self._capture, self.writer, readers))
+        inputs.set_backend(TracingInput(self._input, self.writer, runner))
+        runner.trace = self.writer
+
+    @property
+    def path(self):
+        return self.writer.path
+
+    def close(self, **summary):
+        """Finish the trace and put the original backends back"""
+        self.runner.trace = None
+        capture.set_backend(self._capture)
+        inputs.set_backend(self._input)
+        self.writer.close(**summary)
+
+
+class Trace:
+    """The decoded records of a trace file"""
+
+    def __init__(self):
+        self.meta = {}
+        self.end = {}
+        # rect -> packed frames in the order they were grabbed
+        self.frames = {}
+        # (kind, x, y, button) of every mouse event
+        self.events = []
+        self.actions = []
+        # (action index, matched, seconds)
+        self.waits = []
+        self.duration = 0.0
+        self.records = 0
+
+
+def read_trace(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a trace file")
+    magic, version, _ = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} trace file")
+
+    trace = Trace()
+    rects = []
+    elapsed = 0
+    pos = HEADER.size
+    try:
+        while pos < len(data):
+            tag, delta = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            elapsed += delta
+            trace.records += 1
+            if tag == TAG_FRAME:
+                rect_id, encoding, length = FRAME.unpack_from(data, pos)
+                pos += FRAME.size
+                pixels = data[pos : pos + length]
+                pos += length
+                if encoding == ZLIB:
+                    pixels = zlib.decompress(pixels)
+                trace.frames[rects[rect_id]].append(pixels)
+            elif tag == TAG_SAME:
+                (rect_id,) = SAME.unpack_from(data, pos)
+                pos += SAME.size
+                frames = trace.frames[rects[rect_id]]
+                frames.append(frames[-1])
+            elif tag == TAG_RECT:
+                rect_id, *rect = RECT.unpack_from(data, pos)
+                pos += RECT.size
+                rects.append(tuple(rect))
+                trace.frames.setdefault(tuple(rect), [])
+            elif tag == TAG_INPUT:
+                (count,) = COUNT.unpack_from(data, pos)
+                pos += COUNT.size
+                for _ in range(count):
+                    kind, button, x, y = EVENT.unpack_from(data, pos)
+                    pos += EVENT.size
+                    trace.events.append((_KINDS[kind], x, y, _BUTTONS[button]))
+            elif tag == TAG_ACTION:
+                trace.actions.append(ACTION.unpack_from(data, pos)[0])
+                pos += ACTION.size
+            elif tag == TAG_WAIT:
+                index, matched, seconds = WAIT.unpack_from(data, pos)
+                pos += WAIT.size
+                trace.waits.append((index, bool(matched), seconds))
+            elif tag in (TAG_META, TAG_END):
+                (length,) = BLOB.unpack_from(data, pos)
+                pos += BLOB.size
+                values = json.loads(data[pos : pos + length].decode("utf-8"))
+                pos += length
+                if tag == TAG_META:
+                    trace.meta = values
+                else:
+                    trace.end = values
+            else:
+                raise ValueError(f"unknown record type {tag}")
+    except (struct.error, IndexError, zlib.error) as e:
+        # A run that crashed leaves a truncated trace; keep what was read
+        if trace.end:
+            raise ValueError(f"{path} is damaged: {e}") from None
+    trace.duration = elapsed / 1e6
+    return trace
+
+
+class ReplayCapture(capture.CaptureBackend):
+    """Returns the frames of a trace, in order, for each rectangle grabbed"""
+
+    name = "replay"
+
+    def __init__(self, trace, on_exhausted=None):
+        super().__init__()
+        self.frames = trace.frames
+        # Called once, when a rectangle is grabbed more often than recorded
+        self.on_exhausted = on_exhausted
+        self.exhausted = False
+        self._next = dict.fromkeys(self.frames, 0)
+        self._lock = threading.Lock()
+
+    def grab(self, left, top, width, height):
+        rect = (left, top, width, height)
+        frames = self.frames.get(rect)
+        if not frames:
+            raise ValueError(f"the trace has no frames of {rect}")
+        with self._lock:
+            i = self._next[rect]
+            if i < len(frames):
+                self._next[rect] = i + 1
+                exhausted = False
+            else:
+                i = len(frames) - 1
+                exhausted = not self.exhausted
+                self.exhausted = True
+            self.count_grab()
+        if exhausted and self.on_exhausted is not None:
+            self.on_exhausted()
+        return capture.Frame(left, top, width, height, frames[i])
+
+    def remaining(self):
+        """Number of recorded frames not grabbed yet"""
+        return sum(len(self.frames[rect]) - i for rect, i in self._next.items())
+
+
+# Replays sample every pending condition back to back
+REPLAY_POLICY = PollPolicy(hot_ms=float("inf"), hot_interval_ms=0)
+
+
+class ReplayWatcher(PixelWatcher):
+    """A watcher that ignores per-action polling and never sleeps between polls"""
+
+    def __init__(self):
+        super().__init__(REPLAY_POLICY)
+
+    def register(self, condition, policy=None, confirm=None):
+        return super().register(condition, self.policy, confirm)
+
+
+class ReplayProbe:
+    """Stands in for the TraceWriter during a replay, collecting the same records"""
+
+    def __init__(self, runner, limit):
+        self.runner = runner
+        # A stopped run is replayed up to the last action it started
+        self.limit = limit
+        self.actions = []
+        self.waits = []
+
+    def action(self, index):
+        if len(self.actions) >= self.limit:
+            self.runner.stop()
+            return False
+        self.actions.append(index)
+        return True
+
+    def wait(self, index, matched, duration):
+        self.waits.append((index, matched, duration))
+
+
+def _first_difference(recorded, replayed):
+    for i, (a, b) in enumerate(zip(recorded, replayed)):
+        if a != b:
+            return i
+    if len(recorded) != len(replayed):
+        return min(len(recorded), len(replayed))
+    return None
+
+
+class ReplayResult:
+    """How a replay compared with the run it was recorded from"""
+
+    def __init__(self, trace, runner, probe, screen, events, outcome):
+        self.trace = trace
+        self.runner = runner
+        self.outcome = outcome
+        self.elapsed = runner.elapsed
+        self.unused_frames = screen.remaining()
+        self.events = events
+        self.actions = probe.actions
+        self.waits = probe.waits
+        self.event_mismatch = _first_difference(trace.events, events)
+        self.action_mismatch = _first_difference(trace.actions, probe.actions)
+        self.wait_mismatch = _first_difference(
+            [w[:2] for w in trace.waits], [w[:2] for w in probe.waits]
+        )
+
+    @property
+    def matches(self):
+        return (
+            self.event_mismatch is None
+            and self.action_mismatch is None
+            and self.wait_mismatch is None
+            and self.outcome == self.trace.end.get("outcome", self.outcome)
+        )
+
+    def lines(self):
+        trace = self.trace
+        recorded = trace.end.get("elapsed", trace.duration)
+        speedup = recorded / self.elapsed if self.elapsed > 0 else 0.0
+        lines = [
+            f"replayed {len(self.actions)} actions and {len(self.waits)} waits "
+            f"in {self.elapsed:.3f} s, recorded run took {recorded:.3f} s "
+            f"({speedup:.1f}x)",
+            f"outcome: {self.outcome} (recorded {trace.end.get('outcome', '?')}), "
+            f"{self.unused_frames} recorded frames unused",
+        ]
+        for what, mismatch, recorded_items, replayed_items in (
+            ("mouse event", self.event_mismatch, trace.events, self.events),
+            ("action", self.action_mismatch, trace.actions, self.actions),
+            ("wait", self.wait_mismatch, trace.waits, self.waits),
+        ):
+            if mismatch is None:
+                continue
+            want = recorded_items[mismatch] if mismatch < len(recorded_items) else None
+            got = replayed_items[mismatch] if mismatch < len(replayed_items) else None
+            lines.append(
+                f"{what} #{mismatch + 1} differs: recorded {want}, replayed {got}"
+            )
+        if self.matches:
+            lines.append("replay matches the recording")
+        return lines
+
+
+def replay(trace, program, speed=0.0, log=None, sequence_cache=None):
+    """Run program against the screen recorded in trace.
+
+    speed scales the delays (2 runs them twice as fast); 0 skips them.
+    Files called by the program are loaded through sequence_cache.
+    The active capture and input backends are restored afterwards.
+    """
+    if speed < 0:
+        raise ValueError("replay speed must be non-negative")
+    meta = trace.meta
+    scheduler = DeadlineScheduler(
+        anchor=meta.get("anchor", ANCHOR_END),
+        time_scale=1 / speed if speed else 0.0,
+    )
+    runner = SequenceRunner(log=log, watcher=ReplayWatcher(), scheduler=scheduler)
+    probe = ReplayProbe(runner, len(trace.actions))
+    runner.trace = probe
+    runner.turbo = meta.get("turbo", True)
+    runner.sequence_cache = sequence_cache
+
+    screen = ReplayCapture(trace, on_exhausted=runner.stop)
+    mouse = inputs.RecordingInput()
+    old_capture = capture.set_backend(screen)
+    old_input = inputs.set_backend(mouse)
+    try:
+        runner.install(program)
+        runner.prepare()
+        runner.running = True
+        outcome = runner.run(meta.get("repeat", 0))
+    finally:
+        runner.watcher.stop()
+        capture.set_backend(old_capture)
+        inputs.set_backend(old_input)
+    events = [(kind, x, y, button) for _, kind, x, y, button in mouse.events]
+    return ReplayResult(trace, runner, probe, screen, events, outcome)
@@ -0,0 +1,103 @@
+"""Deadline based delays.
+
+Delays are turned into absolute ``time.perf_counter`` deadlines and waited
+for with a coarse sleep followed by a short spin, so each delay ends within
+a fraction of a millisecond of its deadline.  In "start" mode the deadline
+is measured from when the action was due to start rather than from when it
+finished, so the time spent clicking and monitoring does not accumulate
+over long runs.  Waits take an optional threading.Event that ends them
+early, so stopping never has to sit out a long delay.  A time_scale below
+1 shortens every delay, for replaying recorded runs faster than real time.
+"""
+
+import time
+
+ANCHOR_END = "end"
+ANCHOR_START = "start"
+
+
+def sleep_until(deadline, spin_threshold=0.002, cancel=None):
+    """Sleep until the perf_counter deadline, spinning for the last stretch.
+
+    Returns False if the cancel event was set before the deadline.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_threshold:
+        if cancel is None:
+            time.sleep(remaining - spin_threshold)
+        elif cancel.wait(remaining - spin_threshold):
+            return False
+    while time.perf_counter() < deadline:
+        if cancel is not None and cancel.is_set():
+            return False
+    return True
+
+
+class DeadlineScheduler:
+    """Waits for action delays and accounts for how late each wake-up was"""
+
+    def __init__(
+        self, anchor=ANCHOR_END, spin_threshold=0.002, max_catchup=1.0, time_scale=1.0
+    ):
+        if anchor not in (ANCHOR_END, ANCHOR_START):
+            raise ValueError(f"Unknown delay anchor '{anchor}'")
+        if time_scale < 0:
+            raise ValueError("time scale must be non-negative")
+        self.anchor = anchor
+        self.spin_threshold = spin_threshold
+        self.time_scale = time_scale
+        # Falling further behind than this resyncs instead of bursting to catch up
+        self.max_catchup = max_catchup
+        self.reset()
+
+    def reset(self):
+        self.drift = 0.0
+        self.delays = 0
+        self.cycle_errors = []
+        self._action_start = None
+        self._next_start = None
+
+    def begin_cycle(self):
+        self.cycle_errors = []
+
+    def start_action(self):
+        """Mark the start of an action, on the ideal timeline in "start" mode.
+
+        Returns the current time, for timing the action.
+        """
+        now = time.perf_counter()
+        next_start = self._next_start
+        if (
+            self.anchor == ANCHOR_START
+            and next_start is not None
+            and now - next_start < self.max_catchup
+        ):
+            self._action_start = next_start
+        else:
+            self._action_start = now
+        self._next_start = None
+        return now
+
+    def wait(self, delay, cancel=None):
+        """Wait ``delay`` seconds past the action end (or start).
+
+        Returns how late the wake-up was, or None if cancel was set first.
+        """
+        delay *= self.time_scale
+        if self.anchor == ANCHOR_START and self._action_start is not None:
+            deadline = self._action_start + delay
+        else:
+            deadline = time.perf_counter() + delay
+        if not sleep_until(deadline, self.spin_threshold, cancel):
+            return None
+
+        error = time.perf_counter() - deadline
+        self.drift += error
+        self.delays += 1
+        self.cycle_errors.append(error)
+        self._next_start = deadline
+        return error
+
+    def cycle_jitter(self):
+        """Largest wake-up error (seconds) among this cycle's delays"""
+        return max(self.cycle_errors, default=0.0)
@@ -0,0 +1,401 @@
+"""Compiled action sequences.
+
+Loaded rows are compiled once into immutable Action objects with their
+click handler resolved and their log lines pre-rendered, so the execution
+loop does no lookups or formatting of its own.
+"""
+
+from flow import link
+from template import ANCHOR_MATCH
+from watcher import DEFAULT_COLOR_TOLERANCE
+
+# "none" clicks nowhere, for actions that only wait, branch or call
+NO_CLICK = "none"
+CLICK_TYPES = ("left", "right", "middle", "move", NO_CLICK)
+# The click types that press a mouse button
+BUTTON_CLICK_TYPES = ("left", "right", "middle")
+
+CLICK_TYPE_DISPLAY = {
+    "left": "Left Click",
+    "right": "Right Click",
+    "middle": "Middle Click",
+    "move": "Move Only",
+    NO_CLICK: "No Click",
+}
+
+
+def no_click(x, y):
+    pass
+
+
+class ActionError(ValueError):
+    """Raised by compile_action; field names the bad field, or its option key"""
+
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+
+class Action:
+    """One compiled step of a sequence"""
+
+    __slots__ = (
+        "index",
+        "name",
+        "click_type",
+        "click_pos",
+        "monitor_pos",
+        "target_color",
+        "delay",
+        "poll",
+        "region",
+        "template",
+        "flow",
+        "confirm",
+        "jump",
+        "checks",
+        "bound_policy",
+        "click",
+        "sends_click",
+        "description",
+        "start_message",
+        "monitor_message",
+        "waiting_template",
+    )
+
+    def __init__(
+        self,
+        index,
+        name,
+        click_type,
+        click_pos,
+        monitor_pos,
+        target_color,
+        delay,
+        poll,
+        region,
+        template,
+        flow,
+        confirm,
+        click,
+    ):
+        self.index = index
+        self.name = name
+        self.click_type = click_type
+        self.click_pos = click_pos
+        self.monitor_pos = monitor_pos
+        self.target_color = target_color
+        self.delay = delay
+        self.poll = poll
+        self.region = region
+        self.template = template
+        self.flow = flow
+        self.confirm = confirm
+        # Position of the goto's label, set when the program is linked
+        self.jump = None
+        # The monitor condition decides the goto instead of being waited for
+        self.checks = bool(flow and flow.goto and monitor_pos)
+        # (base policy, policy with the poll overrides), see policy_for
+        self.bound_policy = None
+        self.click = click
+        self.sends_click = click_type in BUTTON_CLICK_TYPES
+        self._render()
+
+    def policy_for(self, base_policy):
+        """base_policy with this action's poll overrides applied.
+
+        Actions are shared by every runner and engine that loaded the file,
+        so the result is cached against the base policy it was made from
+        instead of being bound into the action for one of them.
+        """
+        if not self.poll:
+            return base_policy
+        bound = self.bound_policy
+        if bound is None or bound[0] is not base_policy:
+            bound = self.bound_policy = (base_policy, base_policy.replace(**self.poll))
+        return bound[1]
+
+    def _render(self):
+        name = self.name
+        display = CLICK_TYPE_DISPLAY[self.click_type]
+        cx, cy = self.click_pos
+        monitor, target, region = self.monitor_pos, self.target_color, self.region
+        template = self.template
+        anchored = template is not None and template.anchor == ANCHOR_MATCH
+
+        if template:
+            watch = (
+                f"search {region.size_text()} at {monitor} for {template.name} "
+                f"(score {template.threshold:g})"
+            )
+        elif region:
+            what = f"at color {target}" if target else "changing"
+            watch = (
+                f"monitor {region.size_text()} at {monitor} for "
+                f"{region.describe()} {what}"
+            )
+        elif monitor and target:
+            watch = f"monitor {monitor} for color {target}"
+        elif monitor:
+            watch = f"monitor {monitor} for any color change"
+        else:
+            watch = "no monitoring"
+        where = f"match {self.click_pos}" if anchored else str(self.click_pos)
+        if self.checks:
+            watch = watch.replace("monitor", "check", 1).replace("search", "check", 1)
+        if self.confirm:
+            watch += f" ({self.confirm.describe()})"
+        flow = f", {self.flow.describe(self.checks)}" if self.flow else ""
+        self.description = (
+            f"{name} - {display} {where}, {watch}{flow}, delay {self.delay}s"
+        )
+
+        if anchored:
+            self.start_message = (
+                f"🖱️ Action {self.index}: {name} - {display} at match + ({cx}, {cy})"
+            )
+        else:
+            self.start_message = (
+                f"🖱️ Action {self.index}: {name} - {display} at ({cx}, {cy})"
+            )
+        self.monitor_message = None
+        self.waiting_template = None
+        if template:
+            mx, my = monitor
+            area = f"region ({mx}, {my}) {region.size_text()}"
+            self.monitor_message = (
+                f"🔎 Searching {area} for {template.name} (score {template.threshold:g})"
+            )
+            self.waiting_template = (
+                f"⏳ Searching {area} for {template.name}, best score {{:.2f}}"
+            )
+        elif region:
+            mx, my = monitor
+            area = f"region ({mx}, {my}) {region.size_text()}"
+            if target:
+                self.monitor_message = (
+                    f"👁️ Monitoring {area} for {region.describe()} matching {target}"
+                )
+                self.waiting_template = (
+                    f"⏳ Waiting {area} with {{:.0%}} matching {target}, "
+                    f"need {region.describe()}"
+                )
+            else:
+                self.monitor_message = (
+                    f"👁️ Monitoring {area} for {region.describe()} changing"
+                )
+                self.waiting_template = (
+                    f"⏳ Waiting {area} with {{:.0%}} changed, need {region.describe()}"
+                )
+        elif monitor:
+            mx, my = monitor
+            if target:
+                self.monitor_message = (
+                    f"👁️ Monitoring pixel ({mx}, {my}) for color {target}"
+                )
+                self.waiting_template = (
+                    f"⏳ Waiting ({mx}, {my}) with color {{}} to become {target}"
+                )
+            else:
+                self.monitor_message = (
+                    f"👁️ Monitoring pixel ({mx}, {my}) for any color change (initial: {{}})"
+                )
+                self.waiting_template = (
+                    f"⏳ Waiting ({mx}, {my}) with color {{}} for any change"
+                )
+
+
+def action_fields(action):
+    """Return the fields compile_action takes after the index"""
+    return (
+        action.name,
+        action.click_type,
+        action.click_pos,
+        action.monitor_pos,
+        action.target_color,
+        action.delay,
+        action.poll,
+        action.region,
+        action.template,
+        action.flow,
+        action.confirm,
+    )
+
+
+def _check_point(value, what):
+    if (
+        not isinstance(value, tuple)
+        or len(value) != 2
+        or not all(isinstance(v, int) for v in value)
+    ):
+        raise ValueError(f"{what} must be an (x, y) pair of integers")
+
+
+def _check_color(value):
+    if (
+        not isinstance(value, tuple)
+        or len(value) != 3
+        or not all(isinstance(v, int) and 0 <= v <= 255 for v in value)
+    ):
+        raise ValueError("Target color must be R,G,B with values 0-255")
+
+
+def _check_confirm(confirm, monitor_pos, target_color, region, template):
+    """Check that a Confirm spec fits the condition it confirms.
+
+    Errors about one option are ActionErrors naming it.
+    """
+    if monitor_pos is None:
+        raise ValueError("confirmation options need a monitor position")
+    pixel_target = region is None and target_color is not None
+    pixel_change = region is None and target_color is None
+    if confirm.enter is not None and not pixel_target:
+        raise ActionError(
+            "enter",
+            "enter is the tolerance of a pixel color target, regions use "
+            "match and templates threshold",
+        )
+    if confirm.min_change is not None and not pixel_change:
+        raise ActionError(
+            "min_change",
+            "min_change applies to pixel change detection, regions use tolerance",
+        )
+    exit = confirm.exit
+    if exit is None:
+        return
+    if template is not None:
+        if exit > template.threshold:
+            raise ActionError(
+                "exit", f"exit must be at most the threshold {template.threshold:g}"
+            )
+    elif region is not None:
+        enter = region.required() / (region.width * region.height) * 100
+        if exit > enter:
+            raise ActionError("exit", f"exit must be at most {enter:g}% of the region")
+    elif target_color is not None:
+        enter = DEFAULT_COLOR_TOLERANCE if confirm.enter is None else confirm.enter
+        if exit < enter:
+            raise ActionError(
+                "exit", f"exit must be at least the enter tolerance {enter:g}"
+            )
+    else:
+        enter = confirm.min_change or 1
+        if exit > enter:
+            raise ActionError("exit", f"exit must be at most min_change {enter:g}")
+
+
+def _check_field(field, index, check, *args):
+    """Run check(*args), turning its ValueError into an ActionError for field"""
+    try:
+        check(*args)
+    except ValueError as e:
+        field = getattr(e, "field", field)
+        raise ActionError(field, f"Action {index}: {e}") from None
+
+
+def compile_action(
+    index,
+    name,
+    click_type,
+    click_pos,
+    monitor_pos,
+    target_color,
+    delay,
+    poll,
+    region,
+    template,
+    flow=None,
+    confirm=None,
+    *,
+    handlers,
+):
+    """Validate one row of fields and return its Action.
+
+    Rows without the flow and confirm fields are accepted; gotos are
+    resolved by linking the whole program afterwards.
+    """
+    if click_type not in CLICK_TYPES:
+        raise ActionError(
+            "click_type", f"Action {index}: unknown click type '{click_type}'"
+        )
+    _check_field("click", index, _check_point, click_pos, "Position")
+    if monitor_pos is not None:
+        _check_field("monitor", index, _check_point, monitor_pos, "Monitor position")
+    if target_color is not None:
+        _check_field("color", index, _check_color, target_color)
+    if delay < 0:
+        raise ActionError("delay", f"Action {index}: delay must be non-negative")
+    if region is not None and monitor_pos is None:
+        raise ActionError(
+            "monitor", f"Action {index}: a region needs a monitor position"
+        )
+    if template is not None:
+        if region is None:
+            raise ActionError(
+                "template", f"Action {index}: a template needs a region to search"
+            )
+        try:
+            image = template.load()  # Preprocessed once here, then cached
+        except ValueError as e:
+            raise ActionError("template", f"Action {index}: {e}") from None
+        if image.width > region.width or image.height > region.height:
+            raise ActionError(
+                "template",
+                f"Action {index}: template {template.name} ({image.width}x"
+                f"{image.height}) is larger than the region {region.size_text()}",
+            )
+    if confirm is not None:
+        _check_field(
+            "confirm",
+            index,
+            _check_confirm,
+            confirm,
+            monitor_pos,
+            target_color,
+            region,
+            template,
+        )
+    if flow is not None and flow.goto and monitor_pos is not None:
+        if target_color is None and template is None:
+            raise ActionError(
+                "goto",
+                f"Action {index}: a conditional goto needs a target color or "
+                "template to check, not a change",
+            )
+        if template is not None and template.anchor == ANCHOR_MATCH:
+            raise ActionError(
+                "anchor",
+                f"Action {index}: a conditional goto cannot click at the match",
+            )
+
+    return Action(
+        index,
+        name or f"Action {index}",
+        click_type,
+        click_pos,
+        monitor_pos,
+        target_color,
+        float(delay),
+        poll,
+        region,
+        template,
+        flow,
+        confirm,
+        no_click if click_type == NO_CLICK else handlers[click_type],
+    )
+
+
+def compile_actions(rows, handlers):
+    """Compile rows of the fields compile_action takes after the index"""
+    return link(
+        tuple(
+            compile_action(index, *row, handlers=handlers)
+            for index, row in enumerate(rows, 1)
+        )
+    )
+
+
+def append_action(program, row, handlers):
+    """Return a new program with one more action compiled onto the end"""
+    action = compile_action(len(program) + 1, *row, handlers=handlers)
+    return link(tuple(program) + (action,))
@@ -0,0 +1,543 @@
+"""Reading and writing sequence files.
+
+CSV rows are parsed and compiled as they are streamed from the file, and
+binary .acseq files are handed to binseq.  Errors are collected with their
+line and column instead of aborting on the first bad row, and a
+SequenceCache keyed by (path, mtime, size) lets an unchanged file be
+reloaded without reading or parsing it again.
+"""
+
+import csv
+import os
+import threading
+
+from flow import Flow, FlowError, link
+from region import DEFAULT_TOLERANCE, MATCH_ANY, Region, parse_match
+from sequence import CLICK_TYPES, ActionError, action_fields, compile_action
+from template import ANCHOR_MATCH, DEFAULT_THRESHOLD, TemplateSpec, require_numpy
+from watcher import Confirm, PollPolicy
+
+# Default delay when the delay column is missing
+DEFAULT_DELAY = 0.5
+
+# Stop collecting after this many bad rows
+MAX_REPORTED_ERRORS = 10
+
+# Optional key=value columns after the delay, mapped to PollPolicy fields
+POLL_OPTION_KEYS = {
+    "latency": "expected_ms",
+    "hot": "hot_ms",
+    "max_poll": "max_interval_ms",
+}
+
+# Options that turn the monitor position into a Region
+REGION_OPTION_KEYS = ("region", "match", "tolerance")
+
+# Options that search the region for an image
+TEMPLATE_OPTION_KEYS = ("template", "threshold", "anchor")
+
+# Options that label, branch, loop and call, see flow
+FLOW_OPTION_KEYS = ("label", "goto", "loop", "call")
+
+# Options that confirm a monitor condition over several samples, mapped to
+# Confirm fields
+CONFIRM_OPTION_KEYS = {
+    "confirm": "samples",
+    "window": "window_ms",
+    "enter": "enter",
+    "exit": "exit",
+    "min_change": "min_change",
+}
+
+# CSV columns of the compile_action fields, see field_column
+FIELD_COLUMNS = {
+    "name": 1,
+    "click_type": 2,
+    "click": 3,
+    "monitor": 5,
+    "color": 7,
+    "delay": 10,
+}
+
+# Option keys of the compile_action fields given as key=value columns
+OPTION_FIELDS = {
+    "poll": tuple(POLL_OPTION_KEYS),
+    "region": REGION_OPTION_KEYS,
+    "template": TEMPLATE_OPTION_KEYS,
+    "flow": FLOW_OPTION_KEYS,
+    "confirm": tuple(CONFIRM_OPTION_KEYS),
+}
+
+
+class SequenceParseError(ValueError):
+    """Raised with every (line, column, message) problem found in a file"""
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        details = "; ".join(
+            f"line {line}, column {column}: {message}"
+            for line, column, message in errors
+        )
+        super().__init__(f"{os.path.basename(path)}: {details}")
+
+
+class _FieldError(ValueError):
+    def __init__(self, column, message):
+        super().__init__(message)
+        self.column = column
+
+
+def parse_region_size(text):
+    """Parse 'WIDTHxHEIGHT' into (width, height)"""
+    width, sep, height = text.lower().partition("x")
+    try:
+        if sep:
+            return int(width), int(height)
+    except ValueError:
+        pass
+    raise ValueError(f"region must be WIDTHxHEIGHT, not '{text}'")
+
+
+def parse_options(fields, first_column=11, base_dir=None):
+    """Parse optional 'key=value' CSV columns.
+
+    Returns (poll, region, template, flow, confirm): PollPolicy overrides,
+    a Region, a TemplateSpec, a Flow and a Confirm, each None when no
+    option for it was given.  Template and called sequence paths are
+    relative to base_dir.
+    """
+    overrides = {}
+    region_options = {}
+    template_options = {}
+    flow_options = {}
+    confirm_options = {}
+    for column, field in enumerate(fields, first_column):
+        field = field.strip()
+        if not field:
+            continue
+        key, sep, value = field.partition("=")
+        key = key.strip().lower()
+        value = value.strip()
+        if sep and key in REGION_OPTION_KEYS:
+            region_options[key] = (column, value)
+            continue
+        if sep and key in TEMPLATE_OPTION_KEYS:
+            template_options[key] = (column, value)
+            continue
+        if sep and key in FLOW_OPTION_KEYS:
+            flow_options[key] = (column, value)
+            continue
+        if sep and key in CONFIRM_OPTION_KEYS:
+            confirm_options[key] = (column, value)
+            continue
+        if not sep or key not in POLL_OPTION_KEYS:
+            raise _FieldError(column, f"unknown option '{field}'")
+        try:
+            overrides[POLL_OPTION_KEYS[key]] = float(value)
+        except ValueError:
+            raise _FieldError(column, f"option '{key}' must be a number") from None
+    if overrides:
+        try:
+            PollPolicy(**overrides)  # Validate the values
+        except ValueError as e:
+            raise _FieldError(first_column, str(e)) from None
+    region = _parse_region(region_options)
+    template = _parse_template(template_options, base_dir)
+    if template is not None and region is None:
+        column = template_options["template"][0]
+        raise _FieldError(column, "a template needs a region=WxH to search")
+    return (
+        overrides or None,
+        region,
+        template,
+        _parse_flow(flow_options, base_dir),
+        _parse_confirm(confirm_options),
+    )
+
+
+def _parse_region(options):
+    if not options:
+        return None
+    if "region" not in options:
+        column = min(column for column, _ in options.values())
+        raise _FieldError(column, "match and tolerance need a region=WxH option")
+    column, value = options["region"]
+    try:
+        width, height = parse_region_size(value)
+        mode, percent = MATCH_ANY, None
+        if "match" in options:
+            column, value = options["match"]
+            mode, percent = parse_match(value)
+        tolerance = DEFAULT_TOLERANCE
+        if "tolerance" in options:
+            column, value = options["tolerance"]
+            try:
+                tolerance = int(value)
+            except ValueError:
+                raise ValueError(f"tolerance must be an integer, not '{value}'")
+        return Region(width, height, mode, percent, tolerance)
+    except ValueError as e:
+        raise _FieldError(column, str(e)) from None
+
+
+def _parse_template(options, base_dir):
+    if not options:
+        return None
+    if "template" not in options:
+        column = min(column for column, _ in options.values())
+        raise _FieldError(column, "threshold and anchor need a template=FILE option")
+    column, path = options["template"]
+    try:
+        # Reported here rather than when the run first searches
+        require_numpy()
+        threshold = DEFAULT_THRESHOLD
+        if "threshold" in options:
+            column, value = options["threshold"]
+            try:
+                threshold = float(value)
+            except ValueError:
+                raise ValueError(f"threshold must be a number, not '{value}'")
+        anchor = None
+        if "anchor" in options:
+            column, anchor = options["anchor"]
+        return TemplateSpec(path, base_dir, threshold, anchor or None)
+    except ValueError as e:
+        raise _FieldError(column, str(e)) from None
+
+
+def _parse_flow(options, base_dir):
+    if not options:
+        return None
+    for key, (column, value) in options.items():
+        if not value:
+            raise _FieldError(column, f"option '{key}' needs a value")
+    column = min(column for column, _ in options.values())
+    loop = None
+    if "loop" in options:
+        column, value = options["loop"]
+        try:
+            loop = int(value)
+        except ValueError:
+            raise _FieldError(
+                column, f"loop must be an integer, not '{value}'"
+            ) from None
+    try:
+        return Flow(
+            options.get("label", (0, None))[1],
+            options.get("goto", (0, None))[1],
+            loop,
+            options.get("call", (0, None))[1],
+            base_dir,
+        )
+    except ValueError as e:
+        raise _FieldError(column, str(e)) from None
+
+
+def _parse_confirm(options):
+    if not options:
+        return None
+    values = {}
+    for key, (column, value) in options.items():
+        try:
+            if key == "confirm":
+                values["samples"] = int(value)
+            else:
+                # exit may be a percentage of a region's pixels
+                values[CONFIRM_OPTION_KEYS[key]] = float(value.rstrip("%"))
+        except ValueError:
+            kind = "an integer" if key == "confirm" else "a number"
+            raise _FieldError(column, f"{key} must be {kind}, not '{value}'") from None
+    try:
+        return Confirm(**values)
+    except ValueError as e:
+        column = min(column for column, _ in options.values())
+        raise _FieldError(column, str(e)) from None
+
+
+def format_options(
+    overrides, region=None, template=None, flow=None, confirm=None, base_dir=None
+):
+    """Inverse of parse_options, for saving to CSV.
+
+    With base_dir, the directory of the file being written, template and
+    call paths are written relative to it so the saved file finds the same
+    files wherever it was loaded from.
+    """
+    options = []
+    if overrides:
+        names = {field: key for key, field in POLL_OPTION_KEYS.items()}
+        options += [f"{names[field]}={value:g}" for field, value in overrides.items()]
+    if region:
+        options.append(f"region={region.size_text()}")
+        if region.mode != MATCH_ANY:
+            options.append(f"match={region.match_text()}")
+        if region.tolerance != DEFAULT_TOLERANCE:
+            options.append(f"tolerance={region.tolerance}")
+    if template:
+        path = _saved_path(template.resolved_path(), base_dir)
+        options.append(f"template={path}")
+        if template.threshold != DEFAULT_THRESHOLD:
+            options.append(f"threshold={template.threshold:g}")
+        if template.anchor == ANCHOR_MATCH:
+            options.append(f"anchor={ANCHOR_MATCH}")
+    if flow:
+        for key in FLOW_OPTION_KEYS:
+            value = getattr(flow, key)
+            if value is not None:
+                if key == "call":
+                    value = _saved_path(flow.resolved_call(), base_dir)
+                options.append(f"{key}={value}")
+    if confirm:
+        if confirm.samples > 1:
+            options.append(f"confirm={confirm.samples}")
+        options += [
+            f"{key}={getattr(confirm, field):g}"
+            for key, field in CONFIRM_OPTION_KEYS.items()
+            if key != "confirm" and getattr(confirm, field) is not None
+        ]
+    return options
+
+
+def _saved_path(path, base_dir):
+    """path as written to a file in base_dir, falling back to absolute"""
+    if base_dir is None:
+        return path
+    path = os.path.abspath(path)
+    try:
+        return os.path.relpath(path, base_dir)
+    except ValueError:
+        # On another drive than base_dir
+        return path
+
+
+def field_column(row, field):
+    """Column of a CSV row holding a compile_action field or an option key.
+
+    An option given in several columns is reported at the first; a field
+    of options that the row doesn't have at the first option column.
+    """
+    if field in FIELD_COLUMNS:
+        return FIELD_COLUMNS[field]
+    keys = OPTION_FIELDS.get(field, (field,))
+    for column, text in enumerate(row[10:], 11):
+        if text.partition("=")[0].strip().lower() in keys:
+            return column
+    return 11
+
+
+def _int(row, column):
+    try:
+        return int(row[column - 1])
+    except ValueError:
+        raise _FieldError(column, f"'{row[column - 1]}' is not an integer") from None
+
+
+def parse_row(row, base_dir=None):
+    """Turn one CSV row into the fields compile_action takes after the index"""
+    if len(row) < 4:
+        raise _FieldError(len(row) + 1, "expected at least name,click_type,x,y")
+
+    name = row[0]
+    click_type = row[1] if row[1] in CLICK_TYPES else "left"
+    click_coords = (_int(row, 3), _int(row, 4))
+
+    monitor_coords = None
+    if len(row) >= 6 and row[4] and row[5]:
+        monitor_coords = (_int(row, 5), _int(row, 6))
+
+    target_color = None
+    if len(row) >= 9 and row[6] and row[7] and row[8]:
+        target_color = (_int(row, 7), _int(row, 8), _int(row, 9))
+        for column, value in enumerate(target_color, 7):
+            if not 0 <= value <= 255:
+                raise _FieldError(column, "color values must be 0-255")
+
+    delay_time = DEFAULT_DELAY
+    if len(row) >= 10:
+        try:
+            delay_time = float(row[9])
+        except ValueError:
+            raise _FieldError(10, f"'{row[9]}' is not a number") from None
+        if delay_time < 0:
+            raise _FieldError(10, "delay must be non-negative")
+
+    poll_overrides, region, template, flow, confirm = parse_options(
+        row[10:], base_dir=base_dir
+    )
+    if region is not None and monitor_coords is None:
+        raise _FieldError(5, "a region needs monitor_x,monitor_y")
+    return (
+        name,
+        click_type,
+        click_coords,
+        monitor_coords,
+        target_color,
+        delay_time,
+        poll_overrides,
+        region,
+        template,
+        flow,
+        confirm,
+    )
+
+
+def iter_rows(file):
+    """Yield (line_number, row) for every non-comment row of a CSV file"""
+    reader = csv.reader(file)
+    for row in reader:
+        # ignore `#` lines as comments, and rows that are entirely blank
+        if not row or row[0].strip().startswith("#"):
+            continue
+        if not any(field.strip() for field in row):
+            continue
+        yield reader.line_num, row
+
+
+def parse_file(path, handlers):
+    """Stream a CSV file into a compiled, linked program"""
+    actions = []
+    lines = []
+    # Rows of the actions with flow options, for the columns of link errors
+    flow_rows = {}
+    errors = []
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, mode="r", newline="") as file:
+        for line_number, row in iter_rows(file):
+            try:
+                fields = parse_row(row, base_dir)
+                actions.append(
+                    compile_action(len(actions) + 1, *fields, handlers=handlers)
+                )
+                lines.append(line_number)
+                if fields[9] is not None:
+                    flow_rows[len(actions) - 1] = row
+            except _FieldError as e:
+                errors.append((line_number, e.column, str(e)))
+            except ActionError as e:
+                errors.append((line_number, field_column(row, e.field), str(e)))
+            except ValueError as e:
+                errors.append((line_number, 1, str(e)))
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                break
+    if errors:
+        raise SequenceParseError(path, errors)
+    try:
+        return link(tuple(actions))
+    except FlowError as e:
+        column = field_column(flow_rows[e.position], e.key)
+        raise SequenceParseError(path, [(lines[e.position], column, str(e))]) from None
+
+
+def format_row(
+    name,
+    click_type,
+    click,
+    monitor,
+    color,
+    delay,
+    poll,
+    region,
+    template,
+    flow=None,
+    confirm=None,
+    base_dir=None,
+):
+    """Lay out one action's fields as a CSV row written in base_dir"""
+    row = [name, click_type, click[0], click[1]]
+    row += [monitor[0], monitor[1]] if monitor else ["", ""]
+    row += [color[0], color[1], color[2]] if color else ["", "", ""]
+    row += [delay]
+    row += format_options(poll, region, template, flow, confirm, base_dir)
+    return row
+
+
+def load_program(path, handlers):
+    """Load a CSV or binary (.acseq) sequence file"""
+    import binseq
+
+    if binseq.is_binary_file(path):
+        return binseq.BinarySequence(path, handlers)
+    return parse_file(path, handlers)
+
+
+def write_file(path, program):
+    """Save a program as CSV, or in the binary format for .acseq paths"""
+    import binseq
+
+    if path.lower().endswith(binseq.EXTENSION):
+        binseq.write_program(path, program)
+        return
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        for action in program:
+            writer.writerow(format_row(*action_fields(action), base_dir=base_dir))
+
+
+class SequenceCache:
+    """Compiled programs keyed by (path, mtime, size).
+
+    Memory mapped binary sequences are closed once they are replaced or
+    invalidated.  in_use(program) tells whether a runner still has one
+    installed; those are kept open until a later release() finds them
+    unused.
+    """
+
+    def __init__(self, handlers, in_use=None):
+        self.handlers = handlers
+        self.in_use = in_use
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._retired = []
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """Return (program, cached) for a file, parsing it only if it changed"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1], True
+
+        program = load_program(path, self.handlers)
+        with self._lock:
+            old = self._entries.get(path)
+            self._entries[path] = (key, program)
+            self.misses += 1
+            if old is not None and old[1] is not program:
+                self._retire(old[1])
+        self.release()
+        return program, False
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                entries, self._entries = list(self._entries.values()), {}
+            else:
+                entry = self._entries.pop(os.path.abspath(path), None)
+                entries = [entry] if entry is not None else []
+            for _, program in entries:
+                self._retire(program)
+        self.release()
+
+    def _retire(self, program):
+        if getattr(program, "close", None) is not None:
+            self._retired.append(program)
+
+    def release(self):
+        """Close the replaced binary sequences no runner uses any more"""
+        with self._lock:
+            retired, self._retired = self._retired, []
+        in_use = self.in_use
+        kept = [program for program in retired if in_use and in_use(program)]
+        for program in retired:
+            if program not in kept:
+                program.close()
+        if kept:
+            with self._lock:
+                self._retired += kept
@@ -0,0 +1,270 @@
+"""Template (image patch) matching.
+
+A reference image is loaded once, converted to zero-mean grayscale and
+cached.  Searching a captured region scores every position with
+normalized cross-correlation: the correlation term comes from one FFT
+product, and the per-window sums needed for normalization from integral
+images, so the cost does not grow with the template size.
+
+Needs NumPy.  PNG files are read with the standard library; other image
+formats work when Pillow is installed.
+"""
+
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from capture import BYTES_PER_PIXEL
+
+DEFAULT_THRESHOLD = 0.9
+
+# Click at the match centre plus the action's click position
+ANCHOR_MATCH = "match"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Templates and windows whose per-pixel variance is below this are flat
+_FLAT = 1e-3
+
+
+def require_numpy():
+    """Raise ValueError if template matching is unavailable, NumPy missing"""
+    if np is None:
+        raise ValueError("template matching needs NumPy (pip install numpy)")
+
+
+def _unfilter(raw, width, height, channels):
+    """Undo PNG scanline filters, returning a (height, width, channels) array"""
+    stride = width * channels
+    out = bytearray(height * stride)
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        kind = raw[pos]
+        line = bytearray(raw[pos + 1 : pos + 1 + stride])
+        pos += 1 + stride
+        if kind == 1:  # Sub
+            for i in range(channels, stride):
+                line[i] = (line[i] + line[i - channels]) & 0xFF
+        elif kind == 2:  # Up
+            for i in range(stride):
+                line[i] = (line[i] + prev[i]) & 0xFF
+        elif kind == 3:  # Average
+            for i in range(stride):
+                left = line[i - channels] if i >= channels else 0
+                line[i] = (line[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif kind == 4:  # Paeth
+            for i in range(stride):
+                a = line[i - channels] if i >= channels else 0
+                b = prev[i]
+                c = prev[i - channels] if i >= channels else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    predictor = a
+                elif pb <= pc:
+                    predictor = b
+                else:
+                    predictor = c
+                line[i] = (line[i] + predictor) & 0xFF
+        elif kind != 0:
+            raise ValueError(f"bad PNG filter type {kind}")
+        out[y * stride : (y + 1) * stride] = line
+        prev = line
+    return np.frombuffer(bytes(out), dtype=np.uint8).reshape(height, width, channels)
+
+
+def read_png(path):
+    """Read an 8-bit RGB, RGBA or grayscale PNG into a (height, width, 3) array"""
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"{os.path.basename(path)} is not a PNG file")
+
+    pos = len(PNG_SIGNATURE)
+    header = None
+    chunks = []
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos : pos + 8])
+        body = data[pos + 8 : pos + 8 + length]
+        pos += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"IDAT":
+            chunks.append(body)
+        elif kind == b"IEND":
+            break
+    if header is None:
+        raise ValueError(f"{os.path.basename(path)} has no PNG header")
+
+    width, height, depth, color_type, _, _, interlace = header
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color_type)
+    if depth != 8 or channels is None or interlace:
+        raise ValueError(
+            f"{os.path.basename(path)}: only 8-bit, non-interlaced RGB, RGBA "
+            "or grayscale PNGs are supported without Pillow"
+        )
+    pixels = _unfilter(zlib.decompress(b"".join(chunks)), width, height, channels)
+    if channels <= 2:
+        return np.repeat(pixels[:, :, :1], 3, axis=2)
+    return pixels[:, :, :3]
+
+
+def load_image(path):
+    """Return an image file as a (height, width, 3) RGB uint8 array"""
+    require_numpy()
+    try:
+        from PIL import Image  # type: ignore
+    except ImportError:
+        return read_png(path)
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def _gray_rgb(pixels):
+    return pixels[:, :, 0] * 0.299 + pixels[:, :, 1] * 0.587 + pixels[:, :, 2] * 0.114
+
+
+def _gray_frame(frame):
+    """Grayscale float array of a BGRA frame"""
+    buf = np.frombuffer(frame.data, dtype=np.uint8, count=frame.stride * frame.height)
+    rows = buf.reshape(frame.height, frame.stride)[:, : frame.width * BYTES_PER_PIXEL]
+    bgra = rows.reshape(frame.height, frame.width, BYTES_PER_PIXEL)
+    return bgra[:, :, 2] * 0.299 + bgra[:, :, 1] * 0.587 + bgra[:, :, 0] * 0.114
+
+
+def _window_sums(image, height, width):
+    """Sum of every height x width window, from an integral image"""
+    s = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    np.cumsum(image, axis=0, out=s[1:, 1:])
+    np.cumsum(s[1:, 1:], axis=1, out=s[1:, 1:])
+    return (
+        s[height:, width:]
+        - s[:-height, width:]
+        - s[height:, :-width]
+        + s[:-height, :-width]
+    )
+
+
+class Template:
+    """A reference image preprocessed for normalized cross-correlation"""
+
+    def __init__(self, pixels, name=""):
+        require_numpy()
+        self.name = name
+        self.height, self.width = pixels.shape[:2]
+        gray = _gray_rgb(pixels.astype(np.float64))
+        self.zero_mean = gray - gray.mean()
+        self.energy = float((self.zero_mean**2).sum())
+        if self.energy < _FLAT * self.width * self.height:
+            raise ValueError(f"template {name} is a flat color, use a color check")
+        # FFTs of the flipped template, per search area shape
+        self._spectra = {}
+        self._lock = threading.Lock()
+
+    def _spectrum(self, shape):
+        spectrum = self._spectra.get(shape)
+        if spectrum is None:
+            spectrum = np.fft.rfft2(self.zero_mean[::-1, ::-1], s=shape)
+            with self._lock:
+                self._spectra[shape] = spectrum
+        return spectrum
+
+    def scores(self, gray):
+        """Correlation score (-1..1) of every template position in gray"""
+        th, tw = self.height, self.width
+        if gray.shape[0] < th or gray.shape[1] < tw:
+            raise ValueError(
+                f"search area {gray.shape[1]}x{gray.shape[0]} is smaller than "
+                f"template {self.name} ({tw}x{th})"
+            )
+        # Circular correlation is exact for positions where the template fits
+        product = np.fft.rfft2(gray) * self._spectrum(gray.shape)
+        corr = np.fft.irfft2(product, s=gray.shape)
+        numerator = corr[th - 1 :, tw - 1 :]
+
+        n = th * tw
+        sums = _window_sums(gray, th, tw)
+        deviation = _window_sums(gray * gray, th, tw) - sums * sums / n
+        # Rounding leaves flat windows with a tiny deviation; score them 0
+        flat = deviation < _FLAT * n
+        deviation[flat] = 1.0
+        scores = numerator / np.sqrt(deviation * self.energy)
+        scores[flat] = 0.0
+        return scores
+
+    def search(self, frame):
+        """Return (score, x, y) of the best match, x and y being its centre"""
+        scores = self.scores(_gray_frame(frame))
+        y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+        return (
+            float(scores[y, x]),
+            frame.left + int(x) + self.width // 2,
+            frame.top + int(y) + self.height // 2,
+        )
+
+
+class TemplateSpec:
+    """A template trigger as written in a sequence file"""
+
+    __slots__ = ("path", "base_dir", "threshold", "anchor")
+
+    def __init__(self, path, base_dir=None, threshold=DEFAULT_THRESHOLD, anchor=None):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be between 0 and 1")
+        if anchor not in (None, ANCHOR_MATCH):
+            raise ValueError(f"anchor must be '{ANCHOR_MATCH}'")
+        self.path = path
+        self.base_dir = base_dir
+        self.threshold = threshold
+        self.anchor = anchor
+
+    def __eq__(self, other):
+        return isinstance(other, TemplateSpec) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def resolved_path(self):
+        """The image path, relative paths being taken from the sequence file"""
+        if self.base_dir and not os.path.isabs(self.path):
+            return os.path.join(self.base_dir, self.path)
+        return self.path
+
+    def load(self):
+        return load(self.resolved_path())
+
+
+# --- Cache of preprocessed templates, keyed by (path, mtime, size) ---
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load(path):
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise ValueError(f"cannot read template {path}: {e.strerror}") from None
+    key = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+    try:
+        pixels = load_image(path)
+    except OSError as e:
+        raise ValueError(f"cannot read template {path}: {e}") from None
+    template = Template(pixels, os.path.basename(path))
+    with _cache_lock:
+        _cache[path] = (key, template)
+    return template
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture  # noqa: E402
+import inputs  # noqa: E402
+
+
+@pytest.fixture
+def screen():
+    """A SyntheticCapture installed as the capture backend for one test"""
+    backend = capture.SyntheticCapture(200, 100)
+    old = capture.set_backend(backend)
+    yield backend
+    capture.set_backend(old)
+
+
+@pytest.fixture
+def mouse():
+    """A RecordingInput installed as the input backend for one test"""
+    backend = inputs.RecordingInput()
+    old = inputs.set_backend(backend)
+    yield backend
+    inputs.set_backend(old)
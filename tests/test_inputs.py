@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+
+import inputs
+from engine import InputLane, SequenceEngine
+from executor import COMPLETED, SequenceRunner
+from inputs import CLICK_HANDLERS, DOWN, LEFT, MOVE, RIGHT, UP
+from sequence import compile_actions
+
+RED = (255, 0, 0)
+
+
+def run(program, repeat=1, turbo=False, lane=None):
+    runner = SequenceRunner()
+    runner.turbo = turbo
+    runner.lane = lane
+    runner.install(program)
+    runner.prepare()
+    runner.running = True
+    try:
+        return runner, runner.run(repeat)
+    finally:
+        runner.watcher.stop()
+
+
+def stream(mouse):
+    """The recorded events without their timestamps"""
+    return [event[1:] for event in mouse.events]
+
+
+def row(name, click_type, click, monitor=None, color=None, delay=0.0):
+    return (name, click_type, click, monitor, color, delay, None, None, None)
+
+
+@pytest.mark.parametrize("turbo", [False, True])
+def test_program_clicks_and_moves(screen, mouse, turbo):
+    program = compile_actions(
+        [
+            row("a", "left", (10, 20)),
+            row("b", "move", (30, 40)),
+            row("c", "right", (50, 60)),
+            row("d", "none", (70, 80)),
+        ],
+        CLICK_HANDLERS,
+    )
+    runner, outcome = run(program, repeat=2, turbo=turbo)
+    assert outcome == COMPLETED
+    cycle = [
+        (MOVE, 10, 20, None),
+        (DOWN, 10, 20, LEFT),
+        (UP, 10, 20, LEFT),
+        (MOVE, 30, 40, None),
+        (MOVE, 50, 60, None),
+        (DOWN, 50, 60, RIGHT),
+        (UP, 50, 60, RIGHT),
+    ]
+    assert stream(mouse) == cycle * 2
+    # A click is one batch: move, press and release together
+    assert mouse.send_count == 6
+    assert runner.actions_run == 8
+
+
+def test_clicks_follow_the_monitored_pixel(screen, mouse):
+    program = compile_actions(
+        [
+            row("wait", "left", (1, 1), monitor=(5, 5), color=RED),
+            row("after", "middle", (2, 2)),
+        ],
+        CLICK_HANDLERS,
+    )
+    # The first click happens straight away, the second once the pixel is red
+    timer = threading.Timer(0.05, screen.set_pixel, (5, 5, RED))
+    timer.start()
+    try:
+        runner, outcome = run(program)
+    finally:
+        timer.cancel()
+    assert outcome == COMPLETED
+    assert [(x, y, button) for _, x, y, button in mouse.clicks()] == [
+        (1, 1, "left"),
+        (2, 2, "middle"),
+    ]
+    first, second = (t for t, *_ in mouse.clicks())
+    assert second - first >= 0.04
+    assert runner.waits_run == 1
+
+
+def test_delays_space_the_clicks(screen, mouse):
+    program = compile_actions(
+        [row("a", "left", (1, 1), delay=0.02), row("b", "left", (2, 2))],
+        CLICK_HANDLERS,
+    )
+    run(program)
+    first, second = (t for t, *_ in mouse.clicks())
+    assert second - first >= 0.02
+
+
+def test_engine_clicks_never_interleave(screen, mouse):
+    engine = SequenceEngine()
+    for name, x in (("a", 10), ("b", 20)):
+        program = compile_actions(
+            [row(name, "left", (x, x)), row(name, "right", (x, x + 1))],
+            CLICK_HANDLERS,
+        )
+        engine.add(name, program, repeat=5)
+    try:
+        engine.start("a")
+        engine.start("b")
+        assert engine.sequences["a"].wait(5)
+        assert engine.sequences["b"].wait(5)
+    finally:
+        engine.close()
+    assert [seq.state for seq in engine.sequences.values()] == [COMPLETED] * 2
+    events = stream(mouse)
+    assert len(events) == 2 * 2 * 5 * 3
+    for i in range(0, len(events), 3):
+        (_, x, y, _), down, up = events[i : i + 3]
+        assert down[:3] == (DOWN, x, y)
+        assert up == (UP, x, y, down[3])
+    assert [x for _, x, _, _ in mouse.clicks()].count(10) == 10
+
+
+def test_runner_takes_turns_with_engine_clicks(screen, mouse):
+    engine = SequenceEngine(lane=InputLane(min_gap=0.005))
+    program = compile_actions([row("bg", "left", (10, 10))], CLICK_HANDLERS)
+    engine.add("bg", program, repeat=10)
+    main = compile_actions([row("main", "right", (20, 20))] * 10, CLICK_HANDLERS)
+    try:
+        engine.start("bg")
+        runner, outcome = run(main, lane=engine.lane)
+        assert engine.sequences["bg"].wait(5)
+    finally:
+        engine.close()
+    assert outcome == COMPLETED
+    assert runner.clicks_run == 10
+    assert engine.lane.clicks == 20
+    times = [t for t, *_ in mouse.clicks()]
+    assert len(times) == 20
+    # The gap between clicks holds across the runner and the engine
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.004
+
+
+def test_recording_rejects_unknown_buttons(mouse):
+    with pytest.raises(ValueError):
+        mouse.send([(DOWN, 0, 0, "fourth")])
+    assert mouse.events == []
+
+
+def test_recording_tracks_position_and_clears(mouse):
+    inputs.get_backend().move(3, 4)
+    inputs.get_backend().click(5, 6, LEFT)
+    assert mouse.get_position() == (5, 6)
+    assert mouse.event_count == 4
+    mouse.clear()
+    assert (mouse.events, mouse.send_count, mouse.event_count) == ([], 0, 0)
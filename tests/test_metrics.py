@@ -0,0 +1,70 @@
+import threading
+
+from executor import SequenceRunner
+from inputs import CLICK_HANDLERS
+from sequence import compile_actions
+
+
+def run(program, repeat=1):
+    runner = SequenceRunner()
+    runner.install(program)
+    runner.prepare()
+    runner.running = True
+    try:
+        runner.run(repeat)
+    finally:
+        runner.watcher.stop()
+    return runner.metrics_snapshot()
+
+
+def row(name, click_type, monitor=None, color=None, delay=0.0):
+    return (name, click_type, (1, 1), monitor, color, delay, None, None, None)
+
+
+def test_clicks_count_only_button_presses(screen, mouse):
+    program = compile_actions(
+        [row("a", "left"), row("b", "move"), row("c", "none"), row("d", "right")],
+        CLICK_HANDLERS,
+    )
+    assert run(program)["clicks"] == 2
+
+
+def test_delay_is_reported_apart_from_the_action(screen, mouse):
+    program = compile_actions([row("slow", "left", delay=0.05)], CLICK_HANDLERS)
+    (action,) = run(program)["actions"]
+    assert action["delay_mean_ms"] >= 45
+    assert action["mean_ms"] < 45
+
+
+def test_waits_and_delays_are_means_per_run(screen, mouse):
+    program = compile_actions(
+        [row("wait", "left", monitor=(5, 5), color=(0, 0, 0), delay=0.01)],
+        CLICK_HANDLERS,
+    )
+    (action,) = run(program, repeat=3)["actions"]
+    assert action["runs"] == 3
+    # Three runs of a 10 ms delay, not their 30 ms total
+    assert 9 <= action["delay_mean_ms"] < 25
+    assert action["wait_mean_ms"] < action["delay_mean_ms"]
+
+
+def test_screen_reads_leave_out_other_threads(screen, mouse):
+    program = compile_actions(
+        [row("wait", "left", monitor=(5, 5), color=(0, 0, 0))], CLICK_HANDLERS
+    )
+    # Like the GUI's pixel readout, reading while the run goes on
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            screen.get_pixel(0, 0)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        snapshot = run(program)
+    finally:
+        stop.set()
+        reader.join()
+    # The watcher's single sample of the already matching pixel
+    assert snapshot["screen_reads"] == 1
@@ -0,0 +1,30 @@
+from monitor_log import CLEAR, MonitorLog
+
+
+def test_clear_pushed_out_of_the_buffer_still_clears():
+    log = MonitorLog(capacity=3)
+    log.append("old")
+    log.clear()
+    for i in range(5):
+        log.append(f"new {i}")
+    lines = log.drain()
+    assert lines[0] is CLEAR
+    assert [line.split("] ")[1] for line in lines[1:]] == [
+        "new 2\n",
+        "new 3\n",
+        "new 4\n",
+    ]
+    assert log.drain() == []
+
+
+def test_overflow_goes_to_the_file_when_not_drained(tmp_path):
+    path = tmp_path / "monitor.log"
+    log = MonitorLog(capacity=10, log_path=str(path))
+    try:
+        for i in range(100):
+            log.append(f"line {i}")
+        assert len(log.take_overflow()) <= 10
+        assert log.dropped == 90
+    finally:
+        log.close()
+    assert "line 0" in path.read_text()
@@ -0,0 +1,53 @@
+import threading
+
+import capture
+import inputs
+import runtrace
+from executor import COMPLETED, SequenceRunner
+from inputs import CLICK_HANDLERS
+from sequence import compile_actions
+
+RED = (255, 0, 0)
+
+
+def test_trace_records_only_the_runs_own_reads(tmp_path, screen, mouse):
+    screen.set_pixel(5, 5, RED)
+    program = compile_actions(
+        [
+            ("wait", "left", (1, 1), (5, 5), RED, 0, None, None, None),
+            ("click", "right", (2, 2), None, None, 0, None, None, None),
+        ],
+        CLICK_HANDLERS,
+    )
+    runner = SequenceRunner()
+    runner.install(program)
+    path = str(tmp_path / "run.actrace")
+    recording = runtrace.Recording(runner, path, repeat=20, turbo=True)
+
+    # Another thread reads and clicks meanwhile, like the GUI or a hotkey
+    stop = threading.Event()
+
+    def other():
+        backend = capture.get_backend()
+        while not stop.is_set():
+            backend.get_pixel(60, 60)
+            inputs.get_backend().move(9, 9)
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    runner.prepare()
+    runner.running = True
+    try:
+        outcome = runner.run(20)
+    finally:
+        stop.set()
+        thread.join()
+        runner.watcher.stop()
+        recording.close(outcome=COMPLETED, cycles=20, elapsed=runner.elapsed)
+    assert outcome == COMPLETED
+
+    trace = runtrace.read_trace(path)
+    assert list(trace.frames) == [(5, 5, 1, 1)]
+    assert (inputs.MOVE, 9, 9, None) not in trace.events
+    result = runtrace.replay(trace, program)
+    assert result.matches, result.lines()
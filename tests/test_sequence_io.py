@@ -0,0 +1,280 @@
+import os
+import struct
+import zlib
+
+import pytest
+
+import binseq
+import template
+from flow import Flow
+from inputs import CLICK_HANDLERS
+from region import MATCH_ALL, Region
+from sequence import action_fields
+from sequence_io import (
+    MAX_REPORTED_ERRORS,
+    SequenceCache,
+    SequenceParseError,
+    parse_file,
+    write_file,
+)
+from watcher import Confirm, PollPolicy
+
+
+def parse(tmp_path, text, name="sequence.csv"):
+    path = tmp_path / name
+    path.write_text(text)
+    return parse_file(str(path), CLICK_HANDLERS)
+
+
+def errors(tmp_path, text):
+    """The (line, column) of every error parse_file reports for text"""
+    with pytest.raises(SequenceParseError) as info:
+        parse(tmp_path, text)
+    return [(line, column) for line, column, _ in info.value.errors]
+
+
+def test_parses_rows_skipping_comments_and_blanks(tmp_path):
+    program = parse(
+        tmp_path,
+        "# name,type,x,y\n"
+        "a,left,10,20\n"
+        "\n"
+        ",,,\n"
+        "b,right,1,2,3,4,255,0,0,0.25\n",
+    )
+    assert [action.name for action in program] == ["a", "b"]
+    assert program[0].delay == 0.5
+    assert program[1].monitor_pos == (3, 4)
+    assert program[1].target_color == (255, 0, 0)
+    assert program[1].delay == 0.25
+
+
+@pytest.mark.parametrize(
+    "row, column",
+    [
+        ("a,left,10", 4),
+        ("a,left,x,20", 3),
+        ("a,left,10,y", 4),
+        ("a,left,1,2,x,5", 5),
+        ("a,left,1,2,5,5,0,300,0", 8),
+        ("a,left,1,2,,,,,,soon", 10),
+        ("a,left,1,2,,,,,,-1", 10),
+        ("a,left,1,2,,,,,,0.1,hot=50,bogus", 12),
+        ("a,left,1,2,,,,,,0.1,hot=x", 11),
+        ("a,left,1,2,,,,,,0.1,region=3x3", 5),
+        ("a,left,1,2,5,5,,,,0.1,hot=50,region=3", 12),
+        ("a,left,1,2,5,5,,,,0.1,hot=50,confirm=x", 12),
+        ("a,left,1,2,5,5,,,,0.1,hot=50,loop=2", 12),
+    ],
+)
+def test_bad_row_columns(tmp_path, row, column):
+    assert errors(tmp_path, "ok,left,1,1\n" + row + "\n") == [(2, column)]
+
+
+@pytest.mark.parametrize(
+    "row, column",
+    [
+        # Confirmation options without a monitor position
+        ("a,left,1,2,,,,,,0.1,hot=50,confirm=3", 12),
+        # A conditional goto on a change wait
+        ("a,left,1,2,5,5,,,,0.1,label=x,hot=50,goto=x", 13),
+        # enter is for pixel color targets
+        ("a,left,1,2,5,5,,,,0.1,hot=50,confirm=2,enter=3", 13),
+        # exit looser than the enter tolerance
+        ("a,left,1,2,5,5,0,0,0,0.1,confirm=2,exit=2,enter=5", 12),
+    ],
+)
+def test_compile_errors_are_reported_at_their_column(tmp_path, row, column):
+    assert errors(tmp_path, row + "\n") == [(1, column)]
+
+
+def test_link_errors_are_reported_at_their_column(tmp_path):
+    assert errors(tmp_path, "a,left,1,2,,,,,,0.1,hot=50,goto=nowhere\n") == [(1, 12)]
+    assert errors(
+        tmp_path,
+        "a,left,1,2,,,,,,0.1,label=x\nb,left,1,2,,,,,,0.1,hot=5,label=x,goto=x\n",
+    ) == [(2, 12)]
+
+
+def test_every_bad_row_is_reported_up_to_a_limit(tmp_path):
+    assert errors(tmp_path, "a,left,x,1\n# comment\nb,left,1,y\nc,left,1,1\n") == [
+        (1, 3),
+        (3, 4),
+    ]
+    rows = "a,left,x,1\n" * (MAX_REPORTED_ERRORS + 5)
+    assert len(errors(tmp_path, rows)) == MAX_REPORTED_ERRORS
+
+
+def test_error_message_names_file_line_and_column(tmp_path):
+    with pytest.raises(SequenceParseError) as info:
+        parse(tmp_path, "a,left,1,2\nb,left,x,2\n")
+    assert str(info.value) == "sequence.csv: line 2, column 3: 'x' is not an integer"
+
+
+ROWS = (
+    "start,left,10,20,,,,,,0.1,label=top\n"
+    "wait,right,30,40,5,6,255,128,0,0.25,hot=50,max_poll=80,confirm=3,window=40\n"
+    "area,move,1,2,3,4,0,0,0,0,region=4x2,match=all,tolerance=5,confirm=2,exit=50%\n"
+    "change,middle,7,8,9,9,,,,1.5,min_change=20\n"
+    "branch,none,0,0,5,6,255,128,0,0,goto=top,loop=3\n"
+)
+
+
+@pytest.mark.parametrize("name", ["copy.csv", "copy.acseq"])
+def test_round_trip(tmp_path, name):
+    program = parse(tmp_path, ROWS)
+    area = program[2]
+    assert area.region == Region(4, 2, MATCH_ALL, None, 5)
+    assert area.confirm == Confirm(2, exit=50.0)
+    assert program[1].confirm == Confirm(3, 40.0)
+    assert program[4].flow == Flow(goto="top", loop=3, base_dir=str(tmp_path))
+    assert program[4].jump == 0
+
+    path = str(tmp_path / name)
+    write_file(path, program)
+    cache = SequenceCache(CLICK_HANDLERS)
+    copy, cached = cache.load(path)
+    assert not cached
+    try:
+        assert [action_fields(a) for a in copy] == [action_fields(a) for a in program]
+        assert [a.jump for a in copy] == [a.jump for a in program]
+        assert cache.load(path) == (copy, True)
+    finally:
+        cache.invalidate()
+
+
+def write_png(path, width, height):
+    """An 8-bit grayscale PNG shaded left to right"""
+
+    def chunk(kind, body):
+        crc = zlib.crc32(kind + body)
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", crc)
+
+    row = bytes(255 * x // (width - 1) for x in range(width))
+    rows = b"".join(b"\0" + row for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+@pytest.mark.parametrize("name", ["copy.csv", "copy.acseq"])
+def test_saved_paths_resolve_from_the_new_directory(tmp_path, name):
+    pytest.importorskip("numpy")
+    image = tmp_path / "images" / "button.png"
+    write_png(image, 4, 2)
+    program = parse(
+        tmp_path,
+        "find,left,1,2,5,6,,,,0,region=40x20,template=images/button.png,"
+        "call=sub/next.csv\n",
+    )
+    saved = tmp_path / "saved"
+    saved.mkdir()
+    path = str(saved / name)
+    write_file(path, program)
+    cache = SequenceCache(CLICK_HANDLERS)
+    copy, _ = cache.load(path)
+    try:
+        template, flow = copy[0].template, copy[0].flow
+        assert template.path == os.path.join("..", "images", "button.png")
+        assert os.path.samefile(template.resolved_path(), image)
+        assert flow.call == os.path.join("..", "sub", "next.csv")
+        assert os.path.abspath(flow.resolved_call()) == str(tmp_path / "sub/next.csv")
+    finally:
+        cache.invalidate()
+
+
+@pytest.mark.parametrize("name", ["shared.csv", "shared.acseq"])
+def test_shared_actions_keep_each_users_policy(tmp_path, name):
+    path = str(tmp_path / name)
+    write_file(path, parse(tmp_path, ROWS))
+    cache = SequenceCache(CLICK_HANDLERS)
+    program, _ = cache.load(path)
+    try:
+        wait, plain = program[1], program[0]
+        runner_policy = PollPolicy(hot_interval_ms=2)
+        engine_policy = PollPolicy(hot_interval_ms=5)
+        for _ in range(2):
+            assert wait.policy_for(runner_policy).hot_interval_ms == 2
+            assert wait.policy_for(engine_policy).hot_interval_ms == 5
+        assert wait.policy_for(runner_policy).hot_ms == 50
+        assert plain.policy_for(engine_policy) is engine_policy
+    finally:
+        cache.invalidate()
+
+
+def test_templates_without_numpy_fail_on_load(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    write_png(tmp_path / "button.png", 4, 2)
+    text = "find,left,1,2,5,6,,,,0,region=40x20,template=button.png\n"
+    parse(tmp_path, text)
+    binary = tmp_path / "find.acseq"
+    binseq.csv_to_binary(str(tmp_path / "sequence.csv"), str(binary))
+
+    monkeypatch.setattr(template, "np", None)
+    assert errors(tmp_path, text) == [(1, 12)]
+    with pytest.raises(SequenceParseError, match="NumPy") as info:
+        binseq.BinarySequence(str(binary), CLICK_HANDLERS)
+    assert [(line, column) for line, column, _ in info.value.errors] == [(1, 12)]
+
+
+def test_replaced_sequence_stays_open_while_shown(tmp_path):
+    path = tmp_path / "shown.acseq"
+    write_file(str(path), parse(tmp_path, ROWS))
+    shown = []
+    cache = SequenceCache(CLICK_HANDLERS, in_use=lambda p: any(s is p for s in shown))
+    old, _ = cache.load(str(path))
+    shown.append(old)
+
+    write_file(str(path), parse(tmp_path, ROWS + "extra,left,1,1,,,,,,0\n"))
+    new, cached = cache.load(str(path))
+    try:
+        assert not cached
+        # Like the action list, which switches once its queued update runs
+        assert not old.closed
+        assert old[0].name == "start"
+        shown[0] = new
+        cache.release()
+        assert old.closed
+        assert not new.closed
+    finally:
+        cache.invalidate()
+
+
+def test_csv_to_binary_reports_columns(tmp_path):
+    source = tmp_path / "bad.csv"
+    source.write_text(
+        "a,left,1,2,,,,,,0.1,hot=5,label=x\n"
+        "b,left,1,y\n"
+        "c,left,1,2,,,,,,0.1,label=x\n"
+        "d,left,1,2,,,,,,0.1,hot=5,goto=z\n"
+        "e,left,1,2,,,,,,0.1,confirm=2\n"
+    )
+    target = tmp_path / "bad.acseq"
+    with pytest.raises(SequenceParseError) as info:
+        binseq.csv_to_binary(str(source), str(target))
+    assert sorted((line, column) for line, column, _ in info.value.errors) == [
+        (2, 4),
+        (3, 11),
+        (4, 12),
+        (5, 11),
+    ]
+    assert not target.exists()
+    assert not list(tmp_path.glob("*.acseq"))
+
+
+def test_failed_conversion_keeps_the_existing_file(tmp_path):
+    source = tmp_path / "good.csv"
+    source.write_text(ROWS)
+    target = tmp_path / "copy.acseq"
+    assert binseq.csv_to_binary(str(source), str(target)) == 5
+    before = target.read_bytes()
+    source.write_text("a,left,1,2,,,,,,0.1,confirm=2\n")
+    with pytest.raises(SequenceParseError):
+        binseq.csv_to_binary(str(source), str(target))
+    assert target.read_bytes() == before
+    assert [p.name for p in tmp_path.glob("*.acseq")] == ["copy.acseq"]
@@ -0,0 +1,31 @@
+from watcher import PixelWatcher
+
+RED = (255, 0, 0)
+
+
+def test_register_right_after_stop_is_still_sampled(screen):
+    watcher = PixelWatcher()
+    try:
+        watcher.watch_color((1, 1), (0, 0, 0)).event.wait(1)
+        # The old thread is likely still exiting when the next wait comes
+        watcher.stop()
+        condition = watcher.watch_color((2, 2), RED)
+        screen.set_pixel(2, 2, RED)
+        assert condition.event.wait(1)
+        assert condition.matched
+    finally:
+        watcher.stop()
+
+
+def test_latency_summary_keeps_running_totals(screen):
+    watcher = PixelWatcher()
+    try:
+        for x in range(5):
+            assert watcher.watch_color((x, 0), (0, 0, 0)).event.wait(1)
+        count, mean_ms, max_ms = watcher.latency_summary()
+        assert count == 5
+        assert 0 <= mean_ms <= max_ms
+        watcher.reset_stats()
+        assert watcher.latency_summary() == (0, 0.0, 0.0)
+    finally:
+        watcher.stop()
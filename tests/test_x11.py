@@ -0,0 +1,134 @@
+"""X11 backends against an Xvfb virtual display; skipped without Xvfb"""
+
+import os
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+import x11
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("Xvfb") is None, reason="Xvfb is not installed"
+)
+
+WIDTH, HEIGHT = 320, 240
+
+
+@pytest.fixture(scope="module")
+def display():
+    """Start Xvfb with a black root window and return its display name"""
+    read, write = os.pipe()
+    server = subprocess.Popen(
+        [
+            "Xvfb",
+            "-displayfd",
+            str(write),
+            "-screen",
+            "0",
+            f"{WIDTH}x{HEIGHT}x24",
+            "-br",
+            "-nolisten",
+            "tcp",
+        ],
+        pass_fds=(write,),
+        stderr=subprocess.DEVNULL,
+    )
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        number = pipe.readline().strip()
+    if not number:
+        server.kill()
+        pytest.skip("Xvfb did not start")
+    yield f":{number}"
+    server.terminate()
+    server.wait()
+
+
+@pytest.fixture
+def connection(display):
+    conn = x11.XConnection(display)
+    yield conn
+    conn.close()
+
+
+def test_screen_size(connection):
+    assert (connection.width, connection.height) == (WIDTH, HEIGHT)
+
+
+def test_grab_reads_the_root_window(connection):
+    backend = x11.XShmCapture(connection)
+    try:
+        frame = backend.grab(10, 20, 30, 40)
+        assert (frame.width, frame.height) == (30, 40)
+        assert backend.get_pixel(0, 0) == (0, 0, 0)
+        assert backend.get_pixels([(5, 5), (WIDTH - 1, HEIGHT - 1)]) == [
+            (0, 0, 0),
+            (0, 0, 0),
+        ]
+        assert backend.grab_count == 3
+    finally:
+        backend.close()
+
+
+def test_grab_outside_the_screen_fails(connection):
+    backend = x11.XShmCapture(connection)
+    try:
+        with pytest.raises(ValueError):
+            backend.grab(WIDTH - 5, 0, 10, 10)
+    finally:
+        backend.close()
+
+
+def test_other_threads_remake_their_image_after_close(connection):
+    backend = x11.XShmCapture(connection)
+    if not backend.use_shm:
+        pytest.skip("the server has no MIT-SHM")
+    grabbed = threading.Event()
+    closed = threading.Event()
+    results = []
+
+    def watcher():
+        backend.get_pixel(1, 1)
+        old = backend._local.surface
+        grabbed.set()
+        closed.wait(5)
+        results.append(backend.get_pixel(2, 2))
+        results.append(backend._local.surface is not old)
+        backend.close()
+
+    thread = threading.Thread(target=watcher)
+    thread.start()
+    try:
+        assert grabbed.wait(5)
+        backend.get_pixel(3, 3)
+        backend.close()
+    finally:
+        closed.set()
+        thread.join(5)
+    assert results == [(0, 0, 0), True]
+
+
+def test_failed_shm_attach_falls_back_to_xgetimage(connection, monkeypatch):
+    backend = x11.XShmCapture(connection)
+    if not backend.use_shm:
+        pytest.skip("the server has no MIT-SHM")
+    monkeypatch.setattr(backend.xext, "XShmAttach", lambda display, info: 0)
+    try:
+        assert backend.get_pixel(1, 1) == (0, 0, 0)
+        assert not backend.use_shm
+        assert backend.name == "xgetimage"
+        assert backend.get_pixel(2, 2) == (0, 0, 0)
+    finally:
+        backend.close()
+
+
+def test_xtest_moves_the_pointer(connection):
+    mouse = x11.XTestInput(connection)
+    mouse.move(50, 60)
+    assert mouse.get_position() == (50, 60)
+    mouse.click(70, 80)
+    assert mouse.get_position() == (70, 80)
+    assert mouse.send_count == 2
+    assert mouse.event_count == 4
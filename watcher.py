@@ -0,0 +1,566 @@
+"""Central pixel watcher.
+
+A single thread owns screen sampling for every pending monitor condition.
+Conditions are registered with the watcher and their waiters block on an
+event that is set as soon as a sample satisfies them.  All conditions are
+checked against the same capture, so concurrent waits share screen reads.
+A Confirm spec makes a condition hold only after several samples in a
+row, so a single flickering frame does not end the wait.
+"""
+
+import collections
+import threading
+import time
+
+import capture
+import region
+
+# Above this many pixels the watcher reads points one by one instead of
+# grabbing their whole bounding box
+MAX_SHARED_GRAB_AREA = 256 * 256
+
+
+# Per-channel tolerance of pixel color targets
+DEFAULT_COLOR_TOLERANCE = 10
+
+
+def colors_close(col1, col2, tolerance=DEFAULT_COLOR_TOLERANCE):
+    return all(abs(a - b) <= tolerance for a, b in zip(col1, col2))
+
+
+def color_distance(col1, col2):
+    """Largest per-channel difference between two colors"""
+    return max(abs(a - b) for a, b in zip(col1, col2))
+
+
+class PollPolicy:
+    """How often a waiting condition is sampled.
+
+    For the first ``hot_ms`` of a wait the pixel is polled every
+    ``hot_interval_ms`` (0 = spin), after that the interval grows by
+    ``backoff`` per sample up to ``max_interval_ms``.  An ``expected_ms``
+    hint stretches the hot window to twice the expected latency.
+    """
+
+    __slots__ = (
+        "hot_ms",
+        "max_interval_ms",
+        "expected_ms",
+        "hot_interval_ms",
+        "backoff",
+    )
+
+    # Intervals this short are spun with sleep(0) rather than a timed sleep
+    SPIN_THRESHOLD = 0.002
+
+    def __init__(
+        self,
+        hot_ms=200,
+        max_interval_ms=100,
+        expected_ms=None,
+        hot_interval_ms=1,
+        backoff=1.5,
+    ):
+        if hot_ms < 0 or max_interval_ms <= 0 or hot_interval_ms < 0:
+            raise ValueError("Polling times must be positive")
+        if backoff < 1:
+            raise ValueError("Backoff factor must be at least 1")
+        if expected_ms is not None and expected_ms < 0:
+            raise ValueError("Expected latency must be non-negative")
+        self.hot_ms = hot_ms
+        self.max_interval_ms = max_interval_ms
+        self.expected_ms = expected_ms
+        self.hot_interval_ms = hot_interval_ms
+        self.backoff = backoff
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return PollPolicy(**values)
+
+    def hot_window(self):
+        hot_ms = self.hot_ms
+        if self.expected_ms is not None:
+            hot_ms = max(hot_ms, 2 * self.expected_ms)
+        return hot_ms / 1000
+
+    def next_interval(self, age, previous):
+        """Seconds until the next sample of a wait that started ``age`` ago"""
+        hot_interval = self.hot_interval_ms / 1000
+        if age < self.hot_window():
+            return hot_interval
+        # Back off from where the hot phase left off, but never from zero
+        start = max(previous or 0.0, hot_interval, 0.005)
+        return min(self.max_interval_ms / 1000, start * self.backoff)
+
+
+DEFAULT_POLL_POLICY = PollPolicy()
+
+
+class Confirm:
+    """When a sampled condition counts as met, against flicker and noise.
+
+    The condition must hold on ``samples`` samples in a row, taken within
+    ``window_ms`` of each other when given; while such a streak is being
+    confirmed the condition is sampled at the hot interval.  Once a streak
+    has started, samples only need to pass the looser ``exit`` threshold
+    to continue it (hysteresis).  ``enter`` is the tolerance of a pixel
+    color target and ``min_change`` the smallest per-channel change a
+    pixel change wait counts; what ``exit`` measures depends on the
+    condition, see its ``configure``.
+    """
+
+    __slots__ = ("samples", "window_ms", "enter", "exit", "min_change")
+
+    def __init__(
+        self, samples=1, window_ms=None, enter=None, exit=None, min_change=None
+    ):
+        if samples < 1:
+            raise ValueError("confirm must be at least 1 sample")
+        if window_ms is not None and window_ms <= 0:
+            raise ValueError("window must be positive")
+        if (window_ms is not None or exit is not None) and samples < 2:
+            raise ValueError("window and exit need confirm=2 or more samples")
+        if (enter is not None and enter < 0) or (exit is not None and exit < 0):
+            raise ValueError("enter and exit must be non-negative")
+        if min_change is not None and min_change < 1:
+            raise ValueError("min_change must be at least 1")
+        self.samples = samples
+        self.window_ms = window_ms
+        self.enter = enter
+        self.exit = exit
+        self.min_change = min_change
+
+    def __eq__(self, other):
+        return isinstance(other, Confirm) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def describe(self):
+        parts = []
+        if self.samples > 1:
+            within = f" within {self.window_ms:g} ms" if self.window_ms else ""
+            parts.append(f"confirmed over {self.samples} samples{within}")
+        if self.enter is not None:
+            parts.append(f"enter {self.enter:g}")
+        if self.exit is not None:
+            parts.append(f"exit {self.exit:g}")
+        if self.min_change is not None:
+            parts.append(f"min change {self.min_change:g}")
+        return ", ".join(parts)
+
+
+class Condition:
+    """A pending wait on one pixel, or on a rectangle if ``rect`` is set"""
+
+    rect = None
+
+    def __init__(self, point):
+        self.point = point
+        self.policy = DEFAULT_POLL_POLICY
+        self.event = threading.Event()
+        self.registered_at = time.perf_counter()
+        self.next_sample_at = self.registered_at
+        self.interval = None
+        self.last_sample_at = None
+        # The last pixel color, or for regions the fraction of pixels counted
+        self.last_value = None
+        self.matched = False
+        self.matched_at = None
+        self.detection_latency = None
+        # The exception that ended the wait when the condition can't be sampled
+        self.error = None
+        self.callbacks = []
+        # Set by configure when several samples in a row are needed
+        self.confirm = None
+        self.streak = None
+        self.streak_since = None
+        self.window = None
+
+    def check(self, color):
+        raise NotImplementedError
+
+    def stays(self, value):
+        """Whether a sample keeps a started streak going, see Confirm.exit"""
+        return False
+
+    def configure(self, confirm):
+        """Apply a Confirm spec"""
+        if confirm.samples > 1:
+            self.confirm = confirm
+            self.streak = collections.deque(maxlen=confirm.samples)
+            self.window = confirm.window_ms / 1000 if confirm.window_ms else None
+
+    def confirmed(self, holds, value, now):
+        """Count a sample towards the streak, return True once it is complete"""
+        streak = self.streak
+        if holds or (streak and self.stays(value)):
+            if not streak:
+                # The change happened at some point since the previous sample
+                self.streak_since = self.last_sample_at or self.registered_at
+            streak.append(now)
+            return len(streak) == streak.maxlen and (
+                self.window is None or now - streak[0] <= self.window
+            )
+        streak.clear()
+        return False
+
+    def wait(self, timeout=None):
+        """Block until the condition holds or failed, return False on timeout"""
+        return self.event.wait(timeout)
+
+    def add_done_callback(self, fn):
+        """Call fn(condition) once it holds or failed, usually on the watcher thread.
+
+        fn runs straight away if the condition already holds, and may be
+        called twice when it is added just as the condition is met.
+        """
+        self.callbacks.append(fn)
+        if self.event.is_set():
+            fn(self)
+
+
+class ColorMatch(Condition):
+    """Holds when the pixel is within tolerance of a target color"""
+
+    def __init__(self, point, target, tolerance=DEFAULT_COLOR_TOLERANCE):
+        super().__init__(point)
+        self.target = target
+        self.tolerance = tolerance
+        self.exit = tolerance
+
+    def check(self, color):
+        return colors_close(color, self.target, self.tolerance)
+
+    def stays(self, color):
+        return colors_close(color, self.target, self.exit)
+
+    def configure(self, confirm):
+        """enter is the tolerance, exit the looser one a streak keeps to"""
+        super().configure(confirm)
+        if confirm.enter is not None:
+            self.tolerance = confirm.enter
+        self.exit = confirm.exit if confirm.exit is not None else self.tolerance
+
+
+class ColorChange(Condition):
+    """Holds when the pixel differs from its initial color"""
+
+    def __init__(self, point, initial):
+        super().__init__(point)
+        self.initial = initial
+        self.min_change = 1
+        self.exit = 1
+
+    def check(self, color):
+        if self.min_change == 1:
+            return color != self.initial
+        return color_distance(color, self.initial) >= self.min_change
+
+    def stays(self, color):
+        return color_distance(color, self.initial) >= self.exit
+
+    def configure(self, confirm):
+        """min_change is the change needed, exit the smaller one a streak keeps to"""
+        super().configure(confirm)
+        if confirm.min_change is not None:
+            self.min_change = confirm.min_change
+        self.exit = confirm.exit if confirm.exit is not None else self.min_change
+
+
+class RegionCondition(Condition):
+    """Holds when enough pixels of a rectangle are counted by ``count``"""
+
+    def __init__(self, origin, spec):
+        super().__init__(origin)
+        self.rect = spec.rect(origin)
+        self.region = spec
+        self.required = spec.required()
+        self.total = spec.width * spec.height
+        self.exit = self.required / self.total
+
+    def count(self, frame):
+        raise NotImplementedError
+
+    def stays(self, fraction):
+        return fraction >= self.exit
+
+    def configure(self, confirm):
+        """exit is the percentage of pixels a streak keeps to"""
+        super().configure(confirm)
+        if confirm.exit is not None:
+            self.exit = confirm.exit / 100
+
+    def check_frame(self, frame):
+        """Return (holds, fraction of pixels counted)"""
+        count = self.count(frame)
+        return count >= self.required, count / self.total
+
+
+class RegionMatch(RegionCondition):
+    """Holds when any/all/a percentage of pixels are close to a target color"""
+
+    def __init__(self, origin, spec, target):
+        super().__init__(origin, spec)
+        self.target = target
+
+    def count(self, frame):
+        return region.count_matching(frame, self.target, self.region.tolerance)
+
+
+class RegionChange(RegionCondition):
+    """Holds when any/all/a percentage of pixels differ from a snapshot"""
+
+    def __init__(self, origin, spec, initial):
+        super().__init__(origin, spec)
+        self.initial = initial
+
+    def count(self, frame):
+        return region.count_changed(frame, self.initial, self.region.tolerance)
+
+
+class TemplateMatch(RegionCondition):
+    """Holds when an image is found in a rectangle with a high enough score"""
+
+    def __init__(self, origin, spec, template, threshold):
+        super().__init__(origin, spec)
+        self.template = template
+        self.threshold = threshold
+        # Centre of the last best match, in screen coordinates
+        self.match = None
+        self.search_time = 0.0
+        self.searches = 0
+        self.exit = threshold
+
+    def check_frame(self, frame):
+        """Return (holds, best score)"""
+        start = time.perf_counter()
+        score, x, y = self.template.search(frame)
+        self.search_time += time.perf_counter() - start
+        self.searches += 1
+        self.match = (x, y)
+        return score >= self.threshold, score
+
+    def stays(self, score):
+        return score >= self.exit
+
+    def configure(self, confirm):
+        """exit is the score a streak keeps to"""
+        Condition.configure(self, confirm)
+        if confirm.exit is not None:
+            self.exit = confirm.exit
+
+    def mean_search_ms(self):
+        return self.search_time / self.searches * 1000 if self.searches else 0.0
+
+
+class PixelWatcher:
+    """Samples the screen for all registered conditions on one thread"""
+
+    def __init__(self, policy=DEFAULT_POLL_POLICY):
+        self.policy = policy
+        # Detection latencies as a running count, total and max, so an
+        # endless run doesn't keep every one of them
+        self.detections = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        # Screen reads made by the watcher thread, see capture.set_reader
+        self.reads = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # Set by stop() for the current thread only
+        self._stopped = None
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Called with _lock held.  A stopped thread may still be finishing
+        # its last pass; it exits on its own and a new one takes over
+        if (
+            self._thread is None
+            or not self._thread.is_alive()
+            or self._stopped.is_set()
+        ):
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._stopped,), daemon=True
+            )
+            self._thread.start()
+
+    def register(self, condition, policy=None, confirm=None):
+        condition.policy = policy or self.policy
+        if confirm is not None:
+            condition.configure(confirm)
+        with self._lock:
+            self._pending.append(condition)
+            self._ensure_thread()
+        self._wakeup.set()
+        return condition
+
+    def watch_color(
+        self,
+        point,
+        target,
+        tolerance=DEFAULT_COLOR_TOLERANCE,
+        policy=None,
+        confirm=None,
+    ):
+        return self.register(ColorMatch(point, target, tolerance), policy, confirm)
+
+    def watch_change(self, point, initial, policy=None, confirm=None):
+        return self.register(ColorChange(point, initial), policy, confirm)
+
+    def watch_region(self, origin, spec, target, policy=None, confirm=None):
+        return self.register(RegionMatch(origin, spec, target), policy, confirm)
+
+    def watch_region_change(self, origin, spec, initial, policy=None, confirm=None):
+        """Wait for a region to differ from ``initial``, a region.snapshot"""
+        return self.register(RegionChange(origin, spec, initial), policy, confirm)
+
+    def watch_template(
+        self, origin, spec, template, threshold, policy=None, confirm=None
+    ):
+        """Wait for a template.Template to appear in a region"""
+        return self.register(
+            TemplateMatch(origin, spec, template, threshold), policy, confirm
+        )
+
+    def cancel(self, condition):
+        with self._lock:
+            if condition in self._pending:
+                self._pending.remove(condition)
+
+    def stop(self):
+        with self._lock:
+            stopped = self._stopped
+        if stopped is not None:
+            stopped.set()
+        self._wakeup.set()
+
+    def _sample(self, points):
+        backend = capture.get_backend()
+        left, top, width, height = capture.bounding_box(points)
+        if len(points) == 1 or width * height <= MAX_SHARED_GRAB_AREA:
+            return dict(zip(points, backend.get_pixels(points)))
+        return {p: backend.get_pixel(*p) for p in points}
+
+    def _run(self, stopped):
+        capture.set_reader(self)
+        while not stopped.is_set():
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            now = time.perf_counter()
+            due = [c for c in pending if c.next_sample_at <= now]
+            if not due:
+                delay = min(c.next_sample_at for c in pending) - now
+                if delay <= PollPolicy.SPIN_THRESHOLD:
+                    time.sleep(0)
+                else:
+                    # A new registration cuts the sleep short
+                    self._wakeup.wait(delay)
+                    self._wakeup.clear()
+                continue
+
+            # A condition that can't be sampled fails on its own, with the
+            # exception for its waiter, and the thread goes on for the others
+            failed = {}
+            points = list({c.point for c in due if c.rect is None})
+            colors = {}
+            if points:
+                try:
+                    colors = self._sample(points)
+                except Exception as e:
+                    failed.update((c, e) for c in due if c.rect is None)
+            results = {}
+            for c in due:
+                if c.rect is not None:
+                    try:
+                        # Each region is counted straight from its own capture
+                        frame = capture.get_backend().grab(*c.rect)
+                        results[c] = c.check_frame(frame)
+                    except Exception as e:
+                        failed[c] = e
+            now = time.perf_counter()
+
+            matched = []
+            for c in due:
+                if c in failed:
+                    continue
+                try:
+                    if c.rect is None:
+                        value = colors[c.point]
+                        holds = c.check(value)
+                    else:
+                        holds, value = results[c]
+                    if c.confirm is not None:
+                        holds = c.confirmed(holds, value, now)
+                except Exception as e:
+                    failed[c] = e
+                    continue
+                if c.confirm is not None:
+                    since = c.streak_since
+                else:
+                    # The change happened at some point since the previous sample
+                    since = c.last_sample_at or c.registered_at
+                if holds:
+                    c.detection_latency = now - since
+                    c.matched = True
+                    c.matched_at = now
+                    matched.append(c)
+                c.last_value = value
+                c.last_sample_at = now
+                c.interval = c.policy.next_interval(now - c.registered_at, c.interval)
+                if c.streak:
+                    # Confirm a streak at the hot rate, whatever the back-off
+                    c.next_sample_at = now + min(
+                        c.interval, c.policy.hot_interval_ms / 1000
+                    )
+                else:
+                    c.next_sample_at = now + c.interval
+
+            for c, error in failed.items():
+                c.error = error
+            if matched or failed:
+                # Only conditions still pending are ended here, not ones a
+                # cancel or a stopping thread's last pass got to first
+                done = []
+                with self._lock:
+                    for c in matched:
+                        if c in self._pending:
+                            self._pending.remove(c)
+                            done.append(c)
+                            latency = c.detection_latency
+                            self.detections += 1
+                            self.latency_total += latency
+                            self.latency_max = max(self.latency_max, latency)
+                    for c in failed:
+                        if c in self._pending:
+                            self._pending.remove(c)
+                            done.append(c)
+                for c in done:
+                    c.event.set()
+                    for fn in c.callbacks:
+                        fn(c)
+
+    def latency_summary(self):
+        """Return (count, mean_ms, max_ms) of recorded detection latencies"""
+        with self._lock:
+            count, total, worst = (
+                self.detections,
+                self.latency_total,
+                self.latency_max,
+            )
+        if not count:
+            return (0, 0.0, 0.0)
+        return (count, total / count * 1000, worst * 1000)
+
+    def reset_stats(self):
+        with self._lock:
+            self.detections = 0
+            self.latency_total = 0.0
+            self.latency_max = 0.0
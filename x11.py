@@ -0,0 +1,513 @@
+"""X11 capture and input backends for Linux.
+
+Screen reads use the MIT-SHM extension: the server writes the requested
+rectangle straight into a shared memory segment that is mapped in this
+process, so frames never travel through the X socket.  Servers without
+MIT-SHM, or that can't attach this process's segments (a remote display,
+another IPC namespace), fall back to XGetImage.  Clicks and moves are injected with the
+XTest extension and flushed once per batch.
+
+Everything goes through ctypes, so no extra Python packages are needed,
+only libX11, libXext and libXtst.  Both backends share one display
+connection, chosen from $DISPLAY, which makes them usable against an Xvfb
+virtual display on CI machines.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import threading
+
+from capture import BYTES_PER_PIXEL, CaptureBackend, Frame
+from inputs import DOWN, LEFT, MIDDLE, MOVE, RIGHT, InputBackend
+
+ZPIXMAP = 2
+ALL_PLANES = 0xFFFFFFFF
+CURRENT_SCREEN = -1
+X_BUTTONS = {LEFT: 1, MIDDLE: 2, RIGHT: 3}
+# Bits of XQueryPointer's mask set while a button is held
+X_BUTTON_MASKS = {LEFT: 1 << 8, MIDDLE: 1 << 9, RIGHT: 1 << 10}
+
+# System V shared memory
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+class XImage(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+        ("obdata", ctypes.c_void_p),
+        ("funcs", ctypes.c_void_p * 6),
+    ]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("resourceid", ctypes.c_ulong),
+        ("serial", ctypes.c_ulong),
+        ("error_code", ctypes.c_ubyte),
+        ("request_code", ctypes.c_ubyte),
+        ("minor_code", ctypes.c_ubyte),
+    ]
+
+
+XErrorHandler = ctypes.CFUNCTYPE(
+    ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent)
+)
+
+
+def _load(name):
+    path = ctypes.util.find_library(name)
+    if path is None:
+        raise RuntimeError(f"lib{name} is not installed")
+    return ctypes.CDLL(path)
+
+
+def _declare(lib, name, restype, *argtypes):
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = list(argtypes)
+
+
+class XConnection:
+    """A display connection shared by the capture and input backends.
+
+    Xlib is not initialised for threads (Tk may already be using it), so
+    every call on the connection is made while holding ``lock``.
+    """
+
+    def __init__(self, display_name=None):
+        display_name = display_name or os.environ.get("DISPLAY")
+        if not display_name:
+            raise RuntimeError("DISPLAY is not set")
+
+        p = ctypes.c_void_p
+        self.xlib = xlib = _load("X11")
+        _declare(xlib, "XOpenDisplay", p, ctypes.c_char_p)
+        _declare(xlib, "XCloseDisplay", ctypes.c_int, p)
+        _declare(xlib, "XDefaultScreen", ctypes.c_int, p)
+        _declare(xlib, "XRootWindow", ctypes.c_ulong, p, ctypes.c_int)
+        _declare(xlib, "XDisplayWidth", ctypes.c_int, p, ctypes.c_int)
+        _declare(xlib, "XDisplayHeight", ctypes.c_int, p, ctypes.c_int)
+        _declare(xlib, "XDefaultVisual", p, p, ctypes.c_int)
+        _declare(xlib, "XDefaultDepth", ctypes.c_int, p, ctypes.c_int)
+        _declare(xlib, "XFlush", ctypes.c_int, p)
+        _declare(xlib, "XSync", ctypes.c_int, p, ctypes.c_int)
+        _declare(xlib, "XFree", ctypes.c_int, p)
+        _declare(xlib, "XSetErrorHandler", p, XErrorHandler)
+        _declare(
+            xlib,
+            "XGetImage",
+            ctypes.POINTER(XImage),
+            p,
+            ctypes.c_ulong,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_uint,
+            ctypes.c_uint,
+            ctypes.c_ulong,
+            ctypes.c_int,
+        )
+        _declare(xlib, "XDestroyImage", ctypes.c_int, ctypes.POINTER(XImage))
+        _declare(
+            xlib,
+            "XQueryPointer",
+            ctypes.c_int,
+            p,
+            ctypes.c_ulong,
+            ctypes.POINTER(ctypes.c_ulong),
+            ctypes.POINTER(ctypes.c_ulong),
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_uint),
+        )
+
+        self.display = xlib.XOpenDisplay(display_name.encode())
+        if not self.display:
+            raise RuntimeError(f"Cannot open X display {display_name}")
+        self.display_name = display_name
+        self.lock = threading.RLock()
+
+        # The default handler exits the process, so record errors instead.
+        # The handler is process wide; errors on Tk's display are passed on
+        self.last_error = None
+        self._error_handler = XErrorHandler(self._on_error)
+        previous = xlib.XSetErrorHandler(self._error_handler)
+        self._previous_handler = XErrorHandler(previous) if previous else None
+
+        self.screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XRootWindow(self.display, self.screen)
+        self.width = xlib.XDisplayWidth(self.display, self.screen)
+        self.height = xlib.XDisplayHeight(self.display, self.screen)
+
+    def _on_error(self, display, event):
+        if display != self.display and self._previous_handler:
+            return self._previous_handler(display, event)
+        e = event.contents
+        self.last_error = (e.error_code, e.request_code, e.minor_code)
+        return 0
+
+    def check_error(self, what):
+        if self.last_error is not None:
+            code, request, minor = self.last_error
+            self.last_error = None
+            raise OSError(f"{what} failed: X error {code} (request {request}.{minor})")
+
+    def pointer_state(self):
+        """Return (x, y, held buttons) of the pointer on the root window"""
+        window = ctypes.c_ulong()
+        child = ctypes.c_ulong()
+        x, y = ctypes.c_int(), ctypes.c_int()
+        win_x, win_y = ctypes.c_int(), ctypes.c_int()
+        mask = ctypes.c_uint()
+        with self.lock:
+            self.xlib.XQueryPointer(
+                self.display,
+                self.root,
+                ctypes.byref(window),
+                ctypes.byref(child),
+                ctypes.byref(x),
+                ctypes.byref(y),
+                ctypes.byref(win_x),
+                ctypes.byref(win_y),
+                ctypes.byref(mask),
+            )
+        held = tuple(b for b, bit in X_BUTTON_MASKS.items() if mask.value & bit)
+        return (x.value, y.value, held)
+
+    def close(self):
+        with self.lock:
+            if self.display:
+                self.xlib.XCloseDisplay(self.display)
+                self.display = None
+
+
+class XShmCapture(CaptureBackend):
+    """Grabs the root window into per-thread shared memory images"""
+
+    name = "xshm"
+
+    def __init__(self, connection):
+        super().__init__()
+        self.conn = connection
+        p = ctypes.c_void_p
+        try:
+            self.xext = xext = _load("Xext")
+            _declare(xext, "XShmQueryExtension", ctypes.c_int, p)
+            self.use_shm = bool(xext.XShmQueryExtension(connection.display))
+        except (RuntimeError, AttributeError):
+            self.use_shm = False
+        if self.use_shm:
+            shm_info = ctypes.POINTER(XShmSegmentInfo)
+            _declare(
+                xext,
+                "XShmCreateImage",
+                ctypes.POINTER(XImage),
+                p,
+                p,
+                ctypes.c_uint,
+                ctypes.c_int,
+                p,
+                shm_info,
+                ctypes.c_uint,
+                ctypes.c_uint,
+            )
+            _declare(xext, "XShmAttach", ctypes.c_int, p, shm_info)
+            _declare(xext, "XShmDetach", ctypes.c_int, p, shm_info)
+            _declare(
+                xext,
+                "XShmGetImage",
+                ctypes.c_int,
+                p,
+                ctypes.c_ulong,
+                ctypes.POINTER(XImage),
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_ulong,
+            )
+            self.libc = libc = ctypes.CDLL(None, use_errno=True)
+            _declare(
+                libc,
+                "shmget",
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_size_t,
+                ctypes.c_int,
+            )
+            _declare(libc, "shmat", p, ctypes.c_int, p, ctypes.c_int)
+            _declare(libc, "shmdt", ctypes.c_int, p)
+            _declare(libc, "shmctl", ctypes.c_int, ctypes.c_int, ctypes.c_int, p)
+        else:
+            self.name = "xgetimage"
+
+        # Images are per thread so a grab never overwrites another thread's frame
+        self._local = threading.local()
+        # Bumped by close(), so other threads release their images too
+        self._generation = 0
+
+    def _surface(self, width, height):
+        """Return this thread's shared image, grown to at least width x height.
+
+        Returns None, and switches the backend to XGetImage, when shared
+        memory turns out to be unusable.
+        """
+        s = getattr(self._local, "surface", None)
+        if s is not None and s["generation"] != self._generation:
+            self._release(s)
+            s = None
+        if s is not None and s["width"] >= width and s["height"] >= height:
+            return s
+
+        if s is not None:
+            width = max(width, s["width"])
+            height = max(height, s["height"])
+            self._release(s)
+
+        conn = self.conn
+        xlib, display = conn.xlib, conn.display
+        info = XShmSegmentInfo()
+        with conn.lock:
+            image = self.xext.XShmCreateImage(
+                display,
+                xlib.XDefaultVisual(display, conn.screen),
+                xlib.XDefaultDepth(display, conn.screen),
+                ZPIXMAP,
+                None,
+                ctypes.byref(info),
+                width,
+                height,
+            )
+        if not image:
+            raise OSError("XShmCreateImage failed")
+        if image.contents.bits_per_pixel != BYTES_PER_PIXEL * 8:
+            xlib.XDestroyImage(image)
+            raise OSError(f"Unsupported {image.contents.bits_per_pixel} bpp display")
+
+        size = image.contents.bytes_per_line * height
+        info.shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            xlib.XDestroyImage(image)
+            return self._without_shm()
+        info.shmaddr = self.libc.shmat(info.shmid, None, 0)
+        if info.shmaddr in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(info.shmid, IPC_RMID, None)
+            xlib.XDestroyImage(image)
+            return self._without_shm()
+        image.contents.data = info.shmaddr
+        info.readOnly = 0
+
+        with conn.lock:
+            attached = self.xext.XShmAttach(display, ctypes.byref(info))
+            xlib.XSync(display, 0)
+        # Marked for removal now, so the segment goes away with the process
+        self.libc.shmctl(info.shmid, IPC_RMID, None)
+        if not attached or conn.last_error is not None:
+            conn.last_error = None
+            self.libc.shmdt(info.shmaddr)
+            image.contents.data = None
+            xlib.XDestroyImage(image)
+            return self._without_shm()
+
+        s = {
+            "width": width,
+            "height": height,
+            "image": image,
+            "info": info,
+            "generation": self._generation,
+        }
+        self._local.surface = s
+        return s
+
+    def _without_shm(self):
+        """Grab with XGetImage from now on"""
+        self.use_shm = False
+        self.name = "xgetimage"
+        return None
+
+    def _release(self, s):
+        conn = self.conn
+        with conn.lock:
+            if conn.display:
+                self.xext.XShmDetach(conn.display, ctypes.byref(s["info"]))
+                conn.xlib.XSync(conn.display, 0)
+        self.libc.shmdt(s["info"].shmaddr)
+        # The data belongs to the segment, not to malloc
+        s["image"].contents.data = None
+        conn.xlib.XDestroyImage(s["image"])
+        self._local.surface = None
+
+    def _check_bounds(self, left, top, width, height):
+        conn = self.conn
+        if not (
+            0 <= left
+            and 0 <= top
+            and left + width <= conn.width
+            and top + height <= conn.height
+        ):
+            raise ValueError(
+                f"Region ({left}, {top}, {width}, {height}) is outside the "
+                f"{conn.width}x{conn.height} screen"
+            )
+
+    def grab(self, left, top, width, height):
+        self._check_bounds(left, top, width, height)
+        s = self._surface(width, height) if self.use_shm else None
+        if s is None:
+            return self._grab_copy(left, top, width, height)
+
+        conn = self.conn
+        image = s["image"].contents
+        # Ask for just the requested rectangle; the server packs its rows
+        # at the image's bytes_per_line
+        image.width = width
+        image.height = height
+        image.bytes_per_line = width * BYTES_PER_PIXEL
+        with conn.lock:
+            ok = self.xext.XShmGetImage(
+                conn.display, conn.root, s["image"], left, top, ALL_PLANES
+            )
+            conn.check_error("XShmGetImage")
+        if not ok:
+            raise OSError("XShmGetImage failed")
+        self.count_grab()
+
+        stride = width * BYTES_PER_PIXEL
+        data = (ctypes.c_ubyte * (stride * height)).from_address(s["info"].shmaddr)
+        return Frame(left, top, width, height, data, stride)
+
+    def _grab_copy(self, left, top, width, height):
+        """XGetImage fallback for servers without MIT-SHM"""
+        conn = self.conn
+        with conn.lock:
+            image = conn.xlib.XGetImage(
+                conn.display, conn.root, left, top, width, height, ALL_PLANES, ZPIXMAP
+            )
+            conn.check_error("XGetImage")
+        if not image:
+            raise OSError("XGetImage failed")
+        try:
+            stride = image.contents.bytes_per_line
+            size = stride * height
+            buf = getattr(self._local, "buffer", None)
+            if buf is None or len(buf) < size:
+                buf = self._local.buffer = bytearray(size)
+            ctypes.memmove(
+                (ctypes.c_char * size).from_buffer(buf), image.contents.data, size
+            )
+        finally:
+            conn.xlib.XDestroyImage(image)
+        self.count_grab()
+        return Frame(left, top, width, height, buf, stride)
+
+    def close(self):
+        """Release the calling thread's image.
+
+        Another thread may be reading its own image right now, so the other
+        threads release theirs on their next grab.
+        """
+        self._generation += 1
+        s = getattr(self._local, "surface", None)
+        if s is not None:
+            self._release(s)
+
+
+class XTestInput(InputBackend):
+    """Injects pointer events with XTest, flushing once per batch"""
+
+    name = "xtest"
+
+    def __init__(self, connection):
+        super().__init__()
+        self.conn = connection
+        p = ctypes.c_void_p
+        self.xtst = xtst = _load("Xtst")
+        _declare(
+            xtst,
+            "XTestFakeMotionEvent",
+            ctypes.c_int,
+            p,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_ulong,
+        )
+        _declare(
+            xtst,
+            "XTestFakeButtonEvent",
+            ctypes.c_int,
+            p,
+            ctypes.c_uint,
+            ctypes.c_int,
+            ctypes.c_ulong,
+        )
+
+    def send(self, events):
+        if not events:
+            return
+        conn = self.conn
+        xtst = self.xtst
+        with conn.lock:
+            display = conn.display
+            for kind, x, y, button in events:
+                if kind == MOVE:
+                    xtst.XTestFakeMotionEvent(display, CURRENT_SCREEN, x, y, 0)
+                else:
+                    try:
+                        number = X_BUTTONS[button]
+                    except KeyError:
+                        raise ValueError(f"Unknown mouse button '{button}'") from None
+                    xtst.XTestFakeButtonEvent(display, number, kind == DOWN, 0)
+            # Requests are buffered, so the whole batch goes out in one write
+            conn.xlib.XFlush(display)
+        self.send_count += 1
+        self.event_count += len(events)
+
+    def get_position(self):
+        x, y, _ = self.conn.pointer_state()
+        return (x, y)
+
+
+# --- Shared connection ---
+_connection = None
+_connection_lock = threading.Lock()
+
+
+def available():
+    return bool(os.environ.get("DISPLAY"))
+
+
+def get_connection():
+    global _connection
+    if _connection is None:
+        with _connection_lock:
+            if _connection is None:
+                _connection = XConnection()
+    return _connection